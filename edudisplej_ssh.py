@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""Shared asyncio SSH layer for the EduDisplej operator scripts.
+
+One authenticated paramiko transport is kept per host and every command runs
+on its own channel of that transport, so several commands against the same
+kiosk cost a single handshake. Blocking paramiko calls are pushed to a thread
+pool; callers stay on one event loop and can fan out to many hosts at once.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import select
+import socket
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import paramiko
+
+DEFAULT_MAX_PARALLEL = 64
+KEEPALIVE_SECONDS = 30
+READ_CHUNK = 32768
+
+T = TypeVar("T")
+LineCallback = Callable[[str, bool], None]
+
+
+@dataclass
+class CommandResult:
+    stdout: str
+    stderr: str
+    exit_code: int
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+def _split_lines(buffer: bytes, final: bool = False) -> tuple[list[str], bytes]:
+    parts = buffer.split(b"\n")
+    rest = b"" if final else parts.pop()
+    lines = [part.decode("utf-8", errors="ignore").rstrip("\r") for part in parts]
+    if final and lines and lines[-1] == "":
+        lines.pop()
+    return lines, rest
+
+
+def _run_channel(
+    transport: paramiko.Transport,
+    command: str,
+    timeout: float,
+    on_line: LineCallback | None,
+) -> CommandResult:
+    """Execute one command on a fresh channel; `timeout` is the allowed idle time without output."""
+    channel = transport.open_session(timeout=timeout)
+    try:
+        channel.exec_command(command)
+        out = bytearray()
+        err = bytearray()
+        pending = {False: b"", True: b""}
+        last_activity = time.monotonic()
+
+        def consume(data: bytes, is_stderr: bool) -> None:
+            (err if is_stderr else out).extend(data)
+            if on_line is None:
+                return
+            lines, pending[is_stderr] = _split_lines(pending[is_stderr] + data)
+            for line in lines:
+                on_line(line, is_stderr)
+
+        while True:
+            # Sampled before reading: output sent ahead of the EOF is buffered by then.
+            # The exit status alone is not enough, it can overtake the last output.
+            drained = channel.eof_received or channel.closed
+            progressed = False
+            if channel.recv_ready():
+                consume(channel.recv(READ_CHUNK), False)
+                progressed = True
+            if channel.recv_stderr_ready():
+                consume(channel.recv_stderr(READ_CHUNK), True)
+                progressed = True
+            if progressed:
+                last_activity = time.monotonic()
+                continue
+            if drained and channel.exit_status_ready():
+                break
+            if channel.closed or not transport.is_active():
+                raise EOFError("SSH channel closed before command finished")
+
+            remaining = timeout - (time.monotonic() - last_activity)
+            if remaining <= 0:
+                raise socket.timeout(f"No output for {timeout}s: {command[:60]}")
+            if drained:
+                # The channel stays readable after EOF; wait for the exit status instead
+                channel.status_event.wait(min(remaining, 1.0))
+            else:
+                select.select([channel], [], [], min(remaining, 1.0))
+
+        if on_line is not None:
+            for is_stderr, rest in pending.items():
+                if rest:
+                    for line in _split_lines(rest, final=True)[0]:
+                        on_line(line, is_stderr)
+
+        return CommandResult(
+            stdout=out.decode("utf-8", errors="ignore").rstrip("\n"),
+            stderr=err.decode("utf-8", errors="ignore").rstrip("\n"),
+            exit_code=channel.recv_exit_status(),
+        )
+    finally:
+        channel.close()
+
+
+class SshHost:
+    """A single kiosk reachable over SSH, multiplexing commands over one transport."""
+
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        timeout: float = 20,
+        executor: ThreadPoolExecutor | None = None,
+    ) -> None:
+        self.host = host
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.handshakes = 0
+        self._executor = executor
+        self._client: paramiko.SSHClient | None = None
+        self._lock = asyncio.Lock()
+
+    async def _call(self, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    @property
+    def connected(self) -> bool:
+        transport = self._client.get_transport() if self._client else None
+        return bool(transport and transport.is_active())
+
+    def _connect_blocking(self, timeout: float) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            hostname=self.host,
+            username=self.username,
+            password=self.password,
+            timeout=timeout,
+            allow_agent=False,
+            look_for_keys=False,
+            banner_timeout=timeout,
+            auth_timeout=timeout,
+        )
+        client.get_transport().set_keepalive(KEEPALIVE_SECONDS)
+        return client
+
+    async def connect(self, timeout: float | None = None) -> None:
+        """Open the transport unless a live one already exists."""
+        async with self._lock:
+            if self.connected:
+                return
+            self._close_client()
+            self._client = await self._call(self._connect_blocking, timeout or self.timeout)
+            self.handshakes += 1
+
+    async def run(self, command: str, timeout: float = 300, on_line: LineCallback | None = None) -> CommandResult:
+        """Run a command on a new channel of the shared transport.
+
+        `on_line(line, is_stderr)` is called from a worker thread for every complete output line.
+        """
+        await self.connect()
+        return await self._call(_run_channel, self._client.get_transport(), command, timeout, on_line)
+
+    async def put(self, local_path: str, remote_path: str) -> None:
+        await self.connect()
+
+        def upload() -> None:
+            sftp = paramiko.SFTPClient.from_transport(self._client.get_transport())
+            try:
+                sftp.put(local_path, remote_path)
+            finally:
+                sftp.close()
+
+        await self._call(upload)
+
+    async def wait_until_reachable(self, timeout_seconds: float = 300, pause: float = 5) -> bool:
+        """Reconnect after a reboot; returns False if the host stays unreachable."""
+        deadline = time.monotonic() + timeout_seconds
+        while time.monotonic() < deadline:
+            try:
+                await self.connect(timeout=12)
+                return True
+            except Exception:
+                await asyncio.sleep(pause)
+        return False
+
+    def _close_client(self) -> None:
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+    async def close(self) -> None:
+        async with self._lock:
+            self._close_client()
+
+    async def __aenter__(self) -> "SshHost":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+class SshFleet:
+    """Connection cache plus bounded fan-out over many hosts from one event loop."""
+
+    def __init__(self, username: str, password: str, max_parallel: int = DEFAULT_MAX_PARALLEL, timeout: float = 20) -> None:
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.max_parallel = max(1, max_parallel)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_parallel * 2, thread_name_prefix="ssh")
+        self._semaphore = asyncio.Semaphore(self.max_parallel)
+        self._hosts: dict[str, SshHost] = {}
+
+    def host(self, address: str) -> SshHost:
+        if address not in self._hosts:
+            self._hosts[address] = SshHost(address, self.username, self.password, self.timeout, self._executor)
+        return self._hosts[address]
+
+    async def map(self, hosts: list[str], job: Callable[[SshHost], Awaitable[T]]) -> dict[str, T | BaseException]:
+        """Run `job` for every host, at most `max_parallel` at a time; exceptions are returned per host."""
+
+        async def guarded(address: str) -> T:
+            async with self._semaphore:
+                return await job(self.host(address))
+
+        results = await asyncio.gather(*(guarded(address) for address in hosts), return_exceptions=True)
+        return dict(zip(hosts, results))
+
+    async def run_all(self, hosts: list[str], command: str, timeout: float = 300) -> dict[str, CommandResult | BaseException]:
+        return await self.map(hosts, lambda ssh: ssh.run(command, timeout=timeout))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(host.close() for host in self._hosts.values()))
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> "SshFleet":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
@@ -6,7 +6,10 @@ Monitors the EduDisplej display process and restarts if necessary
 Install:
     sudo cp edudisplej_watchdog.py /usr/local/bin/
     sudo chmod +x /usr/local/bin/edudisplej_watchdog.py
+    sudo cp webserver/control_edudisplej_sk/scripts/edudisplej_logging.py /usr/local/bin/
+    sudo cp webserver/control_edudisplej_sk/scripts/edudisplej_writes.py /usr/local/bin/
     sudo cp edudisplej-watchdog.service /etc/systemd/system/
+    sudo cp edudisplej-watchdog.conf /etc/edudisplej/watchdog.conf  # optional overrides
     sudo systemctl enable edudisplej-watchdog
     sudo systemctl start edudisplej-watchdog
 
@@ -14,47 +17,566 @@ Status:
     sudo systemctl status edudisplej-watchdog
 """
 
+import sys
 import time
+import signal
 import subprocess
 import logging
+import json
 import os
+import select
+from collections import deque
+from configparser import ConfigParser
 from datetime import datetime
 
 # Configuration
 CHECK_INTERVAL = 60  # Check every 60 seconds
+MISSING_RECHECK_INTERVAL = 10  # Re-check quickly while the process is missing
+EXIT_GRACE_PERIOD = 5  # Give systemd/kiosk a moment to respawn the process itself
 PROCESS_NAME = "chromium"  # Adjust to your display process
 RESTART_COMMAND = ["sudo", "systemctl", "restart", "edudisplej-display"]  # Adjust
+STOP_COMMAND = ["sudo", "systemctl", "stop", "edudisplej-display"]
 LOG_FILE = "/var/log/edudisplej/watchdog.log"
 MAX_RESTARTS = 5  # Max restarts within MAX_RESTART_WINDOW
 MAX_RESTART_WINDOW = 300  # 5 minutes
+RESTART_RETRY_DELAY = 300  # Wait 5 minutes after a failed restart
+METRICS_FILE = "/var/log/edudisplej/watchdog_metrics.json"
+METRICS_HISTORY = 1440  # Samples kept in memory (24h at CHECK_INTERVAL)
+METRICS_FLUSH_INTERVAL = 900  # Write the ring buffer every 15 minutes (live copy in /run/edudisplej)
+METRICS_PERSIST_INTERVAL = 6 * 3600  # Copy it to the SD card every 6 hours and on shutdown
+DISK_USAGE_WARN_PERCENT = 90
+SOC_TEMP_WARN_C = 80
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+CONFIG_PATH = "/etc/edudisplej/watchdog.conf"
+SCHEDULER_STATUS_FILE = "/run/edudisplej/display_status"
 
-# Setup logging
-os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+try:
+    from edudisplej_logging import setup_logging
+except ImportError:  # shared module not installed next to the watchdog
+    setup_logging = None
 
-class ProcessWatchdog:
-    def __init__(self):
-        self.restart_times = []
-    
-    def is_process_running(self):
-        """Check if the monitored process is running"""
+try:
+    from edudisplej_writes import CoalescingWriter, STATS as WRITE_STATS, runtime_path
+except ImportError:  # without it the ring buffer goes straight to METRICS_FILE
+    CoalescingWriter = None
+
+
+def configure_logging(config_path=CONFIG_PATH):
+    """Queue-based rotating logging from the [logging] section of watchdog.conf"""
+    if setup_logging is not None:
+        config = ConfigParser()
+        config.read(config_path)
+        setup_logging(config, default_path=LOG_FILE, text_format='%(asctime)s [%(levelname)s] %(message)s')
+        return
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()
+        ]
+    )
+
+class ProcessSupervisor:
+    """Tracks the display process by PID and reports its exit without polling.
+
+    The main process is located by scanning /proc (no fork/exec); its exit is
+    observed through a pidfd, so a crash is noticed as soon as it happens.
+    Kernels without pidfd support fall back to a cheap /proc/<pid> check, and
+    systems without a readable /proc fall back to pgrep.
+    """
+
+    def __init__(self, pattern=PROCESS_NAME):
+        self.pattern = pattern.encode()
+        self.pid = None
+        self._pidfd = None
+        self.use_pidfd = self._pidfd_supported()
+        self.use_proc = os.path.isdir("/proc/self")
+        self.backend = "pidfd" if self.use_pidfd and self.use_proc else ("proc" if self.use_proc else "pgrep")
+
+    @staticmethod
+    def _pidfd_supported():
+        if not hasattr(os, "pidfd_open"):
+            return False
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            return True
+        except OSError:
+            return False
+
+    def _matching_pids(self):
+        """Return {pid: ppid} for processes whose command line contains the pattern"""
+        own_pid = os.getpid()
+        matches = {}
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit() or int(entry.name) == own_pid:
+                continue
+            try:
+                with open(f"/proc/{entry.name}/cmdline", "rb") as f:
+                    cmdline = f.read().replace(b"\0", b" ")
+                if self.pattern not in cmdline:
+                    continue
+                with open(f"/proc/{entry.name}/stat", "rb") as f:
+                    stat = f.read()
+                # Fields after the parenthesised comm: state ppid ...
+                ppid = int(stat[stat.rindex(b")") + 2:].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            matches[int(entry.name)] = ppid
+        return matches
+
+    def _pgrep_pid(self):
         try:
             result = subprocess.run(
-                ["pgrep", "-f", PROCESS_NAME],
+                ["pgrep", "-o", "-f", self.pattern.decode()],
                 capture_output=True,
                 text=True
             )
-            return result.returncode == 0
         except Exception as e:
             logging.error(f"Error checking process: {e}")
+            return None
+        if result.returncode != 0:
+            return None
+        try:
+            return int(result.stdout.split()[0])
+        except (IndexError, ValueError):
+            return None
+
+    def find_pid(self):
+        """Locate the main display process (the match whose parent is not a match)"""
+        if not self.use_proc:
+            return self._pgrep_pid()
+        try:
+            matches = self._matching_pids()
+        except OSError as e:
+            logging.error(f"Error scanning /proc: {e}")
+            return self._pgrep_pid()
+        roots = [pid for pid, ppid in matches.items() if ppid not in matches]
+        return min(roots or matches, default=None)
+
+    def _release(self):
+        if self._pidfd is not None:
+            try:
+                os.close(self._pidfd)
+            except OSError:
+                pass
+        self._pidfd = None
+        self.pid = None
+
+    def attach(self):
+        """Start tracking the current display process; returns False if none is running"""
+        pid = self.find_pid()
+        if pid is None:
+            self._release()
+            return False
+        if pid == self.pid:
+            return True
+
+        self._release()
+        self.pid = pid
+        if self.use_pidfd and self.use_proc:
+            try:
+                self._pidfd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                self.pid = None
+                return False
+            except OSError as e:
+                logging.warning(f"pidfd_open failed, falling back to /proc checks: {e}")
+                self.use_pidfd = False
+                self.backend = "proc"
+        logging.info(f"Tracking {self.pattern.decode()} pid {pid} ({self.backend})")
+        return True
+
+    def fileno(self):
+        """pidfd of the tracked process (readable once it exits), or None"""
+        return self._pidfd
+
+    def is_alive(self):
+        if self.pid is None:
             return False
+        if self._pidfd is not None:
+            return not select.select([self._pidfd], [], [], 0)[0]
+        if self.use_proc:
+            try:
+                with open(f"/proc/{self.pid}/stat", "rb") as f:
+                    stat = f.read()
+            except OSError:
+                return False
+            return stat[stat.rindex(b")") + 2:][:1] != b"Z"
+        return self.find_pid() is not None
+
+    def wait_for_exit(self, timeout):
+        """Block up to `timeout` seconds; returns True if the tracked process exited"""
+        if self.pid is None:
+            return True
+        if self._pidfd is not None:
+            poller = select.poll()
+            poller.register(self._pidfd, select.POLLIN)
+            exited = bool(poller.poll(timeout * 1000))
+        else:
+            deadline = time.monotonic() + timeout
+            exited = not self.is_alive()
+            while not exited and time.monotonic() < deadline:
+                time.sleep(min(MISSING_RECHECK_INTERVAL, max(deadline - time.monotonic(), 0)))
+                exited = not self.is_alive()
+        if exited:
+            self._release()
+        return exited
+
+
+def read_meminfo():
+    """Return /proc/meminfo values in kB"""
+    values = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            parts = rest.split()
+            if parts:
+                values[key] = int(parts[0])
+    return values
+
+
+def read_process_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def read_process_memory_kb(pid):
+    """Return (pss_kb, is_renderer) for a process; PSS falls back to RSS without smaps_rollup"""
+    pss = None
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+    if pss is None:
+        pss = read_process_rss_kb(pid)
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            is_renderer = b"--type=renderer" in f.read()
+    except OSError:
+        is_renderer = False
+    return pss, is_renderer
+
+
+def descendant_pids(pid):
+    """Return pid and all of its descendants using /proc/<pid>/task/*/children"""
+    result = []
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        result.append(current)
+        try:
+            for task in os.scandir(f"/proc/{current}/task"):
+                with open(f"{task.path}/children") as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return result
+
+
+class MetricsSampler:
+    """Samples system health from /proc, statvfs and sysfs into a ring buffer.
+
+    Each sample is a flat dict so the history can be dumped as JSON as-is.
+    Sampling follows a monotonic schedule, so clock changes or slow iterations
+    never skip a sample the way wall-clock modulo checks can.
+    """
+
+    def __init__(self, interval=CHECK_INTERVAL, history=METRICS_HISTORY):
+        self.interval = interval
+        self.samples = deque(maxlen=history)
+        self.next_due = time.monotonic()
+        self.next_flush = time.monotonic() + METRICS_FLUSH_INTERVAL
+        self._prev_cpu = None
+        self._alerts = set()
+        self.writer = None
+        if CoalescingWriter is not None:
+            self.writer = CoalescingWriter(METRICS_FLUSH_INTERVAL, METRICS_PERSIST_INTERVAL)
+            self.live_file = runtime_path(os.path.basename(METRICS_FILE), os.path.dirname(METRICS_FILE))
+
+    def seconds_until_due(self):
+        return max(0.0, self.next_due - time.monotonic())
+
+    def is_due(self):
+        return time.monotonic() >= self.next_due
+
+    def _cpu_percent(self):
+        with open("/proc/stat") as f:
+            fields = [int(v) for v in f.readline().split()[1:]]
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+        total = sum(fields)
+        prev, self._prev_cpu = self._prev_cpu, (idle, total)
+        if prev is None or total == prev[1]:
+            return None
+        return round(100.0 * (1 - (idle - prev[0]) / (total - prev[1])), 1)
+
+    def sample(self, pid=None, restart_count=0):
+        now = time.monotonic()
+        self.next_due += self.interval
+        if self.next_due <= now:
+            self.next_due = now + self.interval
+
+        sample = {"ts": round(time.time(), 1), "restarts": restart_count}
+
+        try:
+            st = os.statvfs("/")
+            total = st.f_blocks * st.f_frsize
+            free = st.f_bavail * st.f_frsize
+            sample["disk_used_pct"] = round(100.0 * (total - free) / total, 1) if total else None
+            sample["disk_free_mb"] = free // (1024 * 1024)
+        except OSError:
+            pass
+
+        try:
+            mem = read_meminfo()
+            sample["mem_available_mb"] = mem.get("MemAvailable", 0) // 1024
+            sample["mem_total_mb"] = mem.get("MemTotal", 0) // 1024
+            sample["swap_used_mb"] = (mem.get("SwapTotal", 0) - mem.get("SwapFree", 0)) // 1024
+        except OSError:
+            pass
+
+        try:
+            with open("/proc/loadavg") as f:
+                sample["load1"] = float(f.read().split()[0])
+            sample["cpu_pct"] = self._cpu_percent()
+        except (OSError, ValueError, IndexError):
+            pass
+
+        try:
+            with open(THERMAL_ZONE) as f:
+                sample["soc_temp_c"] = round(int(f.read().strip()) / 1000.0, 1)
+        except (OSError, ValueError):
+            pass
+
+        if pid is not None:
+            pids = descendant_pids(pid)
+            sample["chromium_pids"] = len(pids)
+            sample["chromium_rss_mb"] = sum(read_process_rss_kb(p) for p in pids) // 1024
+            memory = [read_process_memory_kb(p) for p in pids]
+            sample["chromium_pss_mb"] = sum(pss for pss, _ in memory) // 1024
+            sample["chromium_renderers"] = sum(1 for _, renderer in memory if renderer)
+
+        if self.writer is not None:
+            persistent = WRITE_STATS.snapshot()["persistent"]
+            sample["persistent_writes"] = persistent["writes"]
+            sample["persistent_write_kb"] = persistent["bytes"] // 1024
+
+        self.samples.append(sample)
+        self.check_thresholds(sample)
+        if self.writer is not None:
+            persist_path = METRICS_FILE if self.live_file != METRICS_FILE else None
+            self.writer.put(self.live_file, lambda: list(self.samples), persist_path=persist_path)
+            try:
+                self.writer.maybe_flush()
+            except OSError as e:
+                logging.error(f"Error writing metrics file: {e}")
+        elif time.monotonic() >= self.next_flush:
+            self.flush()
+        return sample
+
+    def _alert(self, name, active, message):
+        """Log once when a threshold is crossed and once when it clears"""
+        if active and name not in self._alerts:
+            self._alerts.add(name)
+            logging.warning(message)
+        elif not active and name in self._alerts:
+            self._alerts.discard(name)
+            logging.info(f"Recovered: {name}")
+
+    def check_thresholds(self, sample):
+        disk = sample.get("disk_used_pct")
+        if disk is not None:
+            self._alert("disk_space", disk > DISK_USAGE_WARN_PERCENT, f"Disk space critically low: {disk}% used")
+        temp = sample.get("soc_temp_c")
+        if temp is not None:
+            self._alert("soc_temp", temp >= SOC_TEMP_WARN_C, f"SoC temperature high: {temp}°C")
+
+    def flush(self, path=METRICS_FILE):
+        """Atomically write the ring buffer to disk (including the SD card copy)"""
+        if self.writer is not None:
+            try:
+                self.writer.flush(persist=True)
+            except OSError as e:
+                logging.error(f"Error writing metrics file: {e}")
+            return
+        self.next_flush = time.monotonic() + METRICS_FLUSH_INTERVAL
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(list(self.samples), f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.error(f"Error writing metrics file: {e}")
+
+
+def read_scheduler_status(path=SCHEDULER_STATUS_FILE):
+    """State published by the display scheduler ({} if it is not running)"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def in_time_window(window, now=None):
+    """True if local time is inside an "HH:MM-HH:MM" window (may wrap past midnight)"""
+    try:
+        start_text, end_text = window.split("-", 1)
+        start = datetime.strptime(start_text.strip(), "%H:%M").time()
+        end = datetime.strptime(end_text.strip(), "%H:%M").time()
+    except ValueError:
+        return False
+    current = (now or datetime.now()).time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+class LeakPolicy:
+    """Detects steady chromium memory growth and schedules a preemptive restart.
+
+    A least-squares trend is fitted over the recent PSS samples. A leak is
+    confirmed only after `confirm_samples` consecutive evaluations exceed both
+    the slope and the size threshold, and is cleared again once the slope drops
+    below `clear_ratio` of the threshold (hysteresis). A confirmed leak restarts
+    the display only in an idle slot: while the scheduler reports TURNED_OFF or
+    inside `idle_window`. Critical memory pressure restarts right away. With
+    `dry_run` the decision is only logged.
+
+    Overrides are read from the [leak] section of /etc/edudisplej/watchdog.conf.
+    The scheduler state comes from its status file, or from scheduler_state()
+    when both run inside edudisplej_agent.py.
+    """
+
+    def __init__(self, config_path=CONFIG_PATH, scheduler_state=None):
+        config = ConfigParser()
+        config.read(config_path)
+        self.enabled = config.getboolean('leak', 'enabled', fallback=True)
+        self.dry_run = config.getboolean('leak', 'dry_run', fallback=False)
+        self.window_seconds = config.getint('leak', 'trend_window_minutes', fallback=360) * 60
+        self.min_samples = config.getint('leak', 'min_samples', fallback=30)
+        self.slope_mb_per_hour = config.getfloat('leak', 'slope_mb_per_hour', fallback=20.0)
+        self.clear_ratio = config.getfloat('leak', 'clear_ratio', fallback=0.5)
+        self.min_pss_mb = config.getint('leak', 'min_pss_mb', fallback=400)
+        self.critical_pss_mb = config.getint('leak', 'critical_pss_mb', fallback=900)
+        self.critical_mem_available_mb = config.getint('leak', 'critical_mem_available_mb', fallback=80)
+        self.critical_cooldown = config.getint('leak', 'critical_cooldown_minutes', fallback=30) * 60
+        self.max_renderers = config.getint('leak', 'max_renderers', fallback=12)
+        self.confirm_samples = config.getint('leak', 'confirm_samples', fallback=5)
+        self.idle_window = config.get('leak', 'idle_window', fallback='03:00-05:00')
+        self.min_recycle_interval = config.getint('leak', 'min_recycle_interval_hours', fallback=12) * 3600
+        self.status_file = config.get('leak', 'scheduler_status_file', fallback=SCHEDULER_STATUS_FILE)
+        self.scheduler_state = scheduler_state or (lambda: read_scheduler_status(self.status_file))
+
+        self.points = deque()
+        self.suspect_count = 0
+        self.leak_confirmed = False
+        self.last_recycle = float("-inf")
+
+    def reset(self):
+        """Forget the trend, e.g. after the display process restarted"""
+        self.points.clear()
+        self.suspect_count = 0
+        self.leak_confirmed = False
+
+    def slope(self):
+        """Least-squares PSS growth in MB per hour over the trend window"""
+        n = len(self.points)
+        if n < self.min_samples:
+            return None
+        mean_t = sum(t for t, _ in self.points) / n
+        mean_v = sum(v for _, v in self.points) / n
+        var_t = sum((t - mean_t) ** 2 for t, _ in self.points)
+        if var_t == 0:
+            return None
+        cov = sum((t - mean_t) * (v - mean_v) for t, v in self.points)
+        return cov / var_t * 3600
+
+    def display_is_idle(self):
+        if self.scheduler_state().get('status') == 'TURNED_OFF':
+            return True
+        return in_time_window(self.idle_window)
+
+    def evaluate(self, sample):
+        """Feed one metrics sample; returns a restart reason or None"""
+        pss = sample.get("chromium_pss_mb")
+        if not self.enabled or pss is None:
+            return None
+
+        now = time.monotonic()
+        self.points.append((now, pss))
+        while self.points and now - self.points[0][0] > self.window_seconds:
+            self.points.popleft()
+
+        mem_available = sample.get("mem_available_mb")
+        critical = pss >= self.critical_pss_mb or (
+            mem_available is not None and mem_available < self.critical_mem_available_mb
+        )
+        if critical and now - self.last_recycle >= self.critical_cooldown:
+            return f"critical memory pressure (pss={pss}MB, available={mem_available}MB)"
+
+        slope = self.slope()
+        renderers = sample.get("chromium_renderers", 0)
+        suspected = (
+            (slope is not None and slope >= self.slope_mb_per_hour and pss >= self.min_pss_mb)
+            or renderers > self.max_renderers
+        )
+        if suspected:
+            self.suspect_count += 1
+            if not self.leak_confirmed and self.suspect_count >= self.confirm_samples:
+                self.leak_confirmed = True
+                logging.warning(
+                    f"Memory leak trend confirmed: pss={pss}MB slope={slope or 0:.1f}MB/h renderers={renderers}"
+                )
+        else:
+            self.suspect_count = 0
+            if self.leak_confirmed and (slope is None or slope < self.slope_mb_per_hour * self.clear_ratio):
+                self.leak_confirmed = False
+                logging.info("Memory leak trend cleared")
+
+        if not self.leak_confirmed or now - self.last_recycle < self.min_recycle_interval:
+            return None
+        if not self.display_is_idle():
+            return None
+        return f"memory leak trend (pss={pss}MB, slope={slope or 0:.1f}MB/h, renderers={renderers})"
+
+    def record_recycle(self):
+        self.last_recycle = time.monotonic()
+        self.reset()
+
+
+class ProcessWatchdog:
+    def __init__(self, scheduler_state=None, config_path=CONFIG_PATH):
+        self.restart_times = []
+        self.restart_count = 0
+        self.held_off = False
+        self.supervisor = ProcessSupervisor()
+        self.metrics = MetricsSampler()
+        self.leak_policy = LeakPolicy(config_path, scheduler_state=scheduler_state)
+        self.scheduler_state = self.leak_policy.scheduler_state
+        # Inside edudisplej_agent.py the scheduler puts the display back into standby after a recycle
+        self.standby_restored = scheduler_state is not None
+    
+    def display_expected(self):
+        """False while the scheduler keeps the display off on purpose (TURNED_OFF, not pre-warmed)"""
+        state = self.scheduler_state()
+        return state.get('status') != 'TURNED_OFF' or state.get('standby') == 'prewarmed'
+    
+    def is_process_running(self):
+        """Check if the monitored process is running"""
+        return self.supervisor.attach()
     
     def restart_process(self):
         """Restart the monitored process"""
@@ -70,8 +592,10 @@ class ProcessWatchdog:
         
         # Record restart time
         self.restart_times.append(now)
+        self.restart_count += 1
         
-        logging.warning(f"Process {PROCESS_NAME} not running. Attempting restart ({len(self.restart_times)}/{MAX_RESTARTS})...")
+        logging.warning(f"Process {PROCESS_NAME} not running. Attempting restart ({len(self.restart_times)}/{MAX_RESTARTS})...",
+                        extra={'state': 'RESTART', 'restart_count': self.restart_count})
         
         try:
             result = subprocess.run(
@@ -94,58 +618,130 @@ class ProcessWatchdog:
             logging.error(f"Error restarting process: {e}")
             return False
     
-    def check_disk_space(self):
-        """Check if disk space is critically low"""
+    def recycle_process(self, reason):
+        """Preemptively restart the display process before a leak degrades it
+
+        During standby a standalone watchdog only stops it: nothing would put a
+        restarted display back into standby, and the scheduler starts it again
+        on the next ACTIVE edge.
+        """
+        command = RESTART_COMMAND
+        if not self.standby_restored and not self.display_expected():
+            command = STOP_COMMAND
+        if self.leak_policy.dry_run:
+            logging.warning(f"[dry-run] Would recycle {PROCESS_NAME} ({command[-2]}): {reason}")
+            self.leak_policy.record_recycle()
+            return True
+
+        logging.warning(f"Recycling {PROCESS_NAME} ({command[-2]}): {reason}",
+                        extra={'state': 'RECYCLE', 'restart_count': self.restart_count + 1})
+        self.leak_policy.record_recycle()
+        self.restart_count += 1
         try:
-            result = subprocess.run(
-                ["df", "-h", "/"],
-                capture_output=True,
-                text=True
-            )
-            lines = result.stdout.strip().split('\n')
-            if len(lines) > 1:
-                parts = lines[1].split()
-                if len(parts) >= 5:
-                    usage = parts[4].rstrip('%')
-                    if int(usage) > 90:
-                        logging.warning(f"Disk space critically low: {usage}% used")
+            result = subprocess.run(command, capture_output=True, text=True, timeout=30)
         except Exception as e:
-            logging.error(f"Error checking disk space: {e}")
+            logging.error(f"Error recycling process: {e}")
+            return False
+        if result.returncode != 0:
+            logging.error(f"Recycle failed: {result.stderr}")
+            return False
+        return True
+    
+    def first_decision(self):
+        """What the first supervision pass decides: 'running', 'missing' or 'held_off' (nothing is restarted)"""
+        if self.is_process_running():
+            return 'running'
+        return 'missing' if self.display_expected() else 'held_off'
+    
+    def restart_if_expected(self):
+        """Restart the missing process unless the scheduler stopped it; False if the restart failed"""
+        if not self.display_expected():
+            logging.info(f"{PROCESS_NAME} is off by schedule (TURNED_OFF), not restarting")
+            self.held_off = True
+            return True
+        return self.restart_process()
+    
+    def handle_missing(self, consecutive_failures):
+        """One check while the process is not running
+
+        Returns the new consecutive failure count and whether a restart
+        failed (the caller then waits RESTART_RETRY_DELAY).
+        """
+        if not self.display_expected():
+            if not self.held_off:
+                logging.info(f"{PROCESS_NAME} is off by schedule (TURNED_OFF), supervision paused")
+                self.held_off = True
+            return 0, False
+        self.held_off = False
+        consecutive_failures += 1
+        logging.warning(f"Process not running (consecutive failures: {consecutive_failures})")
+        
+        if consecutive_failures < 3:  # Wait for 3 consecutive failures
+            return consecutive_failures, False
+        if not self.restart_process():
+            logging.critical("Restart failed. Waiting before retry...")
+            return 0, True
+        return 0, False
+    
+    def sample_metrics(self):
+        """Take a health sample if one is due and apply the leak policy"""
+        if not self.metrics.is_due():
+            return
+        sample = self.metrics.sample(self.supervisor.pid, self.restart_count)
+        reason = self.leak_policy.evaluate(sample)
+        if reason:
+            self.recycle_process(reason)
     
     def run(self):
         """Main watchdog loop"""
         logging.info("EduDisplej Watchdog started")
         logging.info(f"Monitoring process: {PROCESS_NAME}")
-        logging.info(f"Check interval: {CHECK_INTERVAL}s")
+        logging.info(f"Check interval: {CHECK_INTERVAL}s (supervision backend: {self.supervisor.backend})")
         
         consecutive_failures = 0
         
         while True:
             try:
-                if self.is_process_running():
+                running = self.is_process_running()
+                self.sample_metrics()
+
+                if running:
                     consecutive_failures = 0
-                    # Periodic checks every hour
-                    if int(time.time()) % 3600 < CHECK_INTERVAL:
-                        self.check_disk_space()
-                else:
-                    consecutive_failures += 1
-                    logging.warning(f"Process not running (consecutive failures: {consecutive_failures})")
-                    
-                    if consecutive_failures >= 3:  # Wait for 3 consecutive failures
-                        if not self.restart_process():
+                    self.held_off = False
+
+                    # Sleep until the next metrics sample or until the process exits
+                    if self.supervisor.wait_for_exit(self.metrics.seconds_until_due()):
+                        logging.warning(f"Process {PROCESS_NAME} exited, re-checking in {EXIT_GRACE_PERIOD}s")
+                        self.leak_policy.reset()
+                        time.sleep(EXIT_GRACE_PERIOD)
+                        if not self.is_process_running() and not self.restart_if_expected():
                             logging.critical("Restart failed. Waiting before retry...")
-                            time.sleep(300)  # Wait 5 minutes before retry
-                        consecutive_failures = 0
-                
-                time.sleep(CHECK_INTERVAL)
+                            time.sleep(RESTART_RETRY_DELAY)
+                else:
+                    consecutive_failures, restart_failed = self.handle_missing(consecutive_failures)
+                    if restart_failed:
+                        time.sleep(RESTART_RETRY_DELAY)
+                    time.sleep(min(MISSING_RECHECK_INTERVAL, self.metrics.seconds_until_due()))
                 
-            except KeyboardInterrupt:
-                logging.info("Watchdog stopped by user")
+            except (KeyboardInterrupt, SystemExit):
+                logging.info("Watchdog stopped")
+                self.metrics.flush()
                 break
             except Exception as e:
                 logging.error(f"Watchdog error: {e}")
                 time.sleep(CHECK_INTERVAL)
 
 if __name__ == "__main__":
+    try:
+        import edudisplej_agent
+    except ImportError:  # agent not installed: classic single-purpose loop
+        edudisplej_agent = None
+    if edudisplej_agent is not None:
+        # Compatibility entry point: the agent running only supervision and health sampling
+        sys.exit(edudisplej_agent.main(["--roles", "watchdog"] + sys.argv[1:], watchdog_module=sys.modules[__name__]))
+
+    # systemctl stop sends SIGTERM: leave the loop so the metrics reach the SD card
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    configure_logging()
     watchdog = ProcessWatchdog()
     watchdog.run()
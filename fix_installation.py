@@ -1,85 +1,93 @@
 #!/usr/bin/env python3
 """EduDisplej remote installer runner and post-reboot verifier."""
 
+from dataclasses import dataclass, field
 from pathlib import Path
+import argparse
+import asyncio
 import socket
 import sys
+import threading
 import time
 
 import paramiko
 
+from edudisplej_ssh import SshFleet, SshHost
+
 ROOT_DIR = Path(__file__).resolve().parent
 LOCAL_KIOSK_START = ROOT_DIR / "webserver" / "install" / "init" / "kiosk-start.sh"
 LOCAL_KIOSK_SERVICE = ROOT_DIR / "webserver" / "install" / "init" / "edudisplej-kiosk.service"
 
+PHASES = ("connecting", "installing", "rebooting", "verifying")
 
-def new_ssh_client() -> paramiko.SSHClient:
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    return client
+_print_lock = threading.Lock()
 
 
-def connect_ssh(host: str, username: str, password: str, timeout: int = 20) -> paramiko.SSHClient:
-    client = new_ssh_client()
-    client.connect(
-        hostname=host,
-        username=username,
-        password=password,
-        timeout=timeout,
-        allow_agent=False,
-        look_for_keys=False,
-        banner_timeout=timeout,
-        auth_timeout=timeout,
-    )
-    return client
+@dataclass
+class HostRun:
+    """Per-host rollout state and phase timings."""
 
+    host: str
+    prefix_output: bool = False
+    state: str = "pending"
+    error: str = ""
+    phase_seconds: dict[str, float] = field(default_factory=dict)
+    _phase_started: float = 0.0
 
-def ssh_exec(ssh: paramiko.SSHClient, command: str, timeout: int = 300, stream: bool = False) -> tuple[str, str, int]:
-    stdin, stdout, stderr = ssh.exec_command(command, timeout=timeout)
-    output_lines: list[str] = []
-    error_lines: list[str] = []
+    def log(self, message: str) -> None:
+        line = f"[{self.host}] {message}" if self.prefix_output else message
+        with _print_lock:
+            print(line, flush=True)
 
-    if stream:
-        while True:
-            line = stdout.readline()
-            if not line:
-                break
-            clean = line.rstrip("\r\n")
-            output_lines.append(clean)
-            print(f"  {clean}")
-        for line in stderr:
-            clean = line.rstrip("\r\n")
-            if clean:
-                error_lines.append(clean)
-                print(f"  [ERR] {clean}")
-    else:
-        output_lines = stdout.read().decode("utf-8", errors="ignore").splitlines()
-        error_lines = stderr.read().decode("utf-8", errors="ignore").splitlines()
-
-    exit_code = stdout.channel.recv_exit_status()
-    return "\n".join(output_lines), "\n".join(error_lines), exit_code
-
-
-def wait_for_ssh(host: str, username: str, password: str, timeout_seconds: int = 300, pause: int = 5) -> paramiko.SSHClient | None:
-    deadline = time.time() + timeout_seconds
-    while time.time() < deadline:
-        try:
-            return connect_ssh(host, username, password, timeout=12)
-        except Exception:
-            time.sleep(pause)
-    return None
-
-
-def upload_patched_boot_files(ssh: paramiko.SSHClient) -> None:
+    def enter(self, phase: str) -> None:
+        self.finish_phase()
+        self.state = phase
+        self._phase_started = time.monotonic()
+
+    def finish_phase(self) -> None:
+        if self._phase_started and self.state in PHASES:
+            elapsed = time.monotonic() - self._phase_started
+            self.phase_seconds[self.state] = self.phase_seconds.get(self.state, 0.0) + elapsed
+        self._phase_started = 0.0
+
+    def done(self, ok: bool, error: str = "") -> bool:
+        self.finish_phase()
+        self.state = "done" if ok else "failed"
+        if error:
+            self.error = error
+        return ok
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.phase_seconds.values())
+
+
+async def ssh_exec(
+    ssh: SshHost,
+    command: str,
+    timeout: int = 300,
+    stream: bool = False,
+    run: HostRun | None = None,
+) -> tuple[str, str, int]:
+    emit = run.log if run is not None else print
+
+    def on_line(line: str, is_stderr: bool) -> None:
+        if is_stderr:
+            if line:
+                emit(f"  [ERR] {line}")
+        else:
+            emit(f"  {line}")
+
+    result = await ssh.run(command, timeout=timeout, on_line=on_line if stream else None)
+    return result.stdout, result.stderr, result.exit_code
+
+
+async def upload_patched_boot_files(ssh: SshHost) -> None:
     if not LOCAL_KIOSK_START.exists() or not LOCAL_KIOSK_SERVICE.exists():
         raise FileNotFoundError("Local patched kiosk files are missing.")
 
-    sftp = ssh.open_sftp()
-    try:
-        sftp.put(str(LOCAL_KIOSK_START), "/tmp/kiosk-start.sh")
-        sftp.put(str(LOCAL_KIOSK_SERVICE), "/tmp/edudisplej-kiosk.service")
-    finally:
-        sftp.close()
+    await ssh.put(str(LOCAL_KIOSK_START), "/tmp/kiosk-start.sh")
+    await ssh.put(str(LOCAL_KIOSK_SERVICE), "/tmp/edudisplej-kiosk.service")
 
     cmd = " ; ".join(
         [
@@ -89,12 +97,12 @@ def upload_patched_boot_files(ssh: paramiko.SSHClient) -> None:
             "sudo systemctl enable edudisplej-kiosk.service",
         ]
     )
-    out, err, code = ssh_exec(ssh, cmd, timeout=120)
+    out, err, code = await ssh_exec(ssh, cmd, timeout=120)
     if code != 0:
         raise RuntimeError(f"Failed to deploy patched boot files: {err or out}")
 
 
-def collect_boot_diagnostics(ssh: paramiko.SSHClient) -> str:
+async def collect_boot_diagnostics(ssh: SshHost) -> str:
     cmd = " ; ".join(
         [
             "echo '--- systemctl status ---'",
@@ -107,18 +115,18 @@ def collect_boot_diagnostics(ssh: paramiko.SSHClient) -> str:
             "tail -n 80 /tmp/openbox-autostart.log 2>/dev/null || true",
         ]
     )
-    out, err, _ = ssh_exec(ssh, cmd, timeout=180)
+    out, err, _ = await ssh_exec(ssh, cmd, timeout=180)
     if err:
         out = f"{out}\n[stderr]\n{err}"
     return out
 
 
-def run_remote_install(ssh: paramiko.SSHClient, token: str) -> tuple[str, str, int]:
+async def run_remote_install(ssh: SshHost, token: str, run: HostRun | None = None) -> tuple[str, str, int]:
     cmd = f"curl -fsSL https://install.edudisplej.sk/install.sh | sudo bash -s -- --token={token}"
-    return ssh_exec(ssh, cmd, timeout=900, stream=True)
+    return await ssh_exec(ssh, cmd, timeout=900, stream=True, run=run)
 
 
-def prepare_clean_state(ssh: paramiko.SSHClient) -> None:
+async def prepare_clean_state(ssh: SshHost) -> None:
     cmd = " ; ".join(
         [
             "sudo systemctl stop edudisplej-kiosk.service 2>/dev/null || true",
@@ -128,62 +136,135 @@ def prepare_clean_state(ssh: paramiko.SSHClient) -> None:
             "sudo rm -rf /opt/edudisplej /tmp/edudisplej-install.lock 2>/dev/null || true",
         ]
     )
-    ssh_exec(ssh, cmd, timeout=120)
+    await ssh_exec(ssh, cmd, timeout=120)
 
 
-def process_device(host: str, username: str, password: str, token: str) -> bool:
-    print(f"\n{'=' * 80}")
-    print(f"Device: {host}")
-    print(f"{'=' * 80}")
+async def process_device(ssh: SshHost, token: str, run: HostRun | None = None) -> bool:
+    host = ssh.host
+    run = run or HostRun(host)
+    if not run.prefix_output:
+        print(f"\n{'=' * 80}")
+        print(f"Device: {host}")
+        print(f"{'=' * 80}")
 
+    run.enter("connecting")
     try:
-        print("[*] Connecting...")
-        ssh = connect_ssh(host, username, password)
-        print("[✓] Connected")
+        run.log("[*] Connecting...")
+        await ssh.connect()
+        run.log("[✓] Connected")
     except Exception as exc:
-        print(f"[!] Cannot connect to {host}: {exc}")
-        return False
+        run.log(f"[!] Cannot connect to {host}: {exc}")
+        return run.done(False, f"connect: {exc}")
 
+    run.enter("installing")
     try:
-        print("[*] Cleaning previous state...")
-        prepare_clean_state(ssh)
+        run.log("[*] Cleaning previous state...")
+        await prepare_clean_state(ssh)
 
-        print("[*] Starting installer and streaming logs...")
-        out, err, code = run_remote_install(ssh, token)
+        run.log("[*] Starting installer and streaming logs...")
+        out, err, code = await run_remote_install(ssh, token, run=run)
         if err:
-            print("[!] Installer stderr captured:")
-            print(err)
-        print(f"[*] Installer command exit code: {code}")
+            run.log("[!] Installer stderr captured:")
+            run.log(err)
+        run.log(f"[*] Installer command exit code: {code}")
 
     except (socket.timeout, EOFError, paramiko.SSHException):
-        print("[*] SSH connection dropped (expected during reboot).")
+        run.log("[*] SSH connection dropped (expected during reboot).")
     finally:
-        ssh.close()
+        await ssh.close()
 
-    print("[*] Waiting for device to come back after reboot...")
-    ssh_after = wait_for_ssh(host, username, password, timeout_seconds=360, pause=8)
-    if ssh_after is None:
-        print("[!] Device did not return over SSH within timeout.")
-        return False
+    run.enter("rebooting")
+    run.log("[*] Waiting for device to come back after reboot...")
+    if not await ssh.wait_until_reachable(timeout_seconds=360, pause=8):
+        run.log("[!] Device did not return over SSH within timeout.")
+        return run.done(False, "did not return after reboot")
 
+    run.enter("verifying")
     try:
-        print("[✓] Device is reachable again")
-        print("[*] Deploying patched boot files...")
-        upload_patched_boot_files(ssh_after)
-
-        print("[*] Restarting kiosk service...")
-        ssh_exec(ssh_after, "sudo systemctl restart edudisplej-kiosk.service", timeout=60)
-        time.sleep(8)
-
-        print("[*] Collecting diagnostics...")
-        diag = collect_boot_diagnostics(ssh_after)
-        print(diag)
-        return True
+        run.log("[✓] Device is reachable again")
+        run.log("[*] Deploying patched boot files...")
+        await upload_patched_boot_files(ssh)
+
+        run.log("[*] Restarting kiosk service...")
+        await ssh_exec(ssh, "sudo systemctl restart edudisplej-kiosk.service", timeout=60)
+        await asyncio.sleep(8)
+
+        run.log("[*] Collecting diagnostics...")
+        diag = await collect_boot_diagnostics(ssh)
+        run.log(diag)
+        return run.done(True)
     except Exception as exc:
-        print(f"[!] Post-reboot validation failed: {exc}")
-        return False
+        run.log(f"[!] Post-reboot validation failed: {exc}")
+        return run.done(False, f"verify: {exc}")
     finally:
-        ssh_after.close()
+        await ssh.close()
+
+
+def plan_waves(devices: list[str], canary: int, wave_size: int) -> list[list[str]]:
+    """Split devices into a canary wave followed by fixed-size waves (0 = all remaining at once)."""
+    waves: list[list[str]] = []
+    remaining = list(devices)
+    if canary > 0:
+        waves.append(remaining[:canary])
+        remaining = remaining[canary:]
+    if wave_size <= 0:
+        wave_size = len(remaining)
+    for start in range(0, len(remaining), max(wave_size, 1)):
+        waves.append(remaining[start:start + wave_size])
+    return [wave for wave in waves if wave]
+
+
+async def rollout(
+    devices: list[str],
+    username: str,
+    password: str,
+    token: str,
+    concurrency: int = 1,
+    canary: int = 0,
+    wave_size: int = 0,
+) -> list[HostRun]:
+    """Process devices wave by wave with at most `concurrency` hosts in flight.
+
+    A failing canary wave stops the rollout; the remaining hosts are reported as skipped.
+    """
+    concurrency = max(1, concurrency)
+    runs = {host: HostRun(host, prefix_output=concurrency > 1) for host in devices}
+    waves = plan_waves(devices, canary, wave_size)
+
+    async with SshFleet(username, password, max_parallel=concurrency) as fleet:
+        for index, wave in enumerate(waves):
+            if len(waves) > 1:
+                with _print_lock:
+                    print(f"\n>>> Wave {index + 1}/{len(waves)}: {', '.join(wave)}", flush=True)
+            results = await fleet.map(wave, lambda ssh: process_device(ssh, token, runs[ssh.host]))
+
+            for host, result in results.items():
+                if isinstance(result, BaseException):
+                    runs[host].done(False, f"{type(result).__name__}: {result}")
+
+            if canary > 0 and index == 0 and any(result is not True for result in results.values()):
+                with _print_lock:
+                    print("[!] Canary wave failed - aborting rollout", flush=True)
+                for later in waves[index + 1:]:
+                    for host in later:
+                        runs[host].state = "skipped"
+                break
+
+    return [runs[host] for host in devices]
+
+
+def print_summary(runs: list[HostRun], wall_seconds: float) -> None:
+    header = f"{'HOST':<18} {'STATE':<8}" + "".join(f" {phase:>11}" for phase in PHASES) + f" {'TOTAL':>9}  ERROR"
+    print("\n" + header)
+    print("-" * len(header))
+    for run in runs:
+        timings = "".join(
+            f" {run.phase_seconds[phase]:>10.1f}s" if phase in run.phase_seconds else f" {'-':>11}"
+            for phase in PHASES
+        )
+        print(f"{run.host:<18} {run.state:<8}{timings} {run.total_seconds:>8.1f}s  {run.error}")
+    slowest = max((run.total_seconds for run in runs), default=0.0)
+    print(f"\nWall clock: {wall_seconds:.1f}s (slowest host: {slowest:.1f}s)")
 
 
 def parse_devices(args: list[str]) -> list[str]:
@@ -197,24 +278,38 @@ def parse_devices(args: list[str]) -> list[str]:
 
 
 def main() -> int:
-    if len(sys.argv) < 3:
-        print("Usage: python fix_installation.py <ip[,ip2,...]> <api_token> [username] [password]")
-        return 1
-
-    devices = parse_devices([sys.argv[1]])
-    token = sys.argv[2]
-    username = sys.argv[3] if len(sys.argv) > 3 else "edudisplej"
-    password = sys.argv[4] if len(sys.argv) > 4 else "edudisplej"
-
+    parser = argparse.ArgumentParser(
+        description="Reinstall EduDisplej on one or more kiosks and verify them after reboot",
+        usage="python fix_installation.py <ip[,ip2,...]> <api_token> [username] [password] [options]",
+    )
+    parser.add_argument("devices", help="Comma separated list of device IPs")
+    parser.add_argument("token", help="API token passed to install.sh")
+    parser.add_argument("username", nargs="?", default="edudisplej")
+    parser.add_argument("password", nargs="?", default="edudisplej")
+    parser.add_argument("--concurrency", type=int, default=1, help="Hosts processed in parallel (default: 1)")
+    parser.add_argument("--canary", type=int, default=0, help="Hosts rolled out first; a failure aborts the rest")
+    parser.add_argument("--wave-size", type=int, default=0, help="Hosts per wave after the canary (0 = all at once)")
+    args = parser.parse_args()
+
+    devices = parse_devices([args.devices])
     if not devices:
         print("[!] No valid device IPs provided")
         return 1
 
     print(f"Starting run for devices: {', '.join(devices)}")
-    ok = True
-    for host in devices:
-        ok = process_device(host, username, password, token) and ok
-
+    started = time.monotonic()
+    runs = asyncio.run(rollout(
+        devices,
+        args.username,
+        args.password,
+        args.token,
+        concurrency=args.concurrency,
+        canary=args.canary,
+        wave_size=args.wave_size,
+    ))
+    ok = all(run.state == "done" for run in runs)
+
+    print_summary(runs, time.monotonic() - started)
     print("\n" + "=" * 80)
     print("DONE" if ok else "DONE WITH ERRORS")
     print("=" * 80)
@@ -3,40 +3,30 @@
 Remote EduDisplej Installation Fix
 Connects via SSH with password auth and fixes installation
 """
+import asyncio
 import paramiko
 import sys
-import time
 
-def ssh_run(ssh_client, command, timeout=300):
+from edudisplej_ssh import SshHost
+
+async def ssh_run(ssh, command, timeout=300):
     """Run command via SSH and return output"""
     try:
-        stdin, stdout, stderr = ssh_client.exec_command(command, timeout=timeout)
-        output = stdout.read().decode('utf-8', errors='ignore')
-        error = stderr.read().decode('utf-8', errors='ignore')
-        return output, error
+        result = await ssh.run(command, timeout=timeout)
+        return result.stdout, result.stderr
     except Exception as e:
         return "", str(e)
 
-def fix_device(host, username, password, api_token):
+async def fix_device(host, username, password, api_token):
     """Fix EduDisplej installation on remote device"""
     print(f"\n{'='*60}")
     print(f"Connecting to {host}...")
     print('='*60)
     
+    ssh = SshHost(host, username, password, timeout=15)
     try:
-        # Create SSH client
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
         # Connect
-        ssh.connect(
-            hostname=host,
-            username=username,
-            password=password,
-            timeout=15,
-            allow_agent=False,
-            look_for_keys=False
-        )
+        await ssh.connect()
         print(f"[✓] Connected to {username}@{host}")
         
         # Cleanup
@@ -47,7 +37,7 @@ sudo systemctl stop edudisplej-init.service 2>/dev/null || true
 sudo rm -rf /opt/edudisplej /tmp/edudisplej-install.lock 2>/dev/null || true
 echo "[OK] Cleanup completed"
 """
-        output, error = ssh_run(ssh, cmd)
+        output, error = await ssh_run(ssh, cmd)
         print(output)
         if error:
             print(f"[!] Error: {error}")
@@ -60,7 +50,7 @@ echo "[OK] Cleanup completed"
         cmd = f"""
 curl -fsSL https://install.edudisplej.sk/install.sh | sudo bash -s -- --token={api_token}
 """
-        output, error = ssh_run(ssh, cmd, timeout=600)
+        output, error = await ssh_run(ssh, cmd, timeout=600)
         
         if output:
             print(output)
@@ -71,7 +61,6 @@ curl -fsSL https://install.edudisplej.sk/install.sh | sudo bash -s -- --token={a
         print("[*] Device will reboot shortly")
         print("[*] Check device after 2-3 minutes")
         
-        ssh.close()
         return True
         
     except paramiko.ssh_exception.AuthenticationException as e:
@@ -82,6 +71,8 @@ curl -fsSL https://install.edudisplej.sk/install.sh | sudo bash -s -- --token={a
         import traceback
         traceback.print_exc()
         return False
+    finally:
+        await ssh.close()
 
 if __name__ == "__main__":
     if len(sys.argv) < 4:
@@ -94,7 +85,7 @@ if __name__ == "__main__":
     password = sys.argv[3]
     api_token = sys.argv[4]
     
-    if fix_device(host, username, password, api_token):
+    if asyncio.run(fix_device(host, username, password, api_token)):
         sys.exit(0)
     else:
         sys.exit(1)
@@ -1,69 +1,81 @@
 #!/usr/bin/env python3
 """SSH diagnostic script for edudisplej kiosk devices."""
 
-import subprocess
+import asyncio
 import sys
-import os
 
-def run_ssh_command(host, username, password, command):
-    """Run SSH command with password authentication using plink."""
-    try:
-        # Use plink (PuTTY) with automatic host key acceptance
-        plink_cmd = [
-            'plink',
-            '-l', username,
-            '-pw', password,
-            '-ssh',
-            host,
-            command
-        ]
-        
-        print(f"[*] Running command on {host}...")
-        result = subprocess.run(plink_cmd, capture_output=True, text=True, timeout=15, input='y\n')
-        
-        print(f"[*] Return code: {result.returncode}")
+from edudisplej_ssh import SshFleet
+
+DEFAULT_HOST = '10.153.162.7'
+DEFAULT_USERNAME = 'edudisplej'
+DEFAULT_PASSWORD = 'edudisplej'
+
+STEPS = [
+    ('STEP 1: Check Service Status',
+     'systemctl status edudisplej-watchdog edudisplej-kiosk 2>&1'),
+    ('STEP 2: Check Running Processes',
+     'ps aux | grep -E "(edudisplej|kiosk|watchdog)" | grep -v grep'),
+    ('STEP 3: Recent Systemctl Logs',
+     'journalctl -u edudisplej-watchdog -u edudisplej-kiosk -n 20 --no-pager'),
+    ('STEP 4: Check Service Enablement',
+     'systemctl is-enabled edudisplej-watchdog edudisplej-kiosk'),
+]
+
+async def diagnose_host(ssh):
+    """Run every diagnostic step over the host's single SSH connection."""
+    await ssh.connect()
+    return await asyncio.gather(
+        *(ssh.run(command, timeout=15) for _, command in STEPS),
+        return_exceptions=True
+    )
+
+def print_report(host, results):
+    print(f"\n{'=' * 60}")
+    print(f"Host: {host}")
+    print('=' * 60)
+
+    if isinstance(results, BaseException):
+        print(f"[!] Error: cannot connect - {results}")
+        return False
+
+    # Failing diagnostic commands (inactive unit, no matching process) are findings,
+    # not tool failures; only SSH errors count
+    ok = True
+    for (title, _), result in zip(STEPS, results):
+        print(f"\n[=== {title} ===]")
+        if isinstance(result, BaseException):
+            print(f"[!] Error: {result}")
+            ok = False
+            continue
+
+        print(f"[*] Return code: {result.exit_code}")
         if result.stdout:
             print(f"[+] Output:\n{result.stdout}")
         if result.stderr:
             print(f"[!] Stderr:\n{result.stderr}")
-        
-        return result.returncode == 0
-        
-    except FileNotFoundError as e:
-        print(f"[!] Error: plink not found - {e}")
-        print(f"[!] Please install PuTTY (includes plink) or ensure it's in PATH")
-        return False
-    except subprocess.TimeoutExpired:
-        print(f"[!] Error: SSH connection timed out")
-        return False
-    except Exception as e:
-        print(f"[!] Error: {e}")
-        return False
+    return ok
+
+async def run_diagnostics(hosts, username, password):
+    async with SshFleet(username, password, timeout=15) as fleet:
+        results = await fleet.map(hosts, diagnose_host)
+
+    ok = True
+    for host in hosts:
+        ok = print_report(host, results[host]) and ok
+    return ok
 
 if __name__ == '__main__':
-    host = '10.153.162.7'
-    username = 'edudisplej'
-    password = 'edudisplej'
-    
-    # Step 1: Check systemctl status
-    print("\n[=== STEP 1: Check Service Status ===]")
-    run_ssh_command(host, username, password,
-        'systemctl status edudisplej-watchdog edudisplej-kiosk 2>&1')
-    
-    # Step 2: Check running processes
-    print("\n[=== STEP 2: Check Running Processes ===]")
-    run_ssh_command(host, username, password,
-        'ps aux | grep -E "(edudisplej|kiosk|watchdog)" | grep -v grep')
-    
-    # Step 3: Check systemctl logs
-    print("\n[=== STEP 3: Recent Systemctl Logs ===]")
-    run_ssh_command(host, username, password,
-        'journalctl -u edudisplej-watchdog -u edudisplej-kiosk -n 20 --no-pager')
-    
-    # Step 4: Check if services are enabled
-    print("\n[=== STEP 4: Check Service Enablement ===]")
-    run_ssh_command(host, username, password,
-        'systemctl is-enabled edudisplej-watchdog edudisplej-kiosk')
-    
-    print("\n[=== DIAGNOSTICS COMPLETE ===]")
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        print("Usage: python3 ssh_diagnose.py [ip[,ip2,...]] [username] [password]")
+        print("Exits 1 if a host could not be reached or a command could not be run over SSH;")
+        print("the return codes of the diagnostic commands are only reported.")
+        sys.exit(0)
+
+    hosts = [h.strip() for h in (sys.argv[1] if len(sys.argv) > 1 else DEFAULT_HOST).split(',') if h.strip()]
+    username = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_USERNAME
+    password = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_PASSWORD
 
+    ok = asyncio.run(run_diagnostics(hosts, username, password))
+
+    print("\n[=== DIAGNOSTICS COMPLETE ===]")
+    sys.exit(0 if ok else 1)
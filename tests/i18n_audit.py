@@ -1,13 +1,36 @@
 from __future__ import annotations
 
 import argparse
+import bisect
+import hashlib
 import json
+import os
+import pickle
 import re
-from dataclasses import dataclass
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Iterable, Iterator
 
 
 ROOT_REL = Path("webserver/control_edudisplej_sk")
+DEFAULT_CACHE = ".i18n_audit_cache.json"
+DEFAULT_CATALOG_CACHE = ".i18n_audit_catalog.pickle"
+PARALLEL_MIN_FILES = 64  # Below this a process pool costs more than it saves
+DEFAULT_OUTPUTS = {
+    "markdown": "docs/I18N_AUDIT_REPORT.md",
+    "json": "docs/i18n_audit.json",
+    "sarif": "docs/i18n_audit.sarif",
+}
+MISSING_KEY_KIND = "missing_translation_key"
+RULES = {
+    MISSING_KEY_KIND: "Translation key used by t()/t_def() is missing from every catalog",
+    "missing_i18n_include": "File uses t()/t_def() without including i18n.php",
+    "hardcoded_html_text": "User-facing text hardcoded between HTML tags",
+    "hardcoded_ui_literal": "User-facing string literal hardcoded in UI code",
+}
 SCAN_EXTENSIONS = {".php", ".html", ".js"}
 EXCLUDE_DIR_NAMES = {
     "logs",
@@ -23,9 +46,56 @@ EXCLUDE_DIR_NAMES = {
 T_CALL_RE = re.compile(r"\bt(?:_def)?\(\s*['\"]([^'\"]+)['\"]")
 I18N_PAIR_RE = re.compile(r"['\"]([a-z0-9_.-]{3,})['\"]\s*=>")
 JSON_KEY_RE = re.compile(r'"([a-z0-9_.-]{3,})"\s*:')
+# One pass over i18n.php: language block openers ('hu' => [) and key => 'value' entries
+I18N_TOKEN_RE = re.compile(
+    r"^\s*'(?P<lang>[a-z]{2})'\s*=>\s*\[\s*$"
+    r"|^(?P<close>\];)"
+    r"|['\"](?P<key>[a-z0-9_.-]{3,})['\"]\s*=>\s*(?:'(?P<sq>(?:[^'\\]|\\.)*)'|\"(?P<dq>(?:[^\"\\]|\\.)*)\")?",
+    re.MULTILINE,
+)
+PHP_ESCAPE_RE = re.compile(r"\\(['\\])")
 
 HTML_TEXT_RE = re.compile(r">([^<>{}]+)<")
 QUOTED_TEXT_RE = re.compile(r"['\"]([^'\"\n]{3,})['\"]")
+WHITESPACE_RE = re.compile(r"\s+")
+
+UI_MARKERS = (
+    "echo",
+    "print",
+    "alert(",
+    "confirm(",
+    "placeholder=",
+    "title=",
+    "aria-label=",
+    "textContent",
+    "innerText",
+    ".text(",
+    "<button",
+    "<label",
+    "<h1",
+    "<h2",
+    "<h3",
+    "<p",
+    "<span",
+    "<a ",
+    "<th",
+    "<td",
+)
+UI_MARKER_RE = re.compile("|".join(re.escape(marker) for marker in UI_MARKERS))
+
+# looks_human_text() rules, folded into three precompiled matchers:
+# anything matching TEXT_REJECT_RE is code/markup/SQL/CSS rather than UI text,
+# a single token (no spaces) is also rejected by SINGLE_TOKEN_REJECT_RE, and
+# what remains must contain at least one letter.
+TEXT_REJECT_RE = re.compile(
+    r"^(?:https?://|[/#])"
+    r"|[{}$\\<\"']|\?>"
+    r"| (?:href|src|class|style)="
+    r"|(?i:SELECT|INSERT|UPDATE|DELETE|ALTER|CREATE TABLE|DROP TABLE)"
+    r"|(?i:linear-gradient|display:|grid-template|utf8)"
+)
+SINGLE_TOKEN_REJECT_RE = re.compile(r"[=:/]|\A[a-zA-Z0-9_.-]+\Z")
+LETTER_RE = re.compile(r"[A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű]")
 
 
 @dataclass
@@ -36,6 +106,55 @@ class Finding:
     text: str
 
 
+@dataclass
+class FileScan:
+    """Everything the audit extracts from one file; cached per file between runs."""
+
+    keys: list[tuple[str, int]] = field(default_factory=list)
+    findings: list[Finding] = field(default_factory=list)
+    prefixes: list[str] = field(default_factory=list)
+
+
+@dataclass
+class CatalogIndex:
+    """Effective translation catalog per language (embedded i18n.php table merged with lang/<code>.json)."""
+
+    languages: dict[str, dict[str, str]] = field(default_factory=dict)
+    extra_keys: set[str] = field(default_factory=set)
+
+    @property
+    def all_keys(self) -> set[str]:
+        keys = set(self.extra_keys)
+        for catalog in self.languages.values():
+            keys.update(catalog)
+        return keys
+
+
+@dataclass
+class CatalogReport:
+    missing_by_language: dict[str, list[str]]
+    unused_keys: list[str]
+    duplicate_values: dict[str, list[tuple[str, list[str]]]]
+
+
+def rel_path(path: Path, rel_base: Path) -> str:
+    return path.relative_to(rel_base).as_posix()
+
+
+class LineIndex:
+    """Maps character offsets to 1-based line numbers by bisecting newline offsets."""
+
+    def __init__(self, text: str) -> None:
+        self.starts = [0]
+        pos = text.find("\n")
+        while pos != -1:
+            self.starts.append(pos + 1)
+            pos = text.find("\n", pos + 1)
+
+    def line_of(self, offset: int) -> int:
+        return bisect.bisect_right(self.starts, offset)
+
+
 def should_skip_file(path: Path) -> bool:
     if path.suffix.lower() not in SCAN_EXTENSIONS:
         return True
@@ -44,206 +163,544 @@ def should_skip_file(path: Path) -> bool:
 
 
 def normalize_ws(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
+    return WHITESPACE_RE.sub(" ", text).strip()
 
 
 def looks_human_text(text: str) -> bool:
     text = normalize_ws(text)
     if len(text) < 3:
         return False
-    if text.count(" ") == 0 and len(text) < 5:
-        return False
-    if re.fullmatch(r"[0-9\W_]+", text):
-        return False
-    if text.startswith(("http://", "https://", "/", "#")):
+    if " " not in text and (len(text) < 5 or SINGLE_TOKEN_REJECT_RE.search(text)):
         return False
-    if re.search(r"[{}$\\]|<\?php|\?>", text):
+    if TEXT_REJECT_RE.search(text):
         return False
-    if any(mark in text for mark in (" href=", " src=", " class=", " style=", "</", "<")):
-        return False
-    if '"' in text or "'" in text:
-        return False
-    if re.fullmatch(r"[a-zA-Z0-9_.:/-]+", text) and " " not in text:
-        return False
-    if re.search(r"[=:/]", text) and " " not in text:
-        return False
-    if re.search(r"(SELECT|INSERT|UPDATE|DELETE|ALTER|CREATE TABLE|DROP TABLE)", text, re.IGNORECASE):
-        return False
-    if re.search(r"(linear-gradient|display:\s*|grid-template|utf8|utf8mb4)", text, re.IGNORECASE):
-        return False
-    return bool(re.search(r"[A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű]", text))
-
-
-def load_catalog_keys(base_dir: Path) -> set[str]:
-    keys: set[str] = set()
+    return LETTER_RE.search(text) is not None
+
+
+def parse_i18n_php(content: str) -> tuple[dict[str, dict[str, str]], set[str]]:
+    """Split the embedded translation table by language; keys outside it are returned separately."""
+    languages: dict[str, dict[str, str]] = {}
+    extra_keys: set[str] = set()
+    current: dict[str, str] | None = None
+    for match in I18N_TOKEN_RE.finditer(content):
+        if match.group("lang"):
+            current = languages.setdefault(match.group("lang"), {})
+        elif match.group("close"):
+            current = None
+        elif current is not None and (match.group("sq") is not None or match.group("dq") is not None):
+            value = match.group("sq") if match.group("sq") is not None else match.group("dq")
+            current[match.group("key")] = PHP_ESCAPE_RE.sub(r"\1", value)
+        else:
+            extra_keys.add(match.group("key"))
+    return languages, extra_keys
+
+
+def build_catalog_index(base_dir: Path) -> CatalogIndex:
+    """Parse i18n.php and every lang/*.json exactly once."""
+    index = CatalogIndex()
     i18n_php = base_dir / ROOT_REL / "i18n.php"
     if i18n_php.exists():
-        content = i18n_php.read_text(encoding="utf-8", errors="ignore")
-        keys.update(I18N_PAIR_RE.findall(content))
+        languages, index.extra_keys = parse_i18n_php(i18n_php.read_text(encoding="utf-8", errors="ignore"))
+        index.languages.update(languages)
 
     lang_dir = base_dir / ROOT_REL / "lang"
     if lang_dir.exists():
-        for lang_file in lang_dir.glob("*.json"):
+        for lang_file in sorted(lang_dir.glob("*.json")):
+            catalog = index.languages.setdefault(lang_file.stem, {})
             text = lang_file.read_text(encoding="utf-8", errors="ignore")
-            keys.update(JSON_KEY_RE.findall(text))
             try:
                 data = json.loads(text)
-                if isinstance(data, dict):
-                    keys.update(k for k in data.keys() if isinstance(k, str))
             except json.JSONDecodeError:
+                # Unparseable override file: keep its keys, the values are unknown
+                catalog.update((key, "") for key in JSON_KEY_RE.findall(text) if key not in catalog)
                 continue
-    return keys
+            if isinstance(data, dict):
+                catalog.update((k, "" if v is None else str(v)) for k, v in data.items() if isinstance(k, str))
+    return index
+
+
+def catalog_sources(base_dir: Path) -> list[Path]:
+    root = base_dir / ROOT_REL
+    return [root / "i18n.php", *sorted((root / "lang").glob("*.json"))]
+
+
+def load_catalog_index(base_dir: Path, cache_path: Path | None = None) -> CatalogIndex:
+    """Catalog index, unpickled from `cache_path` while no source file changed."""
+    stamp = [hashlib.sha1(Path(__file__).read_bytes()).hexdigest()]
+    for path in catalog_sources(base_dir):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        stamp.append((rel_path(path, base_dir), stat.st_mtime_ns, stat.st_size))
+
+    if cache_path is not None and cache_path.exists():
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("stamp") == stamp:
+                return CatalogIndex(languages=cached["languages"], extra_keys=cached["extra_keys"])
+        except Exception:
+            pass
+
+    index = build_catalog_index(base_dir)
+    if cache_path is not None:
+        # Plain containers only, so the pickle loads whether the audit runs as a script or a module
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                {"stamp": stamp, "languages": index.languages, "extra_keys": index.extra_keys},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, cache_path)
+    return index
+
+
+def load_catalog_keys(base_dir: Path) -> set[str]:
+    return build_catalog_index(base_dir).all_keys
+
+
+def analyze_catalog(index: CatalogIndex, used_keys: set[str], prefixes: set[str]) -> CatalogReport:
+    """Keys missing per language, keys no code refers to, and values shared by several keys."""
+    all_keys = index.all_keys
+    missing_by_language = {
+        lang: sorted(all_keys - catalog.keys() - index.extra_keys) for lang, catalog in sorted(index.languages.items())
+    }
+
+    # Nested prefixes are dropped: once none is a prefix of another, a key can only
+    # start with the nearest prefix sorting before it
+    ordered_prefixes: list[str] = []
+    for prefix in sorted(prefixes):
+        if not ordered_prefixes or not prefix.startswith(ordered_prefixes[-1]):
+            ordered_prefixes.append(prefix)
+
+    def is_used(key: str) -> bool:
+        if key in used_keys:
+            return True
+        # t('lang.' . $code) style lookups use every key under the prefix
+        pos = bisect.bisect_right(ordered_prefixes, key)
+        return pos > 0 and key.startswith(ordered_prefixes[pos - 1])
+
+    unused_keys = sorted(key for key in all_keys if not is_used(key))
+
+    duplicate_values: dict[str, list[tuple[str, list[str]]]] = {}
+    for lang, catalog in sorted(index.languages.items()):
+        by_value: dict[str, list[str]] = {}
+        for key, value in catalog.items():
+            normalized = normalize_ws(value)
+            if normalized:
+                by_value.setdefault(normalized, []).append(key)
+        duplicate_values[lang] = sorted(
+            (value, sorted(keys)) for value, keys in by_value.items() if len(keys) > 1
+        )
+    return CatalogReport(missing_by_language, unused_keys, duplicate_values)
 
 
 def collect_project_files(base_dir: Path) -> list[Path]:
+    """Project files in sorted order, pruning excluded directories while walking."""
     root = base_dir / ROOT_REL
     files: list[Path] = []
-    for path in root.rglob("*"):
-        if path.is_file() and not should_skip_file(path):
-            files.append(path)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if name.lower() not in EXCLUDE_DIR_NAMES]
+        for name in filenames:
+            path = Path(dirpath, name)
+            if not should_skip_file(path.relative_to(root)):
+                files.append(path)
+    files.sort()
     return files
 
 
-def scan_for_t_keys(files: list[Path], rel_base: Path) -> tuple[set[str], dict[str, list[str]], list[Finding]]:
-    used_keys: set[str] = set()
-    used_key_locations: dict[str, list[str]] = {}
-    findings: list[Finding] = []
-    for path in files:
-        text = path.read_text(encoding="utf-8", errors="ignore")
-        for match in T_CALL_RE.finditer(text):
-            key = match.group(1).strip()
-            if not key or key.endswith(".") or " " in key:
-                continue
-            used_keys.add(key)
-            line_no = text.count("\n", 0, match.start()) + 1
-            location = f"{str(path.relative_to(rel_base)).replace('\\', '/')}:L{line_no}"
-            used_key_locations.setdefault(key, []).append(location)
-
-        lines = text.splitlines()
-        if path.suffix.lower() == ".php":
-            has_include = any("i18n.php" in line for line in lines)
-            uses_t = any("t(" in line or "t_def(" in line for line in lines)
-            if uses_t and not has_include and path.name != "i18n.php":
-                findings.append(
-                    Finding(
-                        kind="missing_i18n_include",
-                        file=str(path.relative_to(rel_base)).replace("\\", "/"),
-                        line=1,
-                        text="Uses t()/t_def() but i18n.php include not found",
-                    )
+def find_t_keys(text: str, rel: str, suffix: str, name: str) -> FileScan:
+    result = FileScan()
+    line_index = LineIndex(text)
+    for match in T_CALL_RE.finditer(text):
+        key = match.group(1).strip()
+        if not key or " " in key:
+            continue
+        if key.endswith("."):
+            result.prefixes.append(key)
+            continue
+        result.keys.append((key, line_index.line_of(match.start())))
+
+    if suffix == ".php" and name != "i18n.php":
+        uses_t = "t(" in text or "t_def(" in text
+        if uses_t and "i18n.php" not in text:
+            result.findings.append(
+                Finding(
+                    kind="missing_i18n_include",
+                    file=rel,
+                    line=1,
+                    text="Uses t()/t_def() but i18n.php include not found",
                 )
-    return used_keys, used_key_locations, findings
+            )
+    return result
 
 
 def context_is_ui_line(line: str) -> bool:
-    ui_markers = (
-        "echo",
-        "print",
-        "alert(",
-        "confirm(",
-        "placeholder=",
-        "title=",
-        "aria-label=",
-        "textContent",
-        "innerText",
-        ".text(",
-        "<button",
-        "<label",
-        "<h1",
-        "<h2",
-        "<h3",
-        "<p",
-        "<span",
-        "<a ",
-        "<th",
-        "<td",
-    )
-    return any(marker in line for marker in ui_markers)
+    return UI_MARKER_RE.search(line) is not None
+
+
+def find_hardcoded_ui_text(text: str, rel: str) -> list[Finding]:
+    findings: dict[tuple[str, int, str], Finding] = {}
+    for idx, line in enumerate(text.splitlines(), start=1):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith(("//", "/*", "*", "#")):
+            continue
+        if "<?php" in line and "?>" not in line and "<" not in stripped.replace("<?php", ""):
+            continue
+        if "t(" in line or "t_def(" in line:
+            continue
+
+        for m in HTML_TEXT_RE.finditer(line):
+            candidate = normalize_ws(m.group(1))
+            if looks_human_text(candidate):
+                item = Finding(kind="hardcoded_html_text", file=rel, line=idx, text=candidate[:220])
+                findings[(item.kind, item.line, item.text)] = item
+
+        if context_is_ui_line(line):
+            for m in QUOTED_TEXT_RE.finditer(line):
+                candidate = normalize_ws(m.group(1))
+                if looks_human_text(candidate):
+                    item = Finding(kind="hardcoded_ui_literal", file=rel, line=idx, text=candidate[:220])
+                    findings[(item.kind, item.line, item.text)] = item
+    return list(findings.values())
+
+
+def scan_file(path: Path, text: str, rel_base: Path) -> FileScan:
+    rel = rel_path(path, rel_base)
+    result = find_t_keys(text, rel, path.suffix.lower(), path.name)
+    result.findings.extend(find_hardcoded_ui_text(text, rel))
+    return result
+
+
+class ScanCache:
+    """On-disk cache of per-file scan results.
+
+    An entry is reused while the file's mtime and size are unchanged; if only
+    the stat changed (checkout, touch), the content hash decides. Entries are
+    tagged with a hash of this script, so changing a rule invalidates them all.
+    """
+
+    def __init__(self, path: Path | None) -> None:
+        self.path = path
+        self.version = hashlib.sha1(Path(__file__).read_bytes()).hexdigest()
+        self.entries: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        if path is None or not path.exists():
+            return
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == self.version:
+            self.entries = data.get("files") or {}
+
+    @staticmethod
+    def _decode(rel: str, entry: dict) -> FileScan:
+        return FileScan(
+            keys=[(key, line) for key, line in entry["keys"]],
+            findings=[Finding(kind=kind, file=rel, line=line, text=text) for kind, line, text in entry["findings"]],
+            prefixes=entry["prefixes"],
+        )
+
+    def lookup(self, path: Path, rel_base: Path) -> FileScan | None:
+        rel = rel_path(path, rel_base)
+        entry = self.entries.get(rel)
+        if not entry:
+            self.misses += 1
+            return None
+        stat = path.stat()
+        if entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            self.hits += 1
+            return self._decode(rel, entry)
+        if entry["sha1"] == hashlib.sha1(path.read_bytes()).hexdigest():
+            self.hits += 1
+            entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            return self._decode(rel, entry)
+        self.misses += 1
+        return None
+
+    def store(self, rel: str, stat: os.stat_result, digest: str, result: FileScan) -> None:
+        self.entries[rel] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha1": digest,
+            "keys": result.keys,
+            "findings": [(f.kind, f.line, f.text) for f in result.findings],
+            "prefixes": result.prefixes,
+        }
+
+    def save(self, seen: set[str]) -> None:
+        if self.path is None:
+            return
+        files = {rel: entry for rel, entry in self.entries.items() if rel in seen}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps({"version": self.version, "files": files}, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+def scan_path(path: Path, rel_base: Path) -> tuple[os.stat_result, str, FileScan]:
+    """Read a file once and extract both t() keys and hardcoded text from it."""
+    stat = path.stat()
+    raw = path.read_bytes()
+    result = scan_file(path, raw.decode("utf-8", errors="ignore"), rel_base)
+    return stat, hashlib.sha1(raw).hexdigest(), result
+
+
+def scan_files(
+    files: list[Path], rel_base: Path, cache: ScanCache, jobs: int = 1
+) -> tuple[set[str], dict[str, list[str]], list[Finding], list[Finding], set[str]]:
+    """Scan all files, re-using cached results and spreading the rest over `jobs` processes.
+
+    Results are merged in the order of `files`, so the outcome does not depend
+    on the number of jobs or on which worker finished first.
+    """
+    results: list[FileScan | None] = [cache.lookup(path, rel_base) for path in files]
+    pending = [idx for idx, result in enumerate(results) if result is None]
+    pending_paths = [files[idx] for idx in pending]
+
+    if jobs > 1 and len(pending) >= PARALLEL_MIN_FILES:
+        workers = min(jobs, len(pending))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scanned = list(pool.map(scan_path, pending_paths, [rel_base] * len(pending),
+                                    chunksize=max(1, len(pending) // (workers * 4))))
+    else:
+        scanned = [scan_path(path, rel_base) for path in pending_paths]
+
+    for idx, (stat, digest, result) in zip(pending, scanned):
+        cache.store(rel_path(files[idx], rel_base), stat, digest, result)
+        results[idx] = result
 
+    used_keys: set[str] = set()
+    used_key_locations: dict[str, list[str]] = {}
+    include_findings: list[Finding] = []
+    ui_findings: list[Finding] = []
+    prefixes: set[str] = set()
+    for path, result in zip(files, results):
+        rel = rel_path(path, rel_base)
+        prefixes.update(result.prefixes)
+        for key, line_no in result.keys:
+            used_keys.add(key)
+            used_key_locations.setdefault(key, []).append(f"{rel}:L{line_no}")
+        for finding in result.findings:
+            (include_findings if finding.kind == "missing_i18n_include" else ui_findings).append(finding)
+    cache.save({rel_path(path, rel_base) for path in files})
+    return used_keys, used_key_locations, include_findings, ui_findings, prefixes
+
+
+def finding_fingerprint(kind: str, file: str, text: str) -> tuple[str, str, str]:
+    """Identity of a finding across runs; line numbers are left out so edits above it do not make it new."""
+    return (kind, file, text)
+
+
+def load_baseline(path: Path) -> Counter:
+    """Fingerprint counts of a report previously written with --format json."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    baseline: Counter = Counter()
+    for item in data.get("missing_keys", []):
+        baseline[finding_fingerprint(MISSING_KEY_KIND, "", item["key"])] += 1
+    for item in data.get("findings", []):
+        baseline[finding_fingerprint(item["kind"], item["file"], item["text"])] += 1
+    return baseline
+
+
+def new_since_baseline(
+    missing_keys: list[str], findings: list[Finding], baseline: Counter
+) -> tuple[list[str], list[Finding]]:
+    """Drop everything already present in the baseline, matching duplicates one for one."""
+    remaining = Counter(baseline)
+
+    def is_new(fingerprint: tuple[str, str, str]) -> bool:
+        if remaining[fingerprint] > 0:
+            remaining[fingerprint] -= 1
+            return False
+        return True
 
-def scan_for_hardcoded_ui_text(files: list[Path], rel_base: Path) -> list[Finding]:
-    findings: list[Finding] = []
-    for path in files:
-        lines = path.read_text(encoding="utf-8", errors="ignore").splitlines()
-        for idx, line in enumerate(lines, start=1):
-            stripped = line.strip()
-            if not stripped:
-                continue
-            if stripped.startswith(("//", "/*", "*", "#")):
-                continue
-            if "<?php" in line and "?>" not in line and "<" not in stripped.replace("<?php", ""):
-                continue
-            if "t(" in line or "t_def(" in line:
-                continue
+    new_keys = [key for key in missing_keys if is_new(finding_fingerprint(MISSING_KEY_KIND, "", key))]
+    new_findings = [
+        item
+        for item in sorted_findings(findings)
+        if is_new(finding_fingerprint(item.kind, item.file, item.text))
+    ]
+    return new_keys, new_findings
 
-            for m in HTML_TEXT_RE.finditer(line):
-                candidate = normalize_ws(m.group(1))
-                if looks_human_text(candidate):
-                    findings.append(
-                        Finding(
-                            kind="hardcoded_html_text",
-                            file=str(path.relative_to(rel_base)).replace("\\", "/"),
-                            line=idx,
-                            text=candidate[:220],
-                        )
-                    )
-
-            if context_is_ui_line(line):
-                for m in QUOTED_TEXT_RE.finditer(line):
-                    candidate = normalize_ws(m.group(1))
-                    if looks_human_text(candidate):
-                        findings.append(
-                            Finding(
-                                kind="hardcoded_ui_literal",
-                                file=str(path.relative_to(rel_base)).replace("\\", "/"),
-                                line=idx,
-                                text=candidate[:220],
-                            )
-                        )
-
-    unique: dict[tuple[str, str, int, str], Finding] = {}
-    for item in findings:
-        unique[(item.kind, item.file, item.line, item.text)] = item
-    return list(unique.values())
 
+def sorted_findings(findings: list[Finding]) -> list[Finding]:
+    return sorted(findings, key=lambda x: (x.kind, x.file, x.line, x.text))
 
-def write_markdown_report(
-    output_path: Path,
+
+def markdown_report(
     missing_keys: list[str],
     used_key_locations: dict[str, list[str]],
     findings: list[Finding],
-) -> None:
+    baseline: str | None = None,
+    catalog: CatalogReport | None = None,
+) -> Iterator[str]:
     by_kind: dict[str, list[Finding]] = {}
     for finding in findings:
         by_kind.setdefault(finding.kind, []).append(finding)
 
-    lines: list[str] = []
-    lines.append("# i18n audit report")
-    lines.append("")
-    lines.append(f"- Missing translation keys referenced by `t(...)`: **{len(missing_keys)}**")
-    lines.append(f"- Potential hardcoded user-facing strings: **{len(findings)}**")
-    lines.append("")
+    yield "# i18n audit report"
+    yield ""
+    if baseline:
+        yield f"- Only findings that are new compared to `{baseline}`"
+    yield f"- Missing translation keys referenced by `t(...)`: **{len(missing_keys)}**"
+    yield f"- Potential hardcoded user-facing strings: **{len(findings)}**"
+    yield ""
 
     if missing_keys:
-        lines.append("## Missing keys")
+        yield "## Missing keys"
         for key in missing_keys:
             locations = used_key_locations.get(key, [])
             sample = ", ".join(f"`{loc}`" for loc in locations[:3])
             if sample:
-                lines.append(f"- `{key}` → {sample}")
+                yield f"- `{key}` → {sample}"
             else:
-                lines.append(f"- `{key}`")
-        lines.append("")
+                yield f"- `{key}`"
+        yield ""
 
     for kind in sorted(by_kind.keys()):
         group = sorted(by_kind[kind], key=lambda x: (x.file, x.line, x.text))
-        lines.append(f"## {kind}")
+        yield f"## {kind}"
         for finding in group:
-            lines.append(f"- `{finding.file}:{finding.line}` → {finding.text}")
-        lines.append("")
+            yield f"- `{finding.file}:{finding.line}` → {finding.text}"
+        yield ""
+
+    if catalog is not None:
+        yield "## Catalog: keys missing per language"
+        for lang, keys in catalog.missing_by_language.items():
+            yield f"### {lang} ({len(keys)})"
+            for key in keys:
+                yield f"- `{key}`"
+        yield ""
+        yield f"## Catalog: keys not used by any t() call ({len(catalog.unused_keys)})"
+        for key in catalog.unused_keys:
+            yield f"- `{key}`"
+        yield ""
+        yield "## Catalog: duplicate values"
+        for lang, duplicates in catalog.duplicate_values.items():
+            yield f"### {lang} ({len(duplicates)})"
+            for value, keys in duplicates:
+                yield f"- {value[:120]} → " + ", ".join(f"`{key}`" for key in keys)
+        yield ""
+
+
+def json_report(
+    missing_keys: list[str],
+    used_key_locations: dict[str, list[str]],
+    findings: list[Finding],
+    baseline: str | None = None,
+    catalog: CatalogReport | None = None,
+) -> Iterator[str]:
+    summary = {"missing_keys": len(missing_keys), "findings": len(findings), "baseline": baseline}
+    yield f'{{"version": 1, "summary": {json.dumps(summary, ensure_ascii=False)}, "missing_keys": ['
+    for idx, key in enumerate(missing_keys):
+        item = {"key": key, "locations": used_key_locations.get(key, [])}
+        yield ("," if idx else "") + "\n  " + json.dumps(item, ensure_ascii=False)
+    yield '\n], "findings": ['
+    for idx, finding in enumerate(sorted_findings(findings)):
+        item = {"kind": finding.kind, "file": finding.file, "line": finding.line, "text": finding.text}
+        yield ("," if idx else "") + "\n  " + json.dumps(item, ensure_ascii=False)
+    yield "\n]"
+    if catalog is not None:
+        data = {
+            "missing_by_language": catalog.missing_by_language,
+            "unused_keys": catalog.unused_keys,
+            "duplicate_values": {
+                lang: [{"value": value, "keys": keys} for value, keys in duplicates]
+                for lang, duplicates in catalog.duplicate_values.items()
+            },
+        }
+        yield ', "catalog": ' + json.dumps(data, ensure_ascii=False)
+    yield "}\n"
+
+
+def sarif_result(rule_id: str, message: str, file: str, line: int, fingerprint: tuple[str, str, str]) -> str:
+    result = {
+        "ruleId": rule_id,
+        "level": "warning" if rule_id == MISSING_KEY_KIND else "note",
+        "message": {"text": message},
+        "locations": [
+            {
+                "physicalLocation": {
+                    "artifactLocation": {"uri": file, "uriBaseId": "SRCROOT"},
+                    "region": {"startLine": line},
+                }
+            }
+        ],
+        "partialFingerprints": {
+            "i18nAudit/v1": hashlib.sha1("\0".join(fingerprint).encode("utf-8")).hexdigest()
+        },
+    }
+    return json.dumps(result, ensure_ascii=False)
+
+
+def sarif_report(
+    missing_keys: list[str],
+    used_key_locations: dict[str, list[str]],
+    findings: list[Finding],
+    baseline: str | None = None,
+    catalog: CatalogReport | None = None,
+) -> Iterator[str]:
+    driver = {
+        "name": "i18n_audit",
+        "informationUri": "https://edudisplej.sk",
+        "rules": [{"id": rule_id, "shortDescription": {"text": text}} for rule_id, text in RULES.items()],
+    }
+    yield (
+        '{"$schema": "https://json.schemastore.org/sarif-2.1.0.json", "version": "2.1.0", "runs": [{'
+        f'"tool": {{"driver": {json.dumps(driver)}}}, "results": ['
+    )
+    separator = ""
+    for key in missing_keys:
+        locations = used_key_locations.get(key) or [":L1"]
+        file, _, line = locations[0].rpartition(":L")
+        message = f"Missing translation key '{key}' (used {len(locations)}x)"
+        fingerprint = finding_fingerprint(MISSING_KEY_KIND, "", key)
+        yield separator + "\n  " + sarif_result(MISSING_KEY_KIND, message, file, int(line), fingerprint)
+        separator = ","
+    for finding in sorted_findings(findings):
+        fingerprint = finding_fingerprint(finding.kind, finding.file, finding.text)
+        yield separator + "\n  " + sarif_result(finding.kind, finding.text, finding.file, finding.line, fingerprint)
+        separator = ","
+    yield "\n]}]}\n"
+
+
+REPORT_WRITERS = {"markdown": markdown_report, "json": json_report, "sarif": sarif_report}
+
+
+def write_lines(output_path: Path | None, lines: Iterable[str], separator: str = "\n") -> None:
+    """Stream chunks to the report file (atomically replaced) or to stdout when no path is given."""
+    if output_path is None:
+        first = True
+        for line in lines:
+            sys.stdout.write(line if first else separator + line)
+            first = False
+        if separator == "\n":
+            sys.stdout.write("\n")
+        return
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_path.write_text("\n".join(lines), encoding="utf-8")
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        first = True
+        for line in lines:
+            f.write(line if first else separator + line)
+            first = False
+    os.replace(tmp_path, output_path)
+
+
+def write_markdown_report(
+    output_path: Path,
+    missing_keys: list[str],
+    used_key_locations: dict[str, list[str]],
+    findings: list[Finding],
+) -> None:
+    write_lines(output_path, markdown_report(missing_keys, used_key_locations, findings))
 
 
 def main() -> int:
@@ -253,32 +710,80 @@ def main() -> int:
         default=".",
         help="Repository root directory",
     )
+    parser.add_argument(
+        "--format",
+        choices=sorted(REPORT_WRITERS),
+        default="markdown",
+        help="Report format (default: markdown)",
+    )
     parser.add_argument(
         "--output",
-        default="docs/I18N_AUDIT_REPORT.md",
-        help="Output markdown report path (relative to base-dir)",
+        default=None,
+        help="Report path relative to base-dir, or - for stdout (default depends on --format)",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="JSON report of an earlier run; only new findings are reported and the exit code is 1 if there are any",
+    )
+    parser.add_argument(
+        "--cache",
+        default=DEFAULT_CACHE,
+        help="Per-file result cache for incremental runs (relative to base-dir)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Re-scan every file and do not write the cache",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes for files that need scanning (default: CPU count)",
     )
     args = parser.parse_args()
 
     base_dir = Path(args.base_dir).resolve()
     files = collect_project_files(base_dir)
-    catalog_keys = load_catalog_keys(base_dir)
-    used_keys, used_key_locations, include_findings = scan_for_t_keys(files, base_dir)
+    catalog_index = load_catalog_index(base_dir, None if args.no_cache else (base_dir / DEFAULT_CATALOG_CACHE))
+    catalog_keys = catalog_index.all_keys
+    cache = ScanCache(None if args.no_cache else (base_dir / args.cache))
+    used_keys, used_key_locations, include_findings, ui_findings, prefixes = scan_files(
+        files, base_dir, cache, args.jobs
+    )
+    catalog = analyze_catalog(catalog_index, used_keys, prefixes)
 
     missing_keys = sorted(key for key in used_keys if key not in catalog_keys)
-    ui_findings = scan_for_hardcoded_ui_text(files, base_dir)
-
     all_findings = include_findings + ui_findings
-
-    output_path = (base_dir / args.output).resolve()
-    write_markdown_report(output_path, missing_keys, used_key_locations, all_findings)
-
-    print(f"Scanned files: {len(files)}")
-    print(f"Used translation keys: {len(used_keys)}")
-    print(f"Catalog keys: {len(catalog_keys)}")
-    print(f"Missing keys: {len(missing_keys)}")
-    print(f"Potential hardcoded strings: {len(all_findings)}")
-    print(f"Report: {output_path}")
+    total_missing, total_findings = len(missing_keys), len(all_findings)
+    if args.baseline:
+        baseline = load_baseline(base_dir / args.baseline)
+        missing_keys, all_findings = new_since_baseline(missing_keys, all_findings, baseline)
+
+    output = args.output or DEFAULT_OUTPUTS[args.format]
+    output_path = None if output == "-" else (base_dir / output).resolve()
+    # The catalog analysis is not part of the baseline delta, so it is left out of diff reports
+    report = REPORT_WRITERS[args.format](
+        missing_keys, used_key_locations, all_findings, args.baseline, None if args.baseline else catalog
+    )
+    write_lines(output_path, report, separator="\n" if args.format == "markdown" else "")
+
+    # With the report on stdout the summary goes to stderr, keeping the output parseable
+    log = sys.stderr if output_path is None else sys.stdout
+    print(f"Scanned files: {len(files)} ({cache.misses} re-scanned, {cache.hits} from cache)", file=log)
+    print(f"Used translation keys: {len(used_keys)}", file=log)
+    print(f"Catalog keys: {len(catalog_keys)}", file=log)
+    languages = ", ".join(f"{lang}={len(keys)}" for lang, keys in catalog.missing_by_language.items())
+    print(f"Catalog keys missing per language: {languages}", file=log)
+    print(f"Catalog keys unused in code: {len(catalog.unused_keys)}", file=log)
+    print(f"Missing keys: {total_missing}", file=log)
+    print(f"Potential hardcoded strings: {total_findings}", file=log)
+    if args.baseline:
+        print(f"New since baseline: {len(missing_keys)} missing keys, {len(all_findings)} findings", file=log)
+    print(f"Report: {output_path or 'stdout'}", file=log)
+    if args.baseline and (missing_keys or all_findings):
+        return 1
     return 0
 
 
@@ -0,0 +1,264 @@
+"""Scaling benchmark and regression gate for tests/i18n_audit.py.
+
+Generates synthetic project trees (PHP/JS/HTML files, large lang catalogs,
+some very long lines), runs every audit phase against them and reports wall
+time and peak traced memory per phase as JSON. With --baseline the run fails
+when a phase got slower or hungrier than the baseline by more than
+--threshold.
+
+    python3 tests/i18n_audit_bench.py --sizes 1000,10000 --output bench.json
+    python3 tests/i18n_audit_bench.py --sizes 1000,10000 --baseline bench.json --threshold 0.25
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import i18n_audit  # noqa: E402
+
+PHASES = ("collect_project_files", "load_catalog_keys", "scan_cold", "scan_warm", "write_markdown_report")
+SUBDIRS = ("dashboard", "api", "modules/clock", "modules/meal", "admin", "assets/js", "partials")
+WORDS = (
+    "kijelzo", "display", "schedule", "module", "settings", "group", "loop", "save",
+    "delete", "status", "online", "offline", "company", "user", "report", "preview",
+)
+MIN_ABS_SECONDS = 0.05  # Ignore regressions smaller than timer noise
+MIN_ABS_KB = 512
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def key(rng: random.Random, catalog_size: int) -> str:
+    return f"{rng.choice(WORDS)}.k{rng.randrange(catalog_size)}"
+
+
+def php_file(rng: random.Random, catalog_size: int) -> str:
+    lines = ["<?php", "require_once __DIR__ . '/../i18n.php';", "?>", "<div class=\"card\">"]
+    for _ in range(rng.randint(20, 120)):
+        kind = rng.random()
+        if kind < 0.35:
+            lines.append(f"    <h2><?php echo t('{key(rng, catalog_size * 2)}'); ?></h2>")
+        elif kind < 0.55:
+            lines.append(f"    <button class=\"btn\">{sentence(rng, 3)}</button>")
+        elif kind < 0.7:
+            lines.append(f"    <?php echo '{sentence(rng, 4)}'; ?>")
+        elif kind < 0.85:
+            lines.append(f"    <input placeholder=\"{sentence(rng, 2)}\" name=\"{rng.choice(WORDS)}\">")
+        else:
+            lines.append(f"    $rows = $db->query(\"SELECT * FROM {rng.choice(WORDS)} WHERE id = ?\");")
+    lines.append("</div>")
+    return "\n".join(lines) + "\n"
+
+
+def js_file(rng: random.Random, catalog_size: int) -> str:
+    lines = ["(function () {", "  'use strict';"]
+    for _ in range(rng.randint(20, 120)):
+        kind = rng.random()
+        if kind < 0.3:
+            lines.append(f"  el.textContent = t('{key(rng, catalog_size * 2)}');")
+        elif kind < 0.5:
+            lines.append(f"  alert('{sentence(rng, 5)}');")
+        elif kind < 0.7:
+            lines.append(f"  const url = '/api/{rng.choice(WORDS)}/' + id;")
+        else:
+            lines.append(f"  el.innerText = \"{sentence(rng, 3)}\";")
+    lines.append("})();")
+    return "\n".join(lines) + "\n"
+
+
+def html_file(rng: random.Random, catalog_size: int) -> str:
+    cells = "".join(f"<td>{sentence(rng, 2)}</td>" for _ in range(rng.randint(5, 40)))
+    return f"<html><body><h1>{sentence(rng, 3)}</h1><table><tr>{cells}</tr></table></body></html>\n"
+
+
+def long_line_file(rng: random.Random, catalog_size: int) -> str:
+    # Minified bundles and inline data put everything on one very long line
+    parts = [f"t('{key(rng, catalog_size * 2)}')" if i % 3 else f"'{sentence(rng, 4)}'" for i in range(2000)]
+    return "var a=[" + ",".join(parts) + "];alert('" + sentence(rng, 6) + "');\n"
+
+
+def generate_tree(base: Path, files: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    root = base / i18n_audit.ROOT_REL
+    catalog_size = max(2000, files * 2)
+
+    lang_dir = root / "lang"
+    lang_dir.mkdir(parents=True, exist_ok=True)
+    for lang in ("en", "hu", "sk"):
+        catalog = {f"{WORDS[i % len(WORDS)]}.k{i}": f"{sentence(rng, 4)} ({lang})" for i in range(catalog_size)}
+        (lang_dir / f"{lang}.json").write_text(json.dumps(catalog, ensure_ascii=False, indent=1), encoding="utf-8")
+    pairs = "\n".join(f"        'php.k{i}' => '{sentence(rng, 3)}'," for i in range(catalog_size // 4))
+    (root / "i18n.php").write_text(f"<?php\n$translations = [\n    'en' => [\n{pairs}\n    ],\n];\n", encoding="utf-8")
+
+    writers = ((".php", php_file), (".js", js_file), (".html", html_file))
+    for idx in range(files):
+        directory = root / SUBDIRS[idx % len(SUBDIRS)] / f"d{idx // 200}"
+        directory.mkdir(parents=True, exist_ok=True)
+        if idx % 250 == 0:
+            (directory / f"bundle{idx}.js").write_text(long_line_file(rng, catalog_size), encoding="utf-8")
+            continue
+        suffix, writer = writers[idx % len(writers)]
+        (directory / f"f{idx}{suffix}").write_text(writer(rng, catalog_size), encoding="utf-8")
+
+    # Excluded directories must be pruned, so they are not counted as project files
+    (root / "vendor" / "lib").mkdir(parents=True, exist_ok=True)
+    (root / "vendor" / "lib" / "ignored.php").write_text(php_file(rng, catalog_size), encoding="utf-8")
+    return {"files": files, "catalog_keys_per_language": catalog_size}
+
+
+def run_phases(base: Path, jobs: int, trace_memory: bool) -> tuple[dict[str, dict], dict]:
+    """Run the audit phase by phase; returns per-phase metrics and result counts."""
+    cache_path = base / i18n_audit.DEFAULT_CACHE
+    cache_path.unlink(missing_ok=True)
+    metrics: dict[str, dict] = {}
+
+    def phase(name, func):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        result = func()
+        entry = {"seconds": round(time.perf_counter() - started, 4)}
+        if trace_memory:
+            entry["peak_kb"] = round((tracemalloc.get_traced_memory()[1] - before) / 1024)
+        metrics[name] = entry
+        return result
+
+    files = phase("collect_project_files", lambda: i18n_audit.collect_project_files(base))
+    catalog_keys = phase("load_catalog_keys", lambda: i18n_audit.load_catalog_keys(base))
+    phase("scan_cold", lambda: i18n_audit.scan_files(files, base, i18n_audit.ScanCache(cache_path), jobs))
+    used_keys, locations, include_findings, ui_findings, _ = phase(
+        "scan_warm", lambda: i18n_audit.scan_files(files, base, i18n_audit.ScanCache(cache_path), jobs)
+    )
+    missing_keys = sorted(k for k in used_keys if k not in catalog_keys)
+    findings = include_findings + ui_findings
+    phase(
+        "write_markdown_report",
+        lambda: i18n_audit.write_markdown_report(base / "report.md", missing_keys, locations, findings),
+    )
+
+    counts = {
+        "files": len(files),
+        "catalog_keys": len(catalog_keys),
+        "used_keys": len(used_keys),
+        "missing_keys": len(missing_keys),
+        "findings": len(findings),
+    }
+    return metrics, counts
+
+
+def benchmark_size(workdir: Path, files: int, seed: int, jobs: int, keep: bool) -> dict:
+    base = workdir / f"tree-{files}"
+    if base.exists():
+        shutil.rmtree(base)
+    started = time.perf_counter()
+    tree = generate_tree(base, files, seed)
+    tree["generate_seconds"] = round(time.perf_counter() - started, 2)
+
+    try:
+        # Timings without tracemalloc overhead, then a serial pass for memory peaks
+        timings, counts = run_phases(base, jobs, trace_memory=False)
+        tracemalloc.start()
+        try:
+            memory, _ = run_phases(base, 1, trace_memory=True)
+        finally:
+            tracemalloc.stop()
+    finally:
+        if not keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+    for name in PHASES:
+        timings[name]["peak_kb"] = memory[name]["peak_kb"]
+    return {"tree": tree, "counts": counts, "phases": timings}
+
+
+def find_regressions(result: dict, baseline: dict, threshold: float) -> list[str]:
+    previous = {run["tree"]["files"]: run for run in baseline.get("runs", [])}
+    problems: list[str] = []
+    for run in result["runs"]:
+        base_run = previous.get(run["tree"]["files"])
+        if base_run is None:
+            continue
+        for name, current in run["phases"].items():
+            old = base_run["phases"].get(name)
+            if not old:
+                continue
+            for metric, min_abs in (("seconds", MIN_ABS_SECONDS), ("peak_kb", MIN_ABS_KB)):
+                if metric not in old or metric not in current:
+                    continue
+                limit = old[metric] * (1 + threshold)
+                if current[metric] > limit and current[metric] - old[metric] > min_abs:
+                    problems.append(
+                        f"{run['tree']['files']} files / {name}: {metric} {current[metric]} "
+                        f"> {old[metric]} (+{threshold:.0%})"
+                    )
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark i18n_audit.py on synthetic project trees")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated file counts, e.g. 1000,10000,50000")
+    parser.add_argument("--jobs", type=int, default=1, help="--jobs passed to the scan phases")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic tree generator")
+    parser.add_argument("--workdir", default=None, help="Where to generate trees (default: a temp directory)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated trees")
+    parser.add_argument("--output", default=None, help="Write the JSON result here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="Previous JSON result to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="Allowed relative regression against the baseline"
+    )
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="i18n-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    result = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "jobs": args.jobs,
+        "seed": args.seed,
+        "runs": [],
+    }
+    try:
+        for size in sizes:
+            run = benchmark_size(workdir, size, args.seed, args.jobs, args.keep)
+            result["runs"].append(run)
+            phases = ", ".join(f"{name} {m['seconds']:.3f}s/{m['peak_kb']}KB" for name, m in run["phases"].items())
+            print(f"[{size} files] {phases}", file=sys.stderr)
+    finally:
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    payload = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload + "\n", encoding="utf-8")
+    else:
+        print(payload)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        problems = find_regressions(result, baseline, args.threshold)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
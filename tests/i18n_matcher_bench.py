@@ -0,0 +1,172 @@
+"""Micro-benchmark and parity check for the i18n audit text matchers.
+
+Runs the previous rule-by-rule implementations of looks_human_text() and
+context_is_ui_line() against the combined matchers in i18n_audit.py, on every
+line and candidate string of the real project tree, and checks the prefix
+lookup behind analyze_catalog()'s unused keys against a plain startswith scan,
+with overlapping prefixes. Exits non-zero if any input is classified
+differently.
+
+    python3 tests/i18n_matcher_bench.py [--base-dir .] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import i18n_audit  # noqa: E402
+
+
+LEGACY_UI_MARKERS = (
+    "echo",
+    "print",
+    "alert(",
+    "confirm(",
+    "placeholder=",
+    "title=",
+    "aria-label=",
+    "textContent",
+    "innerText",
+    ".text(",
+    "<button",
+    "<label",
+    "<h1",
+    "<h2",
+    "<h3",
+    "<p",
+    "<span",
+    "<a ",
+    "<th",
+    "<td",
+)
+
+
+def legacy_normalize_ws(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def legacy_looks_human_text(text: str) -> bool:
+    text = legacy_normalize_ws(text)
+    if len(text) < 3:
+        return False
+    if text.count(" ") == 0 and len(text) < 5:
+        return False
+    if re.fullmatch(r"[0-9\W_]+", text):
+        return False
+    if text.startswith(("http://", "https://", "/", "#")):
+        return False
+    if re.search(r"[{}$\\]|<\?php|\?>", text):
+        return False
+    if any(mark in text for mark in (" href=", " src=", " class=", " style=", "</", "<")):
+        return False
+    if '"' in text or "'" in text:
+        return False
+    if re.fullmatch(r"[a-zA-Z0-9_.:/-]+", text) and " " not in text:
+        return False
+    if re.search(r"[=:/]", text) and " " not in text:
+        return False
+    if re.search(r"(SELECT|INSERT|UPDATE|DELETE|ALTER|CREATE TABLE|DROP TABLE)", text, re.IGNORECASE):
+        return False
+    if re.search(r"(linear-gradient|display:\s*|grid-template|utf8|utf8mb4)", text, re.IGNORECASE):
+        return False
+    return bool(re.search(r"[A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű]", text))
+
+
+def legacy_context_is_ui_line(line: str) -> bool:
+    return any(marker in line for marker in LEGACY_UI_MARKERS)
+
+
+def collect_inputs(base_dir: Path) -> tuple[list[str], list[str]]:
+    """All source lines and every HTML/quoted candidate string of the tree."""
+    lines: list[str] = []
+    candidates: list[str] = []
+    for path in i18n_audit.collect_project_files(base_dir):
+        for line in path.read_text(encoding="utf-8", errors="ignore").splitlines():
+            lines.append(line)
+            candidates.extend(m.group(1) for m in i18n_audit.HTML_TEXT_RE.finditer(line))
+            candidates.extend(m.group(1) for m in i18n_audit.QUOTED_TEXT_RE.finditer(line))
+    return lines, candidates
+
+
+# (dynamic lookup prefixes, catalog keys) where one prefix is nested in another
+PREFIX_CASES = (
+    ({"lang.", "lang.en.x"}, {"lang.fr", "lang.en.x.y", "lang.en", "langs", "other"}),
+    ({"a.", "a.b.", "a.b.c."}, {"a.a", "a.b.z", "a.c", "a.b.c.d", "b.a"}),
+    ({"", "x."}, {"x.y", "y"}),
+)
+
+
+def legacy_unused_keys(keys: set[str], prefixes: set[str]) -> list[str]:
+    return sorted(key for key in keys if not any(key.startswith(prefix) for prefix in prefixes))
+
+
+def check_prefix_lookup(base_dir: Path) -> int:
+    """Mismatches of analyze_catalog()'s unused keys against the linear scan"""
+    cases = list(PREFIX_CASES)
+    # Every dotted prefix of the real catalog keys, so nearly every prefix has nested ones
+    keys = i18n_audit.build_catalog_index(base_dir).all_keys
+    nested = {key[: pos + 1] for key in keys for pos, char in enumerate(key) if char == "."}
+    cases.append((set(sorted(nested)[::3]), keys))
+
+    mismatches = 0
+    for prefixes, case_keys in cases:
+        index = i18n_audit.CatalogIndex(languages={"en": {key: key for key in case_keys}})
+        expected = legacy_unused_keys(case_keys, prefixes)
+        actual = i18n_audit.analyze_catalog(index, set(), prefixes).unused_keys
+        for key in sorted(set(expected) ^ set(actual))[:10]:
+            print(f"  MISMATCH unused_keys: {key!r} legacy={key in expected} current={key in actual}")
+        mismatches += len(set(expected) ^ set(actual))
+    print(f"{'unused_keys':20} {len(cases):>7} cases   mismatches {mismatches}")
+    return mismatches
+
+
+def best_time(func, inputs: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in inputs:
+            func(item)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark and parity-check the i18n audit matchers")
+    parser.add_argument("--base-dir", default=".", help="Repository root directory")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions (best is reported)")
+    args = parser.parse_args()
+
+    base_dir = Path(args.base_dir).resolve()
+    lines, candidates = collect_inputs(base_dir)
+    pairs = (
+        ("context_is_ui_line", legacy_context_is_ui_line, i18n_audit.context_is_ui_line, lines),
+        ("looks_human_text", legacy_looks_human_text, i18n_audit.looks_human_text, candidates),
+    )
+
+    mismatches = 0
+    for name, legacy, current, inputs in pairs:
+        diff = [item for item in inputs if legacy(item) != current(item)]
+        mismatches += len(diff)
+        for item in diff[:10]:
+            print(f"  MISMATCH {name}: {item!r} legacy={legacy(item)} current={current(item)}")
+
+        legacy_s = best_time(legacy, inputs, args.repeat)
+        current_s = best_time(current, inputs, args.repeat)
+        speedup = legacy_s / current_s if current_s else float("inf")
+        print(
+            f"{name:20} {len(inputs):>7} inputs  legacy {legacy_s * 1000:8.1f} ms  "
+            f"combined {current_s * 1000:8.1f} ms  x{speedup:.1f}  mismatches {len(diff)}"
+        )
+
+    mismatches += check_prefix_lookup(base_dir)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
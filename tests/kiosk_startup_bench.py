@@ -0,0 +1,178 @@
+"""Cold-start benchmark and budget gate for the kiosk daemons.
+
+Starts the scheduler, the watchdog and the combined agent in fresh
+interpreters with --profile-startup (nothing is actuated; the scheduler
+decides from a generated schedule cache, the API URL points at a closed
+port) and reports, per entry point, the median over --runs of:
+    wall_ms       - process spawn until exit, measured from outside
+    to_main_ms    - process start until main() (interpreter + module imports)
+    ready_ms      - process start until the last role made its first decision
+The run fails when a median exceeds its budget, or when a third-party HTTP
+or D-Bus module was imported on the startup path.
+
+    python3 tests/kiosk_startup_bench.py --runs 7 --budget-ms 1500 --output startup.json
+
+Without --drop-caches the page cache is warm; as root on a kiosk,
+--drop-caches measures the real power-on case.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = REPO_ROOT / "webserver" / "control_edudisplej_sk" / "scripts"
+ENTRY_POINTS = {
+    "scheduler": SCRIPTS_DIR / "edudisplej-scheduler.py",
+    "watchdog": REPO_ROOT / "edudisplej_watchdog.py",
+    "agent": SCRIPTS_DIR / "edudisplej_agent.py",
+}
+METRICS = ("wall_ms", "to_main_ms", "ready_ms")
+
+
+def write_configs(workdir: Path) -> tuple[Path, Path]:
+    cache = workdir / "display_schedule.json"
+    slots = [{"day_of_week": day, "start_time": "00:00:00", "end_time": "23:59:59", "is_enabled": 1}
+             for day in range(7)]
+    cache.write_text(json.dumps({
+        "kijelzo_id": "1",
+        "version": 1,
+        "etag": '"1"',
+        "saved_at": "2026-01-01T00:00:00",
+        "schedule": {"time_slots": slots, "special_days": [], "is_active": True},
+    }), encoding="utf-8")
+
+    scheduler_config = workdir / "display_scheduler.conf"
+    scheduler_config.write_text(
+        "[api]\nurl = http://127.0.0.1:9/api\ntimeout = 1\n"
+        "[display]\nid = 1\n"
+        f"[service]\nschedule_cache = {cache}\nenable_hdmi_control = false\nactuation_backend = systemctl\n"
+        f"[monitoring]\nstatus_file = {workdir / 'display_status'}\n",
+        encoding="utf-8",
+    )
+    watchdog_config = workdir / "watchdog.conf"
+    watchdog_config.write_text(f"[leak]\nscheduler_status_file = {workdir / 'display_status'}\n", encoding="utf-8")
+    return scheduler_config, watchdog_config
+
+
+def drop_caches() -> bool:
+    try:
+        os.sync()
+        Path("/proc/sys/vm/drop_caches").write_text("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def run_once(name: str, scheduler_config: Path, watchdog_config: Path) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(SCRIPTS_DIR), str(REPO_ROOT)]))
+    command = [sys.executable, str(ENTRY_POINTS[name]), "--profile-startup",
+               "--scheduler-config", str(scheduler_config), "--watchdog-config", str(watchdog_config)]
+    started = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, env=env, timeout=120)
+    wall_ms = round((time.perf_counter() - started) * 1000, 1)
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} exited with {result.returncode}: {result.stderr.strip()}")
+    report = json.loads(result.stdout)
+    to_main = report.get("process_to_main_ms") or 0
+    ready = max(report[role]["ready_ms"] for role in ("scheduler", "watchdog") if role in report)
+    return {
+        "wall_ms": wall_ms,
+        "to_main_ms": to_main,
+        "ready_ms": round(to_main + ready, 1),
+        "heavy_modules": report.get("heavy_modules", []),
+        "phases": report.get("phases", {}),
+        "decisions": {role: report[role]["decision"] for role in ("scheduler", "watchdog") if role in report},
+    }
+
+
+def benchmark(name: str, runs: int, configs: tuple[Path, Path], cold: bool) -> dict:
+    samples = []
+    for _ in range(runs):
+        if cold:
+            drop_caches()
+        samples.append(run_once(name, *configs))
+    phases = sorted({phase for sample in samples for phase in sample["phases"]})
+    return {
+        "runs": runs,
+        **{metric: round(statistics.median(s[metric] for s in samples), 1) for metric in METRICS},
+        "phases": {phase: round(statistics.median(s["phases"].get(phase, 0) for s in samples), 1)
+                   for phase in phases},
+        "heavy_modules": sorted({module for s in samples for module in s["heavy_modules"]}),
+        "decisions": samples[-1]["decisions"],
+    }
+
+
+def find_violations(result: dict, budgets: dict[str, float]) -> list[str]:
+    problems = []
+    for name, entry in result["entry_points"].items():
+        for metric, budget in budgets.items():
+            if entry[metric] > budget:
+                problems.append(f"{name}: {metric} {entry[metric]} ms > budget {budget} ms")
+        if entry["heavy_modules"]:
+            problems.append(f"{name}: imported on the startup path: {', '.join(entry['heavy_modules'])}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the kiosk daemons")
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS), help="Comma-separated: scheduler,watchdog,agent")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreter starts per entry point (median is kept)")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="Budget for process start to first decision")
+    parser.add_argument("--wall-budget-ms", type=float, default=2500, help="Budget for spawn to exit, seen from outside")
+    parser.add_argument("--drop-caches", action="store_true", help="Drop the page cache before every run (root only)")
+    parser.add_argument("--output", default=None, help="Write the JSON result here (default: stdout)")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.entry_points.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry points: {', '.join(unknown)}")
+    if args.drop_caches and not drop_caches():
+        print("Cannot drop the page cache (needs root); measuring with a warm cache", file=sys.stderr)
+        args.drop_caches = False
+
+    workdir = Path(tempfile.mkdtemp(prefix="kiosk-startup-"))
+    result = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cold_cache": args.drop_caches,
+        "entry_points": {},
+    }
+    try:
+        configs = write_configs(workdir)
+        for name in names:
+            entry = benchmark(name, args.runs, configs, args.drop_caches)
+            result["entry_points"][name] = entry
+            print(f"[{name}] ready {entry['ready_ms']} ms (to main {entry['to_main_ms']} ms), "
+                  f"wall {entry['wall_ms']} ms", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    payload = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload + "\n", encoding="utf-8")
+    else:
+        print(payload)
+
+    problems = find_violations(result, {"ready_ms": args.budget_ms, "wall_ms": args.wall_budget_ms})
+    for problem in problems:
+        print(f"OVER BUDGET {problem}", file=sys.stderr)
+    if problems:
+        return 1
+    print(f"All entry points within budget ({args.budget_ms:.0f} ms to first decision)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -8,6 +8,8 @@
  * DELETE /api/admin/display_schedule/{id}       - Delete schedule
  * POST   /api/admin/display_schedule/time_slot  - Add/Update time slot
  * DELETE /api/admin/display_schedule/time_slot/{id} - Delete time slot
+ * GET    /api/kijelzo/{id}/schedule             - Get full weekly schedule (ETag / If-None-Match)
+ * GET    /api/kijelzo/schedules?ids=1,2,3       - Get full schedules for many displays (site proxy)
  * GET    /api/kijelzo/{id}/schedule_status      - Get current status
  * POST   /api/kijelzo/{id}/schedule_force_status - Force status (admin only)
  */
@@ -119,6 +121,71 @@ try {
         ]);
     }
     
+    // GET full schedules for many displays in one request (site aggregation proxy)
+    else if ($request_method === 'GET' && preg_match('/kijelzo\/schedules$/', $request_path)) {
+        $ids = array_slice(array_unique(array_filter(array_map('intval', explode(',', $_GET['ids'] ?? '')))), 0, 500);
+        if (empty($ids)) {
+            throw new Exception('Missing ids parameter', 400);
+        }
+        
+        $schedules = [];
+        foreach ($ids as $kijelzo_id) {
+            $schedule = $scheduler->getScheduleForDisplay($kijelzo_id);
+            $payload = [
+                'time_slots' => $schedule['time_slots'] ?? [],
+                'special_days' => $schedule['special_days'] ?? [],
+                'is_active' => $schedule ? (bool)$schedule['is_active'] : false,
+            ];
+            $schedules[(string)$kijelzo_id] = [
+                'version' => sha1(json_encode($payload)),
+                'schedule' => $payload,
+            ];
+        }
+        
+        $etag = '"' . sha1(json_encode($schedules)) . '"';
+        header('ETag: ' . $etag);
+        header('Cache-Control: no-cache');
+        if (trim($_SERVER['HTTP_IF_NONE_MATCH'] ?? '') === $etag) {
+            http_response_code(304);
+            exit;
+        }
+        
+        echo json_encode([
+            'success' => true,
+            'schedules' => $schedules,
+            'timestamp' => date('Y-m-d H:i:s')
+        ]);
+    }
+    
+    // GET full schedule for local evaluation on the kiosk
+    else if ($request_method === 'GET' && preg_match('/kijelzo\/(\d+)\/schedule$/', $request_path, $matches)) {
+        $kijelzo_id = (int)$matches[1];
+        
+        $schedule = $scheduler->getScheduleForDisplay($kijelzo_id);
+        $payload = [
+            'time_slots' => $schedule['time_slots'] ?? [],
+            'special_days' => $schedule['special_days'] ?? [],
+            'is_active' => $schedule ? (bool)$schedule['is_active'] : false,
+        ];
+        $version = sha1(json_encode($payload));
+        $etag = '"' . $version . '"';
+        
+        header('ETag: ' . $etag);
+        header('Cache-Control: no-cache');
+        if (trim($_SERVER['HTTP_IF_NONE_MATCH'] ?? '') === $etag) {
+            http_response_code(304);
+            exit;
+        }
+        
+        echo json_encode([
+            'success' => true,
+            'kijelzo_id' => $kijelzo_id,
+            'version' => $version,
+            'schedule' => $payload,
+            'timestamp' => date('Y-m-d H:i:s')
+        ]);
+    }
+    
     // GET current status
     else if ($request_method === 'GET' && preg_match('/kijelzo\/(\d+)\/schedule_status/', $request_path, $matches)) {
         $kijelzo_id = (int)$matches[1];
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Site Schedule Proxy for EduDisplej
+Fetches the display schedules of a whole site in one bulk request and serves
+them to the site's DisplayScheduler instances over the LAN, so upstream
+traffic scales with the number of sites instead of the number of displays.
+
+Installation (on one kiosk or a local server of the site):
+    1. Copy to /usr/local/bin/edudisplej-schedule-proxy.py
+    2. Copy schedule_proxy.conf to /etc/edudisplej/schedule_proxy.conf
+    3. Create systemd service: /etc/systemd/system/edudisplej-schedule-proxy.service
+    4. On every kiosk of the site set [api] schedule_proxy = http://<proxy-host>:8765
+       in /etc/edudisplej/display_scheduler.conf
+
+Endpoints (same format as the central API):
+    GET /kijelzo/{id}/schedule   - schedule of one display (ETag / If-None-Match)
+    GET /health                  - proxy state as JSON
+"""
+
+import os
+import re
+import json
+import random
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from configparser import ConfigParser
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configuration
+CONFIG_PATH = '/etc/edudisplej/schedule_proxy.conf'
+CACHE_FILE = '/var/lib/edudisplej/schedule_proxy_cache.json'
+
+SCHEDULE_PATH_RE = re.compile(r'^/kijelzo/(\d+)/schedule$')
+MAX_IDS = 500  # the bulk endpoint answers for at most this many IDs
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger('edudisplej-schedule-proxy')
+
+
+class ScheduleStore:
+    """Bulk-refreshed cache of display schedules, shared by all request threads
+
+    Configured IDs are always fetched. IDs learned from LAN requests expire
+    when not requested for `id_ttl` seconds, at most `max_ids` IDs are fetched
+    in total, and registrations wake the refresh no more often than every
+    `registration_delay` seconds, so a client probing IDs cannot turn every
+    new ID into its own bulk request.
+    """
+
+    def __init__(self, upstream_url, ids=None, timeout=10, refresh_interval=300,
+                 backoff_max=900, cache_file=CACHE_FILE, max_ids=MAX_IDS, id_ttl=3600,
+                 registration_delay=10):
+        self.upstream_url = upstream_url.rstrip('/')
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        self.backoff_max = backoff_max
+        self.cache_file = cache_file
+        self.max_ids = max_ids
+        self.id_ttl = id_ttl
+        self.registration_delay = registration_delay
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.ids = set(ids or [])
+        self.last_seen = {}  # ID registered over the LAN -> monotonic time of its last request
+        self.rejected = 0
+        self.last_attempt = float('-inf')
+        self.schedules = {}
+        self.etag = None
+        self.last_refresh = None
+        self.failures = 0
+        self.upstream_requests = 0
+
+    def load_cache(self):
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache: {e}")
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.schedules = cache.get('schedules') or {}
+            for kijelzo_id in sorted(self.schedules, key=int):
+                if kijelzo_id not in self.ids and len(self.ids) + len(self.last_seen) < self.max_ids:
+                    self.last_seen[kijelzo_id] = now
+        logger.info(f"Restored {len(self.schedules)} schedules from cache")
+
+    def save_cache(self):
+        tmp_path = f"{self.cache_file}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with self.lock:
+                data = {'saved_at': datetime.now().isoformat(timespec='seconds'), 'schedules': self.schedules}
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            logger.error(f"Error writing cache: {e}")
+
+    def get(self, kijelzo_id):
+        """Return the cached entry, registering unknown displays for the next refresh"""
+        with self.lock:
+            entry = self.schedules.get(kijelzo_id)
+            if kijelzo_id in self.ids:
+                return entry
+            registered = kijelzo_id in self.last_seen
+            if not registered and len(self.ids) + len(self.last_seen) >= self.max_ids:
+                if not self.rejected:
+                    logger.warning(f"{self.max_ids} displays registered, ignoring further IDs "
+                                   f"(list the site's displays under [proxy] ids)")
+                self.rejected += 1
+                return entry
+            self.last_seen[kijelzo_id] = time.monotonic()
+            if not registered:
+                self.etag = None
+                self.wakeup.set()
+        return entry
+
+    def expire_ids(self):
+        """Forget LAN-registered IDs not requested for id_ttl seconds (lock held)"""
+        cutoff = time.monotonic() - self.id_ttl
+        expired = [kijelzo_id for kijelzo_id, seen in self.last_seen.items() if seen < cutoff]
+        for kijelzo_id in expired:
+            del self.last_seen[kijelzo_id]
+            self.schedules.pop(kijelzo_id, None)
+        if expired:
+            self.etag = None
+            logger.info(f"Expired {len(expired)} displays not requested for {self.id_ttl}s")
+
+    def refresh(self):
+        """Fetch all known schedules in one conditional bulk request; returns True on success"""
+        self.last_attempt = time.monotonic()
+        with self.lock:
+            self.expire_ids()
+            ids = sorted(self.ids | self.last_seen.keys(), key=int)
+            etag = self.etag
+        if not ids:
+            return True
+
+        query = urllib.parse.urlencode({'ids': ','.join(ids)})
+        request = urllib.request.Request(f"{self.upstream_url}/kijelzo/schedules?{query}", headers={
+            'User-Agent': 'EduDisplejScheduleProxy/1.0',
+            'Accept': 'application/json',
+        })
+        if etag:
+            request.add_header('If-None-Match', etag)
+
+        self.upstream_requests += 1
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read().decode('utf-8'))
+                new_etag = response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                self.last_refresh = datetime.now()
+                return True
+            logger.warning(f"Bulk schedule request failed: {e.code}")
+            return False
+        except Exception as e:
+            logger.error(f"Error fetching schedules: {e}")
+            return False
+
+        schedules = payload.get('schedules') if isinstance(payload, dict) else None
+        if not isinstance(schedules, dict):
+            logger.warning("Bulk schedule response has no schedules")
+            return False
+
+        with self.lock:
+            self.schedules.update(schedules)
+            self.etag = new_etag
+        self.last_refresh = datetime.now()
+        logger.info(f"Refreshed {len(schedules)} schedules")
+        self.save_cache()
+        return True
+
+    def run(self):
+        """Refresh loop with jittered interval and exponential backoff on failure"""
+        while True:
+            if self.refresh():
+                self.failures = 0
+                wait = self.refresh_interval * random.uniform(0.9, 1.1)
+            else:
+                self.failures += 1
+                wait = random.uniform(5, min(self.backoff_max, 5 * 2 ** self.failures))
+            if self.wakeup.wait(wait):
+                # New displays registered: let further registrations join the same request
+                time.sleep(max(0.0, self.last_attempt + self.registration_delay - time.monotonic()))
+            self.wakeup.clear()
+
+    def health(self):
+        with self.lock:
+            return {
+                'displays': len(self.ids) + len(self.last_seen),
+                'registered': len(self.last_seen),
+                'rejected': self.rejected,
+                'cached': len(self.schedules),
+                'last_refresh': self.last_refresh.isoformat(timespec='seconds') if self.last_refresh else None,
+                'failures': self.failures,
+                'upstream_requests': self.upstream_requests,
+            }
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    store = None
+    server_version = 'EduDisplejScheduleProxy/1.0'
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, code, data, etag=None):
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path.rstrip('/')
+        if path == '/health':
+            self.send_json(200, self.store.health())
+            return
+
+        match = SCHEDULE_PATH_RE.match(path)
+        if not match:
+            self.send_json(404, {'error': 'Endpoint not found'})
+            return
+
+        kijelzo_id = match.group(1)
+        entry = self.store.get(kijelzo_id)
+        if entry is None:
+            # Not fetched yet: schedulers treat 5xx as temporary and back off
+            self.send_json(503, {'error': 'Schedule not cached yet'})
+            return
+
+        etag = f'"{entry.get("version")}"'
+        if self.headers.get('If-None-Match', '').strip() == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_json(200, {
+            'success': True,
+            'kijelzo_id': int(kijelzo_id),
+            'version': entry.get('version'),
+            'schedule': entry.get('schedule') or {},
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }, etag=etag)
+
+
+def main():
+    config = ConfigParser()
+    config.read(CONFIG_PATH)
+
+    ids = [i.strip() for i in config.get('proxy', 'ids', fallback='').split(',') if i.strip().isdigit()]
+    store = ScheduleStore(
+        config.get('upstream', 'url', fallback='http://admin.edudisplej.sk/api'),
+        ids=ids,
+        timeout=config.getint('upstream', 'timeout', fallback=10),
+        refresh_interval=config.getint('upstream', 'refresh_interval', fallback=300),
+        cache_file=config.get('proxy', 'cache_file', fallback=CACHE_FILE),
+        max_ids=min(config.getint('proxy', 'max_ids', fallback=MAX_IDS), MAX_IDS),
+        id_ttl=config.getint('proxy', 'id_ttl_minutes', fallback=60) * 60,
+        registration_delay=config.getint('proxy', 'registration_delay', fallback=10),
+    )
+    store.load_cache()
+    threading.Thread(target=store.run, name='refresh', daemon=True).start()
+
+    ProxyHandler.store = store
+    listen = config.get('proxy', 'listen', fallback='0.0.0.0')
+    port = config.getint('proxy', 'port', fallback=8765)
+    server = ThreadingHTTPServer((listen, port), ProxyHandler)
+    logger.info(f"Schedule proxy listening on {listen}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Received interrupt signal, shutting down")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,46 +4,560 @@ Display Scheduler Service for Raspberry Pi
 Monitors display schedule and manages content service + HDMI output
 
 Installation:
-    1. Copy to /usr/local/bin/edudisplej-scheduler.py
+    1. Copy to /usr/local/bin/edudisplej-scheduler.py (with edudisplej_logging.py and
+       edudisplej_writes.py next to it)
     2. Create systemd service: /etc/systemd/system/edudisplej-scheduler.service
     3. systemctl enable edudisplej-scheduler
     4. systemctl start edudisplej-scheduler
 
-Logs: /var/log/edudisplej-scheduler.log
+Logs: /var/log/edudisplej-scheduler.log (rotated; see [logging] in display_scheduler.conf)
 """
 
 import os
 import sys
 import json
+import bisect
+import random
 import logging
+import shutil
+import signal
 import subprocess
-import requests
 import time
-from datetime import datetime
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
 from configparser import ConfigParser
 
 # Configuration
 CONFIG_PATH = '/etc/edudisplej/display_scheduler.conf'
 LOG_PATH = '/var/log/edudisplej-scheduler.log'
-STATUS_FILE = '/tmp/edudisplej_display_status'
+STATUS_FILE = '/run/edudisplej/display_status'  # tmpfs, shared with the watchdog
 PID_FILE = '/var/run/edudisplej-scheduler.pid'
+SCHEDULE_CACHE_FILE = '/opt/edudisplej/localweb/modules/display_schedule.json'
 
 # Service names to control
 CONTENT_SERVICE = 'edudisplej-content'
 HDMI_SERVICE = 'edudisplej-hdmi'
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_PATH),
-        logging.StreamHandler()
-    ]
-)
+# Unit state polling while waiting for a transition: D-Bus reads are cheap,
+# every systemctl fallback poll forks a process
+DBUS_POLL_INTERVAL = 0.1
+SYSTEMCTL_POLL_INTERVAL = 0.5
+
+try:
+    import edudisplej_logging
+except ImportError:
+    edudisplej_logging = None
+
+try:
+    import edudisplej_writes
+except ImportError:
+    edudisplej_writes = None
+
 logger = logging.getLogger(__name__)
 
 
+def configure_logging(config_path=CONFIG_PATH):
+    """Queue-based rotating logging from the [logging] section; plain file + console if the shared module is missing"""
+    config = ConfigParser()
+    config.read(config_path)
+    if edudisplej_logging is not None:
+        edudisplej_logging.setup_logging(config, default_path=LOG_PATH,
+                                         kijelzo_id=config.get('display', 'id', fallback=None))
+        return
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(config.get('logging', 'path', fallback=LOG_PATH)),
+            logging.StreamHandler()
+        ]
+    )
+
+
+DAY_SECONDS = 86400
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+
+def parse_time_of_day(value):
+    """'HH:MM[:SS]' -> seconds since midnight; '23:59:59' and '24:00' map to end of day"""
+    parts = [int(p) for p in str(value).strip().split(':')]
+    while len(parts) < 3:
+        parts.append(0)
+    seconds = parts[0] * 3600 + parts[1] * 60 + parts[2]
+    return DAY_SECONDS if seconds >= DAY_SECONDS - 1 else seconds
+
+
+def slot_status(slot):
+    enabled = slot.get('is_enabled', True)
+    if isinstance(enabled, str):
+        enabled = enabled.strip().lower() not in ('0', 'false', '')
+    return 'ACTIVE' if enabled else 'TURNED_OFF'
+
+
+class ScheduleIndex:
+    """Compiled weekly schedule for local ACTIVE/TURNED_OFF evaluation
+
+    Weekly slots are flattened into sorted, non-overlapping segments over the
+    week (seconds since Sunday 00:00, matching day_of_week 0=Sunday), so a
+    lookup is a single bisect. Where slots overlap, the earliest slot of the day
+    wins, like the server's LIMIT 1. A slot whose end is before its start runs
+    past midnight into the next day. Special days override the weekly slots
+    inside their own time window; anything not covered defaults to ACTIVE.
+    """
+
+    def __init__(self, time_slots=None, special_days=None, is_active=True, default='ACTIVE'):
+        self.default = default
+        self.is_active = is_active
+        slots = sorted(time_slots or [], key=lambda s: (int(s.get('day_of_week', 0)), str(s.get('start_time', ''))))
+        self.starts, self.statuses = self._compile_week(slots) if is_active else ([0], [default])
+        self.special = {}
+        for day in (special_days or []) if is_active else []:
+            try:
+                day_value = date.fromisoformat(str(day['date_value'])[:10])
+                window = (parse_time_of_day(day['start_time']), parse_time_of_day(day['end_time']), slot_status(day))
+            except (KeyError, ValueError):
+                continue
+            self.special.setdefault(day_value, []).append(window)
+
+    def _compile_week(self, slots):
+        intervals = []
+        for slot in slots:
+            try:
+                day = int(slot['day_of_week']) % 7
+                start = parse_time_of_day(slot['start_time'])
+                end = parse_time_of_day(slot['end_time'])
+            except (KeyError, ValueError):
+                continue
+            status = slot_status(slot)
+            begin = day * DAY_SECONDS + start
+            finish = day * DAY_SECONDS + end if end > start else (day + 1) * DAY_SECONDS + end
+            if finish > WEEK_SECONDS:
+                intervals.append((begin, WEEK_SECONDS, status))
+                intervals.append((0, finish - WEEK_SECONDS, status))
+            elif finish > begin:
+                intervals.append((begin, finish, status))
+
+        bounds = sorted({0, WEEK_SECONDS} | {b for iv in intervals for b in iv[:2]})
+        starts, statuses = [], []
+        for lo, hi in zip(bounds, bounds[1:]):
+            status = next((st for b, f, st in intervals if b <= lo and hi <= f), self.default)
+            if statuses and statuses[-1] == status:
+                continue
+            starts.append(lo)
+            statuses.append(status)
+        return starts, statuses
+
+    @staticmethod
+    def _week_second(moment):
+        weekday = (moment.weekday() + 1) % 7  # Python Monday=0 -> schedule Sunday=0
+        return weekday * DAY_SECONDS + moment.hour * 3600 + moment.minute * 60 + moment.second
+
+    def status_at(self, moment):
+        seconds = moment.hour * 3600 + moment.minute * 60 + moment.second
+        for start, end, status in self.special.get(moment.date(), ()):
+            if start <= seconds < end:
+                return status
+        return self.statuses[bisect.bisect_right(self.starts, self._week_second(moment)) - 1]
+
+    def _candidate_times(self, moment, horizon_days):
+        midnight = datetime.combine(moment.date(), datetime.min.time())
+        week_start = midnight - timedelta(days=(moment.weekday() + 1) % 7)
+        for week in range(horizon_days // 7 + 2):
+            base = week_start + timedelta(days=7 * week)
+            for start in self.starts:
+                yield base + timedelta(seconds=start)
+        for day_value, windows in self.special.items():
+            day_start = datetime.combine(day_value, datetime.min.time())
+            yield day_start
+            yield day_start + timedelta(days=1)
+            for start, end, _ in windows:
+                yield day_start + timedelta(seconds=start)
+                yield day_start + timedelta(seconds=end)
+
+    def next_transition(self, moment, horizon_days=8):
+        """Return (when, status) of the next state change after `moment`, or (None, None)"""
+        moment = moment.replace(microsecond=0)
+        current = self.status_at(moment)
+        limit = moment + timedelta(days=horizon_days)
+        for candidate in sorted({c for c in self._candidate_times(moment, horizon_days) if moment < c <= limit}):
+            status = self.status_at(candidate)
+            if status != current:
+                return candidate, status
+        return None, None
+
+
+def import_dbus():
+    """python3-dbus, imported only when the D-Bus backend is wanted (None if missing)"""
+    try:
+        import dbus
+    except ImportError:
+        return None
+    return dbus
+
+
+class HttpResponse:
+    """The part of requests.Response the scheduler uses"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class StdlibSession:
+    """Keep-alive GET over http.client, so the boot path imports no third-party HTTP stack
+
+    One connection per scheme/host is kept open between calls. A request on a
+    reused connection that the server has meanwhile closed is retried once on
+    a fresh connection. Proxy environment variables are not honoured; use
+    http_client = requests where a proxy is required.
+    """
+
+    def __init__(self, user_agent):
+        self.headers = {'User-Agent': user_agent, 'Accept': 'application/json'}
+        self.connections = {}
+
+    def _connection(self, scheme, netloc, timeout):
+        key = (scheme, netloc)
+        connection = self.connections.get(key)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(netloc, timeout=timeout)
+            self.connections[key] = connection
+            return connection, False
+        return connection, True
+
+    def _drop(self, scheme, netloc):
+        connection = self.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def get(self, url, headers=None, timeout=5):
+        parts = urllib.parse.urlsplit(url)
+        target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        request_headers = dict(self.headers, **(headers or {}))
+        while True:
+            connection, reused = self._connection(parts.scheme, parts.netloc, timeout)
+            try:
+                connection.request('GET', target, headers=request_headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self._drop(parts.scheme, parts.netloc)
+                if reused:
+                    continue
+                raise
+            except Exception:
+                self._drop(parts.scheme, parts.netloc)
+                raise
+            if response.will_close:
+                self._drop(parts.scheme, parts.netloc)
+            return HttpResponse(response.status, response.headers, content)
+
+
+def create_session(http_client, user_agent):
+    """HTTP session for ApiClient: 'stdlib' (default) or a pooled requests.Session"""
+    if http_client == 'requests':
+        try:
+            import requests
+        except ImportError:
+            logger.warning("requests not installed, using the stdlib HTTP client")
+        else:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = user_agent
+            return session
+    return StdlibSession(user_agent)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the API circuit is open or backing off"""
+
+
+class ApiClient:
+    """Keep-alive HTTP client for the scheduling API
+
+    One keep-alive session (stdlib or requests, see create_session) is reused
+    for every call, so DNS, TCP and TLS setup happen once instead of on every
+    poll. Failures back off exponentially
+    with full jitter. After `failure_threshold` consecutive failures the circuit
+    opens for `reset_timeout` seconds and then lets a single trial request
+    through (half-open). That spreads a fleet's retries out after a server
+    outage instead of having every kiosk hit the server in the same second.
+    """
+
+    def __init__(self, base_url, timeout=5, backoff_base=5, backoff_max=600,
+                 failure_threshold=5, reset_timeout=300, http_client='stdlib'):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        
+        self.session = create_session(http_client, 'EduDisplejScheduler/1.0')
+        
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+        self.circuit_open_until = 0.0
+        self.stats = {
+            'requests': 0,
+            'failures': 0,
+            'not_modified': 0,
+            'skipped': 0,
+            'last_latency_ms': None,
+            'avg_latency_ms': None,
+            'max_latency_ms': 0.0,
+        }
+    
+    @property
+    def circuit_state(self):
+        if self.consecutive_failures < self.failure_threshold:
+            return 'closed'
+        return 'open' if time.monotonic() < self.circuit_open_until else 'half-open'
+    
+    def seconds_until_allowed(self):
+        return max(0.0, max(self.retry_at, self.circuit_open_until) - time.monotonic())
+    
+    def _record_latency(self, started):
+        latency = (time.monotonic() - started) * 1000
+        avg = self.stats['avg_latency_ms']
+        self.stats['last_latency_ms'] = round(latency, 1)
+        self.stats['avg_latency_ms'] = round(latency if avg is None else avg * 0.8 + latency * 0.2, 1)
+        self.stats['max_latency_ms'] = round(max(self.stats['max_latency_ms'], latency), 1)
+    
+    def _record_failure(self):
+        self.stats['failures'] += 1
+        self.consecutive_failures += 1
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** self.consecutive_failures))
+        self.retry_at = time.monotonic() + max(delay, self.backoff_base)
+        if self.consecutive_failures >= self.failure_threshold:
+            self.circuit_open_until = time.monotonic() + self.reset_timeout * random.uniform(1.0, 1.5)
+            if self.consecutive_failures == self.failure_threshold:
+                logger.warning(f"API circuit opened after {self.consecutive_failures} failures")
+    
+    def _record_success(self):
+        if self.consecutive_failures >= self.failure_threshold:
+            logger.info("API circuit closed")
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+        self.circuit_open_until = 0.0
+    
+    def get(self, path, etag=None):
+        """GET base_url + path; raises CircuitOpenError while backing off
+
+        5xx responses and transport errors count as failures; any other
+        response (including 304 and 404) counts as the server being healthy.
+        """
+        if self.seconds_until_allowed() > 0:
+            self.stats['skipped'] += 1
+            raise CircuitOpenError(f"API unavailable, retry in {self.seconds_until_allowed():.0f}s")
+        
+        headers = {'If-None-Match': etag} if etag else {}
+        self.stats['requests'] += 1
+        started = time.monotonic()
+        try:
+            response = self.session.get(f"{self.base_url}{path}", headers=headers, timeout=self.timeout)
+        except Exception:
+            self._record_failure()
+            raise
+        self._record_latency(started)
+        
+        if response.status_code >= 500:
+            self._record_failure()
+        else:
+            self._record_success()
+            if response.status_code == 304:
+                self.stats['not_modified'] += 1
+        return response
+    
+    def snapshot(self):
+        return dict(self.stats, circuit=self.circuit_state, consecutive_failures=self.consecutive_failures)
+
+
+class SystemdControl:
+    """Unit start/stop over the systemd D-Bus API, falling back to sudo systemctl
+
+    The D-Bus path needs python3-dbus and a polkit rule allowing the scheduler
+    user to manage the content unit; without either, every call forks systemctl
+    as before.
+    """
+
+    def __init__(self, backend='auto'):
+        self.manager = None
+        self.bus = None
+        dbus = import_dbus() if backend in ('auto', 'dbus') else None
+        if dbus is not None:
+            try:
+                self.bus = dbus.SystemBus()
+                systemd = self.bus.get_object('org.freedesktop.systemd1', '/org/freedesktop/systemd1')
+                self.manager = dbus.Interface(systemd, 'org.freedesktop.systemd1.Manager')
+            except Exception as e:
+                logger.warning(f"systemd D-Bus unavailable, using systemctl: {e}")
+        elif backend == 'dbus':
+            logger.warning("python3-dbus not installed, using systemctl")
+        self.backend = 'dbus' if self.manager is not None else 'systemctl'
+
+    @staticmethod
+    def unit_name(name):
+        return name if '.' in name else f"{name}.service"
+
+    def control(self, name, action):
+        """Queue a start/stop/restart job; returns True when systemd accepted it"""
+        if self.manager is not None:
+            try:
+                method = {'start': self.manager.StartUnit,
+                          'stop': self.manager.StopUnit,
+                          'restart': self.manager.RestartUnit}[action]
+                method(self.unit_name(name), 'replace')
+                return True
+            except KeyError:
+                logger.error(f"Invalid service action: {action}")
+                return False
+            except Exception as e:
+                logger.warning(f"D-Bus {action} of {name} failed, retrying with systemctl: {e}")
+
+        result = subprocess.run(['sudo', 'systemctl', '--no-block', action, name],
+                                capture_output=True, text=True, timeout=10)
+        if result.returncode != 0:
+            logger.error(f"Service {name} {action} failed: {result.stderr.strip()}")
+        return result.returncode == 0
+
+    def suspend(self, name, frozen):
+        """Freeze or thaw every process of a unit, keeping it resident in memory
+
+        Uses the cgroup freezer (systemd >= 246 with cgroup v2) and falls back
+        to SIGSTOP/SIGCONT for the whole unit where the freezer is unavailable.
+        """
+        if self.manager is not None:
+            try:
+                (self.manager.FreezeUnit if frozen else self.manager.ThawUnit)(self.unit_name(name))
+                return True
+            except Exception as e:
+                logger.debug(f"D-Bus {'freeze' if frozen else 'thaw'} of {name} failed: {e}")
+
+        result = subprocess.run(['sudo', 'systemctl', 'freeze' if frozen else 'thaw', name],
+                                capture_output=True, text=True, timeout=10)
+        if result.returncode == 0:
+            return True
+        signal_name = 'SIGSTOP' if frozen else 'SIGCONT'
+        result = subprocess.run(['sudo', 'systemctl', 'kill', '--kill-who=all', f'--signal={signal_name}', name],
+                                capture_output=True, text=True, timeout=10)
+        if result.returncode != 0:
+            logger.error(f"Service {name} {signal_name} failed: {result.stderr.strip()}")
+        return result.returncode == 0
+
+    def unit_property(self, name, prop):
+        """A property of the systemd Unit interface as a string, or None when it cannot be read over D-Bus"""
+        if self.manager is None:
+            return None
+        try:
+            unit = self.bus.get_object('org.freedesktop.systemd1', self.manager.LoadUnit(self.unit_name(name)))
+            return str(unit.Get('org.freedesktop.systemd1.Unit', prop,
+                                dbus_interface='org.freedesktop.DBus.Properties'))
+        except Exception:
+            return None
+
+    def active_state(self, name):
+        state = self.unit_property(name, 'ActiveState')
+        if state is not None:
+            return state
+        result = subprocess.run(['systemctl', 'is-active', name], capture_output=True, text=True, timeout=5)
+        return result.stdout.strip() or 'unknown'
+
+    def is_frozen(self, name):
+        """True when the unit's cgroup is (being) frozen, e.g. by a scheduler that has since restarted"""
+        state = self.unit_property(name, 'FreezerState')
+        if state is None:
+            result = subprocess.run(['systemctl', 'show', '--property=FreezerState', '--value', name],
+                                    capture_output=True, text=True, timeout=5)
+            state = result.stdout.strip()
+        return state in ('frozen', 'freezing')
+
+    def wait_for_state(self, name, states, timeout=15, poll=None):
+        """Poll ActiveState until it is one of `states`; returns True on success"""
+        if poll is None:
+            poll = DBUS_POLL_INTERVAL if self.manager is not None else SYSTEMCTL_POLL_INTERVAL
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self.active_state(name)
+            if state in states:
+                return True
+            if state == 'failed' or time.monotonic() >= deadline:
+                logger.warning(f"Service {name} is {state}, expected {'/'.join(states)}")
+                return False
+            time.sleep(poll)
+
+
+class HdmiControl:
+    """Display power through the first available backend
+
+    vcgencmd works on the legacy Raspberry Pi firmware driver, xset DPMS on the
+    KMS driver under X (kiosk-start.sh runs X on :0), and cec-ctl switches the
+    TV itself over HDMI-CEC.
+    """
+
+    COMMANDS = {
+        'vcgencmd': (['vcgencmd', 'display_power', '1'], ['vcgencmd', 'display_power', '0']),
+        'xset': (['xset', '-display', ':0', 'dpms', 'force', 'on'], ['xset', '-display', ':0', 'dpms', 'force', 'off']),
+        'cec': (['cec-ctl', '--to', '0', '--image-view-on'], ['cec-ctl', '--to', '0', '--standby']),
+    }
+    BINARIES = {'vcgencmd': 'vcgencmd', 'xset': 'xset', 'cec': 'cec-ctl'}
+
+    def __init__(self, backend='auto'):
+        if backend == 'auto':
+            backend = next((name for name, binary in self.BINARIES.items() if shutil.which(binary)), None)
+        elif backend not in self.COMMANDS:
+            logger.warning(f"Unknown HDMI backend '{backend}', HDMI control disabled")
+            backend = None
+        self.backend = backend
+
+    def set_power(self, on):
+        if self.backend is None:
+            logger.warning("No HDMI backend available")
+            return False
+        cmd = self.COMMANDS[self.backend][0 if on else 1]
+        env = dict(os.environ, DISPLAY=':0') if self.backend == 'xset' else None
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5, env=env)
+        if result.returncode != 0:
+            logger.error(f"HDMI control ({self.backend}) failed: {result.stderr.strip()}")
+        return result.returncode == 0
+
+
+def chromium_renderer_pids():
+    """PIDs of running chromium renderer processes"""
+    pids = set()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        if b'chromium' in cmdline and b'--type=renderer' in cmdline:
+            pids.add(int(entry))
+    return pids
+
+
+def wait_for_first_frame(timeout=30, poll=0.1):
+    """Wait until chromium has a renderer process, the closest cheap signal that
+    content is being painted; returns True once one appears"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if chromium_renderer_pids():
+            return True
+        time.sleep(poll)
+    return False
+
+
 class DisplayScheduler:
     """Manages display scheduling and service control"""
     
@@ -54,17 +568,148 @@ class DisplayScheduler:
         self.api_url = self.config.get('api', 'url', fallback='http://localhost/api')
         self.kijelzo_id = self.config.get('display', 'id', fallback=None)
         self.check_interval = self.config.getint('service', 'check_interval', fallback=60)
+        self.revalidate_interval = self.config.getint('service', 'revalidate_interval', fallback=900)
+        self.schedule_cache_file = self.config.get('service', 'schedule_cache', fallback=SCHEDULE_CACHE_FILE)
+        self.status_file = self.config.get('monitoring', 'status_file', fallback=STATUS_FILE)
+        self.api = self.create_api_client(self.api_url)
+        
+        # Optional site aggregation proxy serving the schedule over the LAN
+        self.schedule_proxy = self.config.get('api', 'schedule_proxy', fallback='').strip()
+        self.schedule_api = self.create_api_client(self.schedule_proxy) if self.schedule_proxy else self.api
+        
+        # Actuation backends and the timing trace of the last transition
+        self.content_service = self.config.get('service', 'content_service', fallback=CONTENT_SERVICE)
+        self.enable_hdmi_control = self.config.getboolean('service', 'enable_hdmi_control', fallback=True)
+        self.service_timeout = self.config.getint('service', 'service_timeout', fallback=15)
+        self.first_frame_timeout = self.config.getint('service', 'first_frame_timeout', fallback=30)
+        self.systemd = SystemdControl(self.config.get('service', 'actuation_backend', fallback='auto'))
+        self.hdmi = HdmiControl(self.config.get('service', 'hdmi_backend', fallback='auto'))
+        self.last_transition = None
+        
+        # Standby: 'stop' ends the content service while off, 'freeze' keeps it
+        # resident but suspended; either way it is warmed up warmup_lead seconds
+        # before the next ACTIVE edge
+        self.standby_mode = self.config.get('service', 'standby_mode', fallback='freeze').strip().lower()
+        self.warmup_lead = self.config.getint('service', 'warmup_lead', fallback=120)
+        self.frozen = False
+        self.prewarmed = False
+        self.prewarm_edge = None
         
         self.current_status = None
         self.previous_status = None
         
-        logger.info(f"DisplayScheduler initialized: kijelzo_id={self.kijelzo_id}")
+        # Locally evaluated schedule (None until downloaded; legacy polling if unsupported)
+        self.schedule = None
+        self.schedule_etag = None
+        self.schedule_version = None
+        self.schedule_supported = True
+        self.next_revalidate = 0.0
+        
+        logger.info(f"DisplayScheduler initialized: kijelzo_id={self.kijelzo_id}, "
+                    f"service={self.systemd.backend}, hdmi={self.hdmi.backend if self.enable_hdmi_control else 'disabled'}")
+    
+    def create_api_client(self, base_url):
+        return ApiClient(
+            base_url,
+            timeout=self.config.getint('api', 'timeout', fallback=5),
+            backoff_base=self.config.getint('api', 'backoff_base', fallback=5),
+            backoff_max=self.config.getint('api', 'backoff_max', fallback=600),
+            failure_threshold=self.config.getint('api', 'circuit_failure_threshold', fallback=5),
+            reset_timeout=self.config.getint('api', 'circuit_reset_timeout', fallback=300),
+            http_client=self.config.get('api', 'http_client', fallback='stdlib').strip().lower(),
+        )
+    
+    def fetch_schedule(self):
+        """Download the full schedule, revalidating with If-None-Match
+
+        Returns True if a usable schedule is loaded afterwards.
+        """
+        # Jitter the revalidation so a fleet does not revalidate in lockstep
+        self.next_revalidate = time.monotonic() + self.revalidate_interval * random.uniform(0.9, 1.1)
+        etag = self.schedule_etag if self.schedule else None
+        try:
+            response = self.schedule_api.get(f"/kijelzo/{self.kijelzo_id}/schedule", etag=etag)
+            
+            if response.status_code == 304:
+                logger.debug("Schedule unchanged (304)")
+                return True
+            if response.status_code == 404:
+                logger.warning("Schedule endpoint not available, falling back to status polling")
+                self.schedule_supported = False
+                return False
+            if response.status_code != 200:
+                logger.warning(f"Schedule request failed: {response.status_code}")
+                return self.schedule is not None
+            
+            data = response.json()
+            self.load_schedule(data, response.headers.get('ETag'))
+            self.save_schedule_cache(data, self.schedule_etag)
+            return True
+        except CircuitOpenError as e:
+            logger.debug(str(e))
+        except Exception as e:
+            logger.error(f"Error fetching schedule: {e}")
+        self.next_revalidate = min(self.next_revalidate, time.monotonic() + self.schedule_api.seconds_until_allowed())
+        return self.schedule is not None
+    
+    def load_schedule(self, data, etag=None):
+        """Compile a schedule payload into the in-memory interval index"""
+        payload = data.get('schedule') or {}
+        self.schedule = ScheduleIndex(
+            payload.get('time_slots'),
+            payload.get('special_days'),
+            is_active=bool(payload.get('is_active', True)),
+        )
+        self.schedule_etag = etag
+        self.schedule_version = data.get('version')
+        logger.info(f"Schedule loaded: version={self.schedule_version}, segments={len(self.schedule.starts)}")
+    
+    def save_schedule_cache(self, data, etag=None):
+        """Persist the last known schedule atomically (write temp file, fsync, rename)"""
+        cache = {
+            'kijelzo_id': self.kijelzo_id,
+            'version': data.get('version'),
+            'etag': etag,
+            'saved_at': datetime.now().isoformat(timespec='seconds'),
+            'schedule': data.get('schedule') or {},
+        }
+        try:
+            os.makedirs(os.path.dirname(self.schedule_cache_file), exist_ok=True)
+            if edudisplej_writes is not None:
+                edudisplej_writes.atomic_write(self.schedule_cache_file, cache, fsync=True)
+                return
+            tmp_path = f"{self.schedule_cache_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.schedule_cache_file)
+        except Exception as e:
+            logger.error(f"Error writing schedule cache: {e}")
+    
+    def load_schedule_cache(self):
+        """Load the last known schedule from disk; returns True if one was loaded"""
+        try:
+            with open(self.schedule_cache_file) as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable schedule cache: {e}")
+            return False
+        
+        if str(cache.get('kijelzo_id')) != str(self.kijelzo_id):
+            logger.warning("Ignoring schedule cache of a different display")
+            return False
+        
+        self.load_schedule(cache, cache.get('etag'))
+        logger.info(f"Schedule restored from cache (saved {cache.get('saved_at')})")
+        return True
     
     def get_schedule_status(self):
         """Fetch current schedule status from API"""
         try:
-            endpoint = f"{self.api_url}/kijelzo/{self.kijelzo_id}/schedule_status"
-            response = requests.get(endpoint, timeout=5)
+            response = self.api.get(f"/kijelzo/{self.kijelzo_id}/schedule_status")
             
             if response.status_code == 200:
                 data = response.json()
@@ -73,6 +718,9 @@ class DisplayScheduler:
                 logger.warning(f"API request failed: {response.status_code}")
                 return None
                 
+        except CircuitOpenError as e:
+            logger.debug(str(e))
+            return None
         except Exception as e:
             logger.error(f"Error fetching schedule status: {e}")
             return None
@@ -80,15 +728,10 @@ class DisplayScheduler:
     def control_service(self, service_name, action):
         """Start, stop, or restart a systemd service"""
         try:
-            cmd = ['sudo', 'systemctl', action, service_name]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                logger.info(f"Service {service_name} {action} successful")
+            if self.systemd.control(service_name, action):
+                logger.info(f"Service {service_name} {action} queued")
                 return True
-            else:
-                logger.error(f"Service {service_name} {action} failed: {result.stderr}")
-                return False
+            return False
                 
         except Exception as e:
             logger.error(f"Error controlling service {service_name}: {e}")
@@ -98,65 +741,197 @@ class DisplayScheduler:
         """Control HDMI output
         
         action: 'on' or 'off'
-        Uses vcgencmd on Raspberry Pi to control HDMI
+        Uses the configured HDMI backend (vcgencmd, xset DPMS or CEC)
         """
+        if not self.enable_hdmi_control:
+            return True
+        if action not in ('on', 'off'):
+            logger.error(f"Invalid HDMI action: {action}")
+            return False
         try:
-            if action == 'on':
-                cmd = ['vcgencmd', 'display_power', '1']
-            elif action == 'off':
-                cmd = ['vcgencmd', 'display_power', '0']
-            else:
-                logger.error(f"Invalid HDMI action: {action}")
-                return False
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-            
-            if result.returncode == 0:
+            if self.hdmi.set_power(action == 'on'):
                 logger.info(f"HDMI turned {action}")
                 return True
-            else:
-                logger.error(f"HDMI control failed: {result.stderr}")
-                return False
+            return False
                 
         except Exception as e:
             logger.error(f"Error controlling HDMI: {e}")
             return False
     
+    def prewarm(self, edge):
+        """Bring the content service up behind a blanked display before the ACTIVE edge"""
+        if self.prewarmed or self.current_status != 'TURNED_OFF':
+            return
+        self.prewarm_edge = edge
+        started = time.monotonic()
+        ok = self.thaw_content()
+        if ok is None:
+            ok = self.control_service(self.content_service, 'start')
+            ok = ok and self.systemd.wait_for_state(self.content_service, ('active',), timeout=self.service_timeout)
+            ok = ok and wait_for_first_frame(timeout=self.first_frame_timeout)
+        self.prewarmed = ok
+        duration_ms = round((time.monotonic() - started) * 1000)
+        logger.info(f"Content service pre-warm {'done' if ok else 'failed'} in {duration_ms} ms",
+                    extra={'state': 'PREWARM', 'duration_ms': duration_ms})
+    
+    def thaw_content(self):
+        """Thaw the content unit if frozen; True/False for the thaw, None when it needs a start instead"""
+        # A frozen unit counts as active, so starting it would leave it frozen
+        if not (self.frozen or self.systemd.is_frozen(self.content_service)):
+            return None
+        ok = self.systemd.suspend(self.content_service, False)
+        self.frozen = not ok
+        if self.systemd.active_state(self.content_service) == 'active':
+            return ok
+        # Stopped while frozen, e.g. recycled by a standalone watchdog
+        self.frozen = False
+        return None
+    
+    def next_prewarm(self):
+        """(monotonic pre-warm time, ACTIVE edge) for the next switch-on, or (None, None)
+
+        Each edge is attempted once, so a failed pre-warm falls back to a
+        normal start at the edge instead of being retried in a tight loop.
+        """
+        if self.schedule is None or self.prewarmed or self.current_status != 'TURNED_OFF':
+            return None, None
+        now = datetime.now()
+        when, status = self.schedule.next_transition(now)
+        if when is None or status != 'ACTIVE' or when == self.prewarm_edge:
+            return None, None
+        return time.monotonic() + (when - now).total_seconds() - self.warmup_lead, when
+    
+    def revisit_prewarm(self):
+        """Return a pre-warmed content service to standby when its ACTIVE edge is gone
+
+        The edge can move (schedule revalidated, special day) or pass with the
+        display still off. A new edge within warmup_lead keeps the pre-warm.
+        """
+        if not self.prewarmed or self.current_status != 'TURNED_OFF' or self.schedule is None:
+            return
+        now = datetime.now()
+        when, status = self.schedule.next_transition(now)
+        if when == self.prewarm_edge and status == 'ACTIVE':
+            return
+        if status == 'ACTIVE' and when is not None and (when - now).total_seconds() <= self.warmup_lead:
+            self.prewarm_edge = when
+            return
+        logger.info(f"ACTIVE edge {self.prewarm_edge} no longer due, returning the pre-warmed content service to standby",
+                    extra={'state': 'TURNED_OFF'})
+        self.prewarmed = False
+        self.prewarm_edge = None
+        self.apply_status('TURNED_OFF')
+        self.update_status_file(self.current_status)
+    
     def apply_status(self, status):
-        """Apply status: start/stop services and control HDMI"""
+        """Apply status: start/stop (or thaw/freeze) services and control HDMI
+        
+        The service job and the display power change run concurrently. The
+        timing trace (milliseconds since the decision) is kept in
+        self.last_transition and written to the status file. With
+        standby_mode = freeze the content service is suspended rather than
+        stopped, and a pre-warmed service only needs the display powered on.
+        """
         logger.info(f"Applying status: {status}")
         
-        if status == 'ACTIVE':
-            # Start content service
-            self.control_service(CONTENT_SERVICE, 'start')
-            # Turn on HDMI
-            self.control_hdmi('on')
-            logger.info("Display activated: service started, HDMI on")
-            
-        elif status == 'TURNED_OFF':
-            # Stop content service
-            self.control_service(CONTENT_SERVICE, 'stop')
-            # Turn off HDMI
-            self.control_hdmi('off')
-            logger.info("Display turned off: service stopped, HDMI off")
-            
-        else:
+        if status not in ('ACTIVE', 'TURNED_OFF'):
             logger.warning(f"Unknown status: {status}")
             return False
         
-        return True
+        decided = time.monotonic()
+        trace = {'status': status, 'decided_at': datetime.now().isoformat(timespec='milliseconds'),
+                 'standby_mode': self.standby_mode, 'prewarmed': self.prewarmed}
+        
+        def elapsed_ms():
+            return round((time.monotonic() - decided) * 1000)
+        
+        def resume_service():
+            if self.prewarmed:
+                return True
+            thawed = self.thaw_content()
+            if thawed is not None:
+                return thawed
+            already_rendering = bool(chromium_renderer_pids())
+            ok = self.control_service(self.content_service, 'start')
+            ok = ok and self.systemd.wait_for_state(self.content_service, ('active',), timeout=self.service_timeout)
+            trace['service_ms'] = elapsed_ms() if ok else None
+            if ok and not already_rendering:
+                trace['first_frame_ms'] = elapsed_ms() if wait_for_first_frame(timeout=self.first_frame_timeout) else None
+            return ok
+        
+        def standby_service():
+            if self.standby_mode == 'freeze' and self.systemd.active_state(self.content_service) == 'active':
+                self.frozen = self.systemd.suspend(self.content_service, True)
+                if self.frozen:
+                    return True
+                logger.warning("Freezing the content service failed, stopping it instead")
+            ok = self.control_service(self.content_service, 'stop')
+            return ok and self.systemd.wait_for_state(self.content_service, ('inactive', 'failed'),
+                                                      timeout=self.service_timeout)
+        
+        def actuate_service():
+            ok = resume_service() if status == 'ACTIVE' else standby_service()
+            trace.setdefault('service_ms', elapsed_ms() if ok else None)
+            if ok and status == 'ACTIVE':
+                trace.setdefault('first_frame_ms', trace['service_ms'])
+            return ok
+        
+        def actuate_hdmi():
+            ok = self.control_hdmi('on' if status == 'ACTIVE' else 'off')
+            trace['hdmi_ms'] = elapsed_ms() if ok else None
+            return ok
+        
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='actuate') as pool:
+            service_future = pool.submit(actuate_service)
+            hdmi_future = pool.submit(actuate_hdmi)
+            service_ok = service_future.result()
+            hdmi_ok = hdmi_future.result()
+        
+        self.prewarmed = False
+        trace['total_ms'] = elapsed_ms()
+        trace['ok'] = service_ok and hdmi_ok
+        self.last_transition = trace
+        
+        if status == 'ACTIVE':
+            logger.info(f"Display activated in {trace['total_ms']} ms "
+                        f"(service {trace.get('service_ms')} ms, HDMI {trace.get('hdmi_ms')} ms, "
+                        f"first frame {trace.get('first_frame_ms')} ms)",
+                        extra={'state': status, 'duration_ms': trace['total_ms']})
+        else:
+            logger.info(f"Display turned off in {trace['total_ms']} ms "
+                        f"(service {'frozen' if self.frozen else 'stopped'}, HDMI {trace.get('hdmi_ms')} ms)",
+                        extra={'state': status, 'duration_ms': trace['total_ms']})
+        
+        return trace['ok']
+    
+    def state(self):
+        """Display state as shared with the watchdog (status file or agent)"""
+        return {
+            'status': self.current_status,
+            'standby': 'frozen' if self.frozen else ('prewarmed' if self.prewarmed else None),
+        }
     
     def update_status_file(self, status):
-        """Write current status to file for monitoring"""
+        """Write current status to the (tmpfs) status file for monitoring"""
         try:
             status_data = {
                 'kijelzo_id': self.kijelzo_id,
                 'status': status,
                 'timestamp': datetime.now().isoformat(),
-                'uptime': self.get_uptime()
+                'uptime': self.get_uptime(),
+                'schedule_version': self.schedule_version,
+                'api': self.schedule_api.snapshot(),
+                'standby': self.state()['standby'],
+                'last_transition': self.last_transition
             }
             
-            with open(STATUS_FILE, 'w') as f:
+            os.makedirs(os.path.dirname(self.status_file), exist_ok=True)
+            if edudisplej_writes is not None:
+                # Atomic, so the watchdog never reads a half-written file; fsync only off tmpfs
+                status_data['writes'] = edudisplej_writes.STATS.snapshot()
+                edudisplej_writes.atomic_write(self.status_file, status_data)
+                return
+            with open(self.status_file, 'w') as f:
                 json.dump(status_data, f, indent=2)
                 
         except Exception as e:
@@ -171,17 +946,52 @@ class DisplayScheduler:
         except:
             return 0
     
+    def current_schedule_status(self):
+        """Status from the local schedule, revalidated periodically; legacy API polling otherwise"""
+        if self.schedule_supported and (self.schedule is None or time.monotonic() >= self.next_revalidate):
+            self.fetch_schedule()
+        if self.schedule is not None:
+            return self.schedule.status_at(datetime.now())
+        if self.schedule_supported:
+            return None
+        return self.get_schedule_status()
+    
+    def seconds_until_next_check(self):
+        """Sleep exactly until the next transition or revalidation, whichever is first"""
+        if self.schedule is None:
+            return self.schedule_api.seconds_until_allowed() or self.check_interval
+        now = datetime.now()
+        wait = max(0.0, self.next_revalidate - time.monotonic())
+        when, _ = self.schedule.next_transition(now)
+        if when is not None:
+            wait = min(wait, (when - now).total_seconds())
+        prewarm_at, _ = self.next_prewarm()
+        if prewarm_at is not None:
+            wait = min(wait, prewarm_at - time.monotonic())
+        return max(wait, 0.0)
+    
     def check_and_apply(self):
         """Check schedule and apply status if changed"""
-        status = self.get_schedule_status()
+        status = self.current_schedule_status()
         
         if status is None:
             logger.warning("Could not fetch schedule status, keeping current state")
             return
         
+        self.apply_if_changed(status)
+        
+        self.revisit_prewarm()
+        
+        prewarm_at, edge = self.next_prewarm()
+        if prewarm_at is not None and prewarm_at <= time.monotonic():
+            self.prewarm(edge)
+            self.update_status_file(self.current_status)
+    
+    def apply_if_changed(self, status):
+        """Apply and record a status if it differs from the current one"""
         # Status changed
         if status != self.current_status:
-            logger.info(f"Status changed: {self.current_status} -> {status}")
+            logger.info(f"Status changed: {self.current_status} -> {status}", extra={'state': status})
             self.previous_status = self.current_status
             self.current_status = status
             
@@ -191,8 +1001,14 @@ class DisplayScheduler:
             # Update status file
             self.update_status_file(status)
     
-    def run(self):
-        """Main loop"""
+    def first_decision(self):
+        """(status, source) the startup would act on, without actuating anything"""
+        if self.load_schedule_cache():
+            return self.schedule.status_at(datetime.now()), 'cache'
+        return self.current_schedule_status(), 'api'
+    
+    def start(self):
+        """PID file, then the state from the cached schedule before touching the network"""
         logger.info(f"Starting display scheduler (check interval: {self.check_interval}s)")
         
         # Write PID file
@@ -202,27 +1018,61 @@ class DisplayScheduler:
         except:
             pass
         
+        # The content unit may still be frozen by a previous scheduler process
+        try:
+            self.frozen = self.systemd.is_frozen(self.content_service)
+        except Exception as e:
+            logger.warning(f"Cannot read the freezer state of {self.content_service}: {e}")
+        
+        try:
+            if self.load_schedule_cache():
+                self.next_revalidate = 0.0
+                self.apply_if_changed(self.schedule.status_at(datetime.now()))
+        except Exception as e:
+            logger.error(f"Error applying cached schedule: {e}")
+    
+    def step(self):
+        """One scheduling iteration; returns the seconds to wait before the next one"""
+        try:
+            self.check_and_apply()
+            return self.seconds_until_next_check()
+        except Exception as e:
+            logger.error(f"Error in main loop: {e}")
+            return self.check_interval
+    
+    def stop(self):
+        """Cleanup on shutdown"""
+        try:
+            os.remove(PID_FILE)
+        except:
+            pass
+    
+    def run(self):
+        """Main loop (standalone; edudisplej_agent.py drives start/step/stop from asyncio)"""
+        self.start()
         try:
             while True:
-                try:
-                    self.check_and_apply()
-                except Exception as e:
-                    logger.error(f"Error in main loop: {e}")
-                
-                time.sleep(self.check_interval)
+                time.sleep(self.step())
                 
         except KeyboardInterrupt:
             logger.info("Received interrupt signal, shutting down")
         except Exception as e:
             logger.error(f"Fatal error in main loop: {e}")
         finally:
-            # Cleanup
-            try:
-                os.remove(PID_FILE)
-            except:
-                pass
+            self.stop()
 
 
 if __name__ == '__main__':
+    try:
+        import edudisplej_agent
+    except ImportError:
+        edudisplej_agent = None
+    if edudisplej_agent is not None:
+        # Compatibility entry point: the agent running only the scheduling task
+        sys.exit(edudisplej_agent.main(['--roles', 'scheduler'] + sys.argv[1:], scheduler_module=sys.modules[__name__]))
+    
+    # systemctl stop sends SIGTERM: exit through the normal cleanup and log flush
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    configure_logging()
     scheduler = DisplayScheduler()
     scheduler.run()
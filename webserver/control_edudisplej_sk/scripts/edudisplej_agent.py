@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+EduDisplej kiosk agent: display scheduling and chromium supervision in one process
+
+Runs the DisplayScheduler (edudisplej-scheduler.py) and the ProcessWatchdog
+(edudisplej_watchdog.py) as tasks on one asyncio event loop, instead of two
+interpreters with their own sleep loops:
+    scheduling      - schedule evaluation, service and HDMI actuation
+    supervision     - chromium exit detection (pidfd watched by the loop) and restarts
+    health sampling - metrics ring buffer and the memory leak policy
+
+The tasks share state directly: supervision does not restart chromium while
+the scheduler keeps the display TURNED_OFF, and a leak recycle during standby
+puts the content service back into standby. Blocking work (HTTP, systemctl,
+/proc scans) runs in worker threads; scheduler actuation and watchdog
+restarts never overlap.
+
+Installation:
+    1. Copy to /usr/local/bin/edudisplej_agent.py, next to edudisplej-scheduler.py,
+       edudisplej_watchdog.py, edudisplej_logging.py and edudisplej_writes.py
+    2. Copy agent.conf to /etc/edudisplej/agent.conf (optional)
+    3. Install edudisplej-agent.service and enable it instead of
+       edudisplej-scheduler and edudisplej-watchdog
+
+The old entry points keep working: with this file installed next to them,
+edudisplej-scheduler.py and edudisplej_watchdog.py run the agent with only
+their own role (and their own config and log file).
+
+Startup profiling (any entry point, nothing is actuated):
+    edudisplej-scheduler.py --profile-startup
+    edudisplej_agent.py --profile-startup
+prints JSON with the time from process start to main(), module import and
+init times, and the time until each role has made its first decision.
+tests/kiosk_startup_bench.py holds these numbers to a budget.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+import argparse
+import importlib.util
+from configparser import ConfigParser
+
+# Configuration
+CONFIG_PATH = '/etc/edudisplej/agent.conf'
+LOG_PATH = '/var/log/edudisplej/agent.log'
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROLES = ('scheduler', 'watchdog')
+# Third-party modules that must stay off the startup path (reported by --profile-startup)
+HEAVY_MODULES = ('requests', 'urllib3', 'charset_normalizer', 'chardet', 'idna', 'dbus')
+
+try:
+    import edudisplej_logging
+except ImportError:
+    edudisplej_logging = None
+
+logger = logging.getLogger('edudisplej-agent')
+
+
+def load_scheduler_module(path=None):
+    """Import edudisplej-scheduler.py (the hyphenated file name needs importlib)"""
+    path = path or os.path.join(SCRIPT_DIR, 'edudisplej-scheduler.py')
+    spec = importlib.util.spec_from_file_location('edudisplej_scheduler', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_watchdog_module():
+    import edudisplej_watchdog
+    return edudisplej_watchdog
+
+
+def configure_logging(config, roles, scheduler_module=None, watchdog_module=None,
+                      scheduler_config=None, watchdog_config=None):
+    """A single role logs like the daemon it replaces; the combined agent uses [logging] of agent.conf"""
+    if roles == ['scheduler']:
+        scheduler_module.configure_logging(scheduler_config or scheduler_module.CONFIG_PATH)
+    elif roles == ['watchdog']:
+        watchdog_module.configure_logging(watchdog_config or watchdog_module.CONFIG_PATH)
+    elif edudisplej_logging is not None:
+        edudisplej_logging.setup_logging(config, default_path=LOG_PATH)
+    else:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.FileHandler(config.get('logging', 'path', fallback=LOG_PATH)),
+                logging.StreamHandler()
+            ]
+        )
+
+
+class KioskAgent:
+    """Scheduling, supervision and health sampling as tasks on one event loop"""
+
+    def __init__(self, scheduler=None, watchdog=None, watchdog_module=None):
+        self.scheduler = scheduler
+        self.watchdog = watchdog
+        self.wd = watchdog_module
+        self.actuation = None
+
+    async def scheduling(self):
+        # The lock covers the whole step (including the schedule download), so a
+        # restart decision always sees the outcome of the transition
+        async with self.actuation:
+            await asyncio.to_thread(self.scheduler.start)
+        while True:
+            async with self.actuation:
+                wait = await asyncio.to_thread(self.scheduler.step)
+            await asyncio.sleep(wait)
+
+    async def wait_for_exit(self, timeout):
+        """ProcessSupervisor.wait_for_exit() without blocking: the loop watches the pidfd"""
+        supervisor = self.watchdog.supervisor
+        if supervisor.pid is None:
+            return True
+        loop = asyncio.get_running_loop()
+        fd = supervisor.fileno()
+        if fd is None:
+            deadline = loop.time() + timeout
+            while supervisor.is_alive() and loop.time() < deadline:
+                await asyncio.sleep(min(self.wd.MISSING_RECHECK_INTERVAL, deadline - loop.time()))
+            return supervisor.wait_for_exit(0)
+
+        exited = loop.create_future()
+        loop.add_reader(fd, lambda: exited.done() or exited.set_result(True))
+        try:
+            await asyncio.wait_for(exited, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(fd)
+        return supervisor.wait_for_exit(0)
+
+    def recheck_after_exit(self):
+        """True if the process came back by itself or was restarted (or is off by schedule)"""
+        return self.watchdog.is_process_running() or self.watchdog.restart_if_expected()
+
+    async def supervision(self):
+        wd, watchdog = self.wd, self.watchdog
+        consecutive_failures = 0
+        while True:
+            try:
+                if await asyncio.to_thread(watchdog.is_process_running):
+                    consecutive_failures = 0
+                    watchdog.held_off = False
+                    if await self.wait_for_exit(wd.CHECK_INTERVAL):
+                        logger.warning(f"Process {wd.PROCESS_NAME} exited, re-checking in {wd.EXIT_GRACE_PERIOD}s")
+                        watchdog.leak_policy.reset()
+                        await asyncio.sleep(wd.EXIT_GRACE_PERIOD)
+                        async with self.actuation:
+                            recovered = await asyncio.to_thread(self.recheck_after_exit)
+                        if not recovered:
+                            logger.critical("Restart failed. Waiting before retry...")
+                            await asyncio.sleep(wd.RESTART_RETRY_DELAY)
+                else:
+                    async with self.actuation:
+                        consecutive_failures, restart_failed = await asyncio.to_thread(
+                            watchdog.handle_missing, consecutive_failures)
+                    await asyncio.sleep(wd.RESTART_RETRY_DELAY if restart_failed else wd.MISSING_RECHECK_INTERVAL)
+            except Exception as e:
+                logger.error(f"Supervision error: {e}")
+                await asyncio.sleep(wd.CHECK_INTERVAL)
+
+    def sample_health(self):
+        """Health sample and leak policy; a recycle during standby is followed by standby again"""
+        watchdog, scheduler = self.watchdog, self.scheduler
+        last_recycle = watchdog.leak_policy.last_recycle
+        watchdog.sample_metrics()
+        recycled = watchdog.leak_policy.last_recycle != last_recycle and not watchdog.leak_policy.dry_run
+        if recycled and scheduler is not None and scheduler.current_status == 'TURNED_OFF' and not scheduler.prewarmed:
+            logger.info("Display process recycled during standby, re-applying TURNED_OFF")
+            scheduler.frozen = False
+            scheduler.apply_status('TURNED_OFF')
+            scheduler.update_status_file(scheduler.current_status)
+
+    async def health_sampling(self):
+        while True:
+            await asyncio.sleep(self.watchdog.metrics.seconds_until_due())
+            try:
+                async with self.actuation:
+                    await asyncio.to_thread(self.sample_health)
+            except Exception as e:
+                logger.error(f"Health sampling error: {e}")
+                await asyncio.sleep(self.wd.CHECK_INTERVAL)
+
+    def shutdown(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self.watchdog is not None:
+            self.watchdog.metrics.flush()
+
+    async def run(self):
+        """Run until SIGTERM/SIGINT; returns the process exit code"""
+        self.actuation = asyncio.Lock()
+        tasks = []
+        if self.scheduler is not None:
+            tasks.append(asyncio.create_task(self.scheduling(), name='scheduling'))
+        if self.watchdog is not None:
+            logger.info(f"Monitoring process: {self.wd.PROCESS_NAME} "
+                        f"(supervision backend: {self.watchdog.supervisor.backend})")
+            tasks.append(asyncio.create_task(self.supervision(), name='supervision'))
+            tasks.append(asyncio.create_task(self.health_sampling(), name='health-sampling'))
+
+        loop = asyncio.get_running_loop()
+        stopping = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopping.set)
+        stopper = asyncio.create_task(stopping.wait(), name='signals')
+
+        exit_code = 0
+        try:
+            done, _ = await asyncio.wait(tasks + [stopper], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stopper and not task.cancelled() and task.exception() is not None:
+                    logger.error(f"Task {task.get_name()} failed: {task.exception()}")
+                    exit_code = 1
+            if stopper in done:
+                logger.info("Received stop signal, shutting down")
+        finally:
+            for task in tasks + [stopper]:
+                task.cancel()
+            await asyncio.gather(*tasks, stopper, return_exceptions=True)
+            self.shutdown()
+        return exit_code
+
+
+def process_age_ms():
+    """Milliseconds since this process was started (from /proc; 10 ms resolution), or None"""
+    try:
+        with open('/proc/self/stat') as f:
+            stat = f.read()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        start_ticks = int(stat[stat.rindex(')') + 2:].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round((uptime - start_ticks / os.sysconf('SC_CLK_TCK')) * 1000)
+
+
+def profile_startup(roles, scheduler_module=None, watchdog_module=None,
+                    scheduler_config=None, watchdog_config=None):
+    """--profile-startup: time imports, init and each role's first decision; actuates nothing"""
+    report = {'roles': roles, 'python': sys.version.split()[0], 'process_to_main_ms': process_age_ms(), 'phases': {}}
+    main_started = time.perf_counter()
+
+    def since_main_ms():
+        return round((time.perf_counter() - main_started) * 1000, 1)
+
+    def timed(name, func):
+        started = time.perf_counter()
+        result = func()
+        report['phases'][name] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    scheduler = None
+    if 'scheduler' in roles:
+        if scheduler_module is None:
+            scheduler_module = timed('import_scheduler', load_scheduler_module)
+        scheduler = timed('scheduler_init', lambda: scheduler_module.DisplayScheduler(
+            scheduler_config or scheduler_module.CONFIG_PATH))
+        status, source = timed('scheduler_first_decision', scheduler.first_decision)
+        report['scheduler'] = {'decision': status, 'source': source, 'ready_ms': since_main_ms()}
+    if 'watchdog' in roles:
+        if watchdog_module is None:
+            watchdog_module = timed('import_watchdog', load_watchdog_module)
+        watchdog = timed('watchdog_init', lambda: watchdog_module.ProcessWatchdog(
+            scheduler_state=scheduler.state if scheduler else None,
+            config_path=watchdog_config or watchdog_module.CONFIG_PATH))
+        decision = timed('watchdog_first_decision', watchdog.first_decision)
+        timed('watchdog_first_sample', lambda: watchdog.metrics.sample(watchdog.supervisor.pid, 0))
+        report['watchdog'] = {'decision': decision, 'ready_ms': since_main_ms()}
+
+    report['modules_loaded'] = len(sys.modules)
+    report['heavy_modules'] = sorted(name for name in HEAVY_MODULES if name in sys.modules)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def main(argv=None, scheduler_module=None, watchdog_module=None):
+    parser = argparse.ArgumentParser(description='EduDisplej kiosk agent (scheduler + watchdog)')
+    parser.add_argument('--config', default=CONFIG_PATH, help='Agent configuration file')
+    parser.add_argument('--roles', default=None,
+                        help='Comma-separated roles to run: scheduler,watchdog (default: [agent] roles)')
+    parser.add_argument('--scheduler-config', default=None,
+                        help='Scheduler configuration (default: [agent] scheduler_config or the scheduler default)')
+    parser.add_argument('--watchdog-config', default=None,
+                        help='Watchdog configuration (default: [agent] watchdog_config or the watchdog default)')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Report import and time-to-first-decision as JSON, then exit without actuating')
+    args = parser.parse_args(argv)
+
+    config = ConfigParser()
+    config.read(args.config)
+    roles_text = args.roles or config.get('agent', 'roles', fallback=','.join(ROLES))
+    roles = [role.strip() for role in roles_text.split(',') if role.strip()]
+    unknown = [role for role in roles if role not in ROLES]
+    if unknown or not roles:
+        parser.error(f"unknown roles: {', '.join(unknown) or '(none)'}; choose from {', '.join(ROLES)}")
+
+    scheduler_config = args.scheduler_config or config.get('agent', 'scheduler_config', fallback=None)
+    watchdog_config = args.watchdog_config or config.get('agent', 'watchdog_config', fallback=None)
+
+    if args.profile_startup:
+        logging.basicConfig(level=logging.WARNING, format='%(name)s - %(levelname)s - %(message)s')
+        return profile_startup(roles, scheduler_module, watchdog_module, scheduler_config, watchdog_config)
+
+    if 'scheduler' in roles and scheduler_module is None:
+        scheduler_module = load_scheduler_module()
+    if 'watchdog' in roles and watchdog_module is None:
+        watchdog_module = load_watchdog_module()
+    configure_logging(config, roles, scheduler_module, watchdog_module, scheduler_config, watchdog_config)
+
+    scheduler = None
+    if 'scheduler' in roles:
+        scheduler = scheduler_module.DisplayScheduler(scheduler_config or scheduler_module.CONFIG_PATH)
+    watchdog = None
+    if 'watchdog' in roles:
+        watchdog = watchdog_module.ProcessWatchdog(scheduler_state=scheduler.state if scheduler else None,
+                                                   config_path=watchdog_config or watchdog_module.CONFIG_PATH)
+    if scheduler is not None and edudisplej_logging is not None and len(roles) > 1:
+        edudisplej_logging.set_context(kijelzo_id=scheduler.kijelzo_id)
+
+    logger.info(f"EduDisplej agent started (roles: {', '.join(roles)}, pid {os.getpid()})")
+    agent = KioskAgent(scheduler, watchdog, watchdog_module)
+    return asyncio.run(agent.run())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
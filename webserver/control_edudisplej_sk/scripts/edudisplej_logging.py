@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Shared logging setup for the EduDisplej kiosk daemons (scheduler, watchdog)
+
+Log calls only put the record on an in-memory queue; a single listener thread
+formats and writes it, so the control loops never block on SD card I/O.
+The file is rotated by size, and writes to it are batched: records are
+flushed every flush_interval seconds, or immediately from WARNING upwards,
+and each batch reaches the file with a single write.
+
+Installation:
+    Copy next to the daemons: /usr/local/bin/edudisplej_logging.py
+
+Configuration ([logging] section of the daemon's config file):
+    level          = INFO
+    path           = /var/log/edudisplej-scheduler.log
+    max_size       = 10        # MB per file before rotation
+    backup_count   = 5
+    format         = text      # text or json (one object per line)
+    output         = auto      # auto, file, journal or both
+    flush_interval = 30        # seconds; 0 writes every record immediately
+
+output = auto writes the file only and sends WARNING and above to the journal
+when the daemon runs under systemd, so routine lines are not stored twice.
+output = journal keeps nothing on the SD card besides what journald stores.
+
+Structured fields: every record carries the fields passed to set_context()
+(e.g. kijelzo_id); per-call fields go through `extra`, e.g.
+    logger.info("Display activated", extra={'state': 'ACTIVE', 'duration_ms': 840})
+"""
+
+import os
+import sys
+import json
+import atexit
+import logging
+import threading
+import logging.handlers
+from queue import SimpleQueue
+from datetime import datetime
+
+try:
+    from edudisplej_writes import STATS as WRITE_STATS
+except ImportError:  # write accounting is optional
+    WRITE_STATS = None
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+JOURNAL_FORMAT = '%(name)s - %(levelname)s - %(message)s'  # journald adds its own timestamp
+BUFFER_CAPACITY = 200
+
+_STANDARD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+_context = {}
+_listener = None
+
+
+def set_context(**fields):
+    """Fields attached to every following record (None removes a field)"""
+    for key, value in fields.items():
+        if value is None:
+            _context.pop(key, None)
+        else:
+            _context[key] = value
+
+
+def record_fields(record):
+    """Context and `extra` fields of a record"""
+    fields = dict(_context)
+    fields.update((key, value) for key, value in record.__dict__.items() if key not in _STANDARD_ATTRS)
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message plus structured fields"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        data.update(record_fields(record))
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The daemons' usual line format with structured fields appended as key=value"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += ' [' + ' '.join(f"{key}={value}" for key, value in fields.items()) + ']'
+        return line
+
+
+class BatchFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file handler that writes a whole buffered batch with a single flush
+
+    StreamHandler flushes after every record; inside handle_batch() that is
+    deferred to one flush at the end. Every real flush is counted in the
+    shared write statistics (edudisplej_writes.STATS) when available.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batching = False
+        self.pending_bytes = 0
+        self.last_line = None
+
+    def format(self, record):
+        # shouldRollover() formats the record as well; the line is counted once,
+        # by the flush StreamHandler.emit() runs right after writing it
+        self.last_line = super().format(record)
+        return self.last_line
+
+    def flush(self):
+        if self.last_line is not None:
+            self.pending_bytes += len((self.last_line + self.terminator).encode(self.encoding or 'utf-8', 'replace'))
+            self.last_line = None
+        if self.batching:
+            return
+        super().flush()
+        if self.pending_bytes and WRITE_STATS is not None:
+            WRITE_STATS.record(self.baseFilename, self.pending_bytes)
+        self.pending_bytes = 0
+
+    def handle_batch(self, records):
+        self.acquire()
+        try:
+            self.batching = True
+            try:
+                for record in records:
+                    self.handle(record)
+            finally:
+                self.batching = False
+            self.flush()
+        finally:
+            self.release()
+
+
+class BatchMemoryHandler(logging.handlers.MemoryHandler):
+    """MemoryHandler that hands its buffer to the target as one batch"""
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.target is not None and self.buffer:
+                self.target.handle_batch(self.buffer)
+                self.buffer.clear()
+        finally:
+            self.release()
+
+
+class PeriodicFlush(threading.Thread):
+    """Flushes a buffering handler at a fixed interval so quiet periods still reach the disk"""
+
+    def __init__(self, handler, interval):
+        super().__init__(name='log-flush', daemon=True)
+        self.handler = handler
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.handler.flush()
+
+
+def under_journal():
+    """True when stderr is connected to journald (systemd sets JOURNAL_STREAM)"""
+    stream = os.environ.get('JOURNAL_STREAM')
+    if not stream:
+        return False
+    try:
+        stat = os.fstat(sys.stderr.fileno())
+    except (OSError, ValueError):
+        return False
+    return stream == f"{stat.st_dev}:{stat.st_ino}"
+
+
+def build_handlers(level, path, max_size_mb, backup_count, fmt, output, flush_interval, text_format):
+    formatter = JsonFormatter() if fmt == 'json' else TextFormatter(text_format)
+    journal = under_journal()
+    if output == 'auto':
+        output = 'file' if journal else 'both'
+    handlers = []
+    flusher = None
+
+    if output in ('file', 'both') and path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        file_handler = BatchFileHandler(
+            path, maxBytes=int(max_size_mb * 1024 * 1024), backupCount=backup_count, delay=True,
+        )
+        file_handler.setFormatter(formatter)
+        if flush_interval > 0:
+            buffered = BatchMemoryHandler(
+                BUFFER_CAPACITY, flushLevel=logging.WARNING, target=file_handler, flushOnClose=True,
+            )
+            flusher = PeriodicFlush(buffered, flush_interval)
+            handlers.append(buffered)
+        else:
+            handlers.append(file_handler)
+
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter(JOURNAL_FORMAT if journal else text_format))
+    if output in ('journal', 'both'):
+        handlers.append(console)
+    elif journal:
+        # File-only under systemd: still surface problems in journalctl / systemctl status
+        console.setLevel(logging.WARNING)
+        handlers.append(console)
+
+    for handler in handlers:
+        if handler.level == logging.NOTSET:
+            handler.setLevel(level)
+    return handlers, flusher
+
+
+def setup_logging(config=None, section='logging', default_path=None, default_level='INFO',
+                  text_format=TEXT_FORMAT, **context):
+    """Install the queue-based logging backend on the root logger
+
+    config is a ConfigParser (or None for defaults); context fields are
+    attached to every record. Safe to call again: the previous listener is
+    stopped and replaced.
+    """
+    global _listener
+
+    def option(name, fallback, getter='get'):
+        if config is None:
+            return fallback
+        return getattr(config, getter)(section, name, fallback=fallback)
+
+    level = getattr(logging, str(option('level', default_level)).upper(), logging.INFO)
+    handlers, flusher = build_handlers(
+        level,
+        option('path', default_path),
+        option('max_size', 10.0, 'getfloat'),
+        option('backup_count', 5, 'getint'),
+        str(option('format', 'text')).strip().lower(),
+        str(option('output', 'auto')).strip().lower(),
+        option('flush_interval', 30.0, 'getfloat'),
+        text_format,
+    )
+
+    shutdown()
+    queue = SimpleQueue()
+    _listener = logging.handlers.QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.flusher = flusher
+    _listener.start()
+    if flusher is not None:
+        flusher.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(queue))
+    root.setLevel(level)
+    set_context(**context)
+    return _listener
+
+
+def shutdown():
+    """Drain the queue and flush buffered records (registered with atexit)"""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    if listener.flusher is not None:
+        listener.flusher.stopped.set()
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+        target = getattr(handler, 'target', None)
+        if target is not None:
+            target.close()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Write coalescing for the EduDisplej kiosk daemons
+
+Volatile state (display status, metrics) lives in tmpfs under /run/edudisplej
+and is written there atomically; copies that must survive a reboot are written
+to the SD card far less often, and on shutdown. Repeated updates between two
+flushes collapse into one write, and unchanged content is not written at all.
+
+Every write is counted per storage class (volatile = tmpfs/ramfs, persistent
+= anything else) so the SD card write volume can be followed over time:
+    STATS.snapshot() -> {'persistent': {'writes': .., 'bytes': ..}, 'volatile': {...}, ...}
+
+Installation:
+    Copy next to the daemons: /usr/local/bin/edudisplej_writes.py
+"""
+
+import os
+import json
+import hashlib
+import threading
+import time
+
+RUNTIME_DIR = '/run/edudisplej'  # RuntimeDirectory= of the service units (tmpfs)
+VOLATILE_FS_TYPES = {'tmpfs', 'ramfs'}
+
+
+def _mount_points():
+    mounts = []
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3:
+                    mounts.append((parts[1].replace('\\040', ' '), parts[2]))
+    except OSError:
+        pass
+    # Longest mount point first, so the innermost mount wins
+    return sorted(mounts, key=lambda m: len(m[0]), reverse=True)
+
+
+_MOUNTS = None
+_volatile_cache = {}
+
+
+def is_volatile(path):
+    """True if `path` is on a RAM-backed filesystem"""
+    global _MOUNTS
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in _volatile_cache:
+        if _MOUNTS is None:
+            _MOUNTS = _mount_points()
+        fs_type = next((fs for mount, fs in _MOUNTS
+                        if directory == mount or directory.startswith(mount.rstrip('/') + '/')), None)
+        _volatile_cache[directory] = fs_type in VOLATILE_FS_TYPES
+    return _volatile_cache[directory]
+
+
+def runtime_path(name, fallback_dir):
+    """Path under RUNTIME_DIR when it is usable, otherwise under fallback_dir"""
+    try:
+        os.makedirs(RUNTIME_DIR, exist_ok=True)
+    except OSError:
+        pass
+    if os.access(RUNTIME_DIR, os.W_OK):
+        return os.path.join(RUNTIME_DIR, name)
+    return os.path.join(fallback_dir, name)
+
+
+class WriteStats:
+    """Thread-safe write counters per storage class and per file"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.totals = {'persistent': {'writes': 0, 'bytes': 0}, 'volatile': {'writes': 0, 'bytes': 0}}
+        self.files = {}
+        self.skipped_unchanged = 0
+        self.coalesced = 0
+
+    def record(self, path, size, writes=1):
+        storage = 'volatile' if is_volatile(path) else 'persistent'
+        with self.lock:
+            self.totals[storage]['writes'] += writes
+            self.totals[storage]['bytes'] += size
+            entry = self.files.setdefault(path, {'storage': storage, 'writes': 0, 'bytes': 0})
+            entry['writes'] += writes
+            entry['bytes'] += size
+
+    def snapshot(self):
+        with self.lock:
+            hours = max((time.time() - self.started) / 3600.0, 1e-6)
+            persistent = self.totals['persistent']
+            return {
+                'persistent': dict(persistent),
+                'volatile': dict(self.totals['volatile']),
+                'persistent_kb_per_hour': round(persistent['bytes'] / 1024.0 / hours, 1),
+                'skipped_unchanged': self.skipped_unchanged,
+                'coalesced': self.coalesced,
+                'files': {path: dict(entry) for path, entry in self.files.items()},
+            }
+
+
+STATS = WriteStats()
+
+
+def encode(data):
+    if callable(data):
+        data = data()
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def atomic_write(path, data, fsync=None, stats=STATS):
+    """Write-temp-then-rename; fsync defaults to on for persistent storage only"""
+    payload = encode(data)
+    if fsync is None:
+        fsync = not is_volatile(path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if stats is not None:
+        stats.record(path, len(payload))
+    return len(payload)
+
+
+class CoalescingWriter:
+    """Keeps the latest content per file in memory and writes it out in batches
+
+    put() only records the content (bytes, str, JSON-serialisable data, or a
+    callable producing one of those at flush time). flush() writes every file
+    that changed since its last write; files registered with persist_path are
+    also copied to that (SD card) path every persist_interval seconds and on
+    close(). Flushing is driven either by start() (background thread) or by
+    calling maybe_flush() from the daemon's own loop.
+    """
+
+    def __init__(self, interval=30, persist_interval=6 * 3600, stats=STATS):
+        self.interval = interval
+        self.persist_interval = persist_interval
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.digests = {}
+        self.persistent = {}
+        self.next_flush = time.monotonic() + interval
+        self.next_persist = time.monotonic() + persist_interval
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def put(self, path, data, persist_path=None):
+        with self.lock:
+            if path in self.pending:
+                self.stats.coalesced += 1
+            self.pending[path] = (data, persist_path)
+
+    def _write(self, path, payload):
+        digest = hashlib.sha1(payload).digest()
+        if self.digests.get(path) == digest:
+            self.stats.skipped_unchanged += 1
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atomic_write(path, payload, stats=self.stats)
+        self.digests[path] = digest
+
+    def flush(self, persist=False):
+        """Write pending files now; persist=True also refreshes their persistent copies"""
+        now = time.monotonic()
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.next_flush = now + self.interval
+            persist = persist or now >= self.next_persist
+            if persist:
+                self.next_persist = now + self.persist_interval
+
+        errors = []
+        for path, (data, persist_path) in pending.items():
+            try:
+                payload = encode(data)
+                self._write(path, payload)
+            except Exception as e:
+                # Keep the content for the next attempt unless it was replaced meanwhile
+                with self.lock:
+                    self.pending.setdefault(path, (data, persist_path))
+                errors.append(f"{path}: {e}")
+                continue
+            if persist_path:
+                self.persistent[persist_path] = payload
+
+        if persist:
+            for persist_path, payload in list(self.persistent.items()):
+                try:
+                    self._write(persist_path, payload)
+                except Exception as e:
+                    errors.append(f"{persist_path}: {e}")
+        if errors:
+            raise OSError(f"Could not write {'; '.join(errors)}")
+
+    def maybe_flush(self):
+        if time.monotonic() >= self.next_flush:
+            self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(max(0.0, self.next_flush - time.monotonic())):
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='state-flush', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Final flush including persistent copies (call on shutdown)"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush(persist=True)
@@ -16,6 +16,12 @@ LOOP_FILE="${MODULES_DIR}/loop.json"
 LOOP_PLAYER="${LOCAL_WEB_DIR}/loop_player.html"
 TOKEN_FILE="${CONFIG_DIR}/lic/token"
 ASSETS_DIR="${LOCAL_WEB_DIR}/assets"
+ASSET_PREFETCH_SCRIPT="${CONFIG_DIR}/init/edudisplej_asset_prefetch.py"
+ASSET_PREFETCH_WORKERS="${EDUDISPLEJ_PREFETCH_WORKERS:-4}"
+ASSET_PREFETCH_MAX_RATE_KIB="${EDUDISPLEJ_PREFETCH_MAX_RATE_KIB:-0}"   # 0 = unlimited
+ASSET_PREFETCH_WINDOW="${EDUDISPLEJ_PREFETCH_WINDOW:-}"                # e.g. "15:30-07:00,12:00-12:45"; empty = always
+DELTA_SYNC_SCRIPT="${CONFIG_DIR}/init/edudisplej_delta_sync.py"
+DELTA_CONTENT_CHANGED=1
 
 # Logging - all output to stderr to avoid interfering with function return values
 log() {
@@ -382,6 +388,15 @@ if loop_file.exists() and loop_file.is_file():
                     if rel.startswith('module-cache/'):
                         keep_asset_rel_files.add(rel)
 
+# The prefetch manifest and the partial downloads it tracks belong to the cache itself
+keep_asset_rel_files.add('module-cache/manifest.json')
+try:
+    manifest = json.loads((assets_dir / 'module-cache' / 'manifest.json').read_text(encoding='utf-8'))
+    for temp_name in (manifest.get('partials') or {}):
+        keep_asset_rel_files.add(f'module-cache/{temp_name}')
+except Exception:
+    pass
+
 managed_roots = [assets_dir / 'meal-menu', assets_dir / 'module-cache']
 for managed_root in managed_roots:
     if not managed_root.exists() or not managed_root.is_dir():
@@ -567,6 +582,11 @@ prefetch_loop_assets_and_meal_json() {
         return 1
     fi
 
+    if [ ! -f "$ASSET_PREFETCH_SCRIPT" ]; then
+        log_error "Asset prefetch script not found: $ASSET_PREFETCH_SCRIPT"
+        return 1
+    fi
+
     local token
     token=$(get_api_token) || {
         log_error "Asset prefetch skipped: missing API token"
@@ -576,407 +596,57 @@ prefetch_loop_assets_and_meal_json() {
     mkdir -p "$ASSETS_DIR"
 
     local prefetch_output
-    if ! prefetch_output=$(python3 - "$LOOP_FILE" "$ASSETS_DIR" "$API_BASE_URL" "$token" <<'PY'
-import datetime
-import hashlib
-import json
-import mimetypes
-import os
-import sys
-import urllib.error
-import urllib.parse
-import urllib.request
-from pathlib import Path
-
-loop_file = Path(sys.argv[1])
-assets_dir = Path(sys.argv[2])
-api_base = sys.argv[3].rstrip('/')
-token = sys.argv[4]
-
-try:
-    data = json.loads(loop_file.read_text(encoding='utf-8', errors='ignore'))
-except Exception as exc:
-    print(f'failed_to_parse_loop:{exc}')
-    raise SystemExit(1)
-
-def as_bool(value, default=False):
-    if value is None:
-        return default
-    if isinstance(value, bool):
-        return value
-    text = str(value).strip().lower()
-    if text in {'1', 'true', 'yes', 'on'}:
-        return True
-    if text in {'0', 'false', 'no', 'off'}:
-        return False
-    return default
-
-def as_int(value, default=0):
-    try:
-        return int(value)
-    except Exception:
-        return default
-
-def iter_loop_items(root_data):
-    direct = root_data.get('loop')
-    if isinstance(direct, list):
-        for item in direct:
-            if isinstance(item, dict):
-                yield item
-
-    offline_plan = root_data.get('offline_plan')
-    if not isinstance(offline_plan, dict):
-        return
-
-    base_loop = offline_plan.get('base_loop')
-    if isinstance(base_loop, list):
-        for item in base_loop:
-            if isinstance(item, dict):
-                yield item
-
-    time_blocks = offline_plan.get('time_blocks')
-    if isinstance(time_blocks, list):
-        for block in time_blocks:
-            if not isinstance(block, dict):
-                continue
-            loops = block.get('loops')
-            if not isinstance(loops, list):
-                continue
-            for item in loops:
-                if isinstance(item, dict):
-                    yield item
-
-def parse_json_list(raw_value):
-    try:
-        parsed = json.loads(str(raw_value or '[]'))
-    except Exception:
-        return []
-    return parsed if isinstance(parsed, list) else []
-
-def canonical_asset_source(raw_url):
-    absolute = absolutize_asset_url(raw_url)
-    if not absolute:
-        return ''
-
-    parsed = urllib.parse.urlparse(absolute)
-    query_pairs = []
-    for key, value in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True):
-        if key.lower() == 'token':
-            continue
-        query_pairs.append((key, value))
-    query = urllib.parse.urlencode(sorted(query_pairs))
-    return urllib.parse.urlunparse((parsed.scheme, parsed.netloc, parsed.path, '', query, ''))
-
-def absolutize_asset_url(raw_url):
-    raw = str(raw_url or '').strip()
-    if not raw:
-        return ''
-    if raw.startswith('http://') or raw.startswith('https://'):
-        return raw
-    return urllib.parse.urljoin(api_base + '/', raw)
-
-def build_request(url, method='GET'):
-    return urllib.request.Request(url, headers={
-        'Authorization': f'Bearer {token}',
-        'User-Agent': 'EduDisplejSync/1.0 (+asset-prefetch)',
-        'Accept': '*/*'
-    }, method=method)
-
-def extract_header(headers, name, default=''):
-    value = headers.get(name, default)
-    return str(value or '').strip()
-
-def head_asset(remote_url):
-    request = build_request(remote_url, method='HEAD')
-    try:
-        with urllib.request.urlopen(request, timeout=15) as response:
-            headers = response.headers
-            size_text = extract_header(headers, 'Content-Length') or extract_header(headers, 'X-Asset-Size')
-            sha256 = extract_header(headers, 'X-Asset-Sha256').lower()
-            content_type = extract_header(headers, 'Content-Type').split(';', 1)[0].strip().lower()
-            size = int(size_text) if size_text.isdigit() else 0
-            return {
-                'size': size,
-                'sha256': sha256,
-                'content_type': content_type,
-            }
-    except Exception:
-        return None
-
-def compute_sha256(file_path):
-    digest = hashlib.sha256()
-    with file_path.open('rb') as handle:
-        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
-            digest.update(chunk)
-    return digest.hexdigest().lower()
-
-def guess_extension(source_url, content_type=''):
-    parsed = urllib.parse.urlparse(source_url)
-    suffix = Path(parsed.path).suffix.strip()
-    if suffix:
-        return suffix.lower()
-
-    mapped = mimetypes.guess_extension(content_type or '', strict=False)
-    if mapped:
-        return mapped.lower()
-
-    return '.bin'
-
-asset_cache_root = assets_dir / 'module-cache'
-asset_cache_root.mkdir(parents=True, exist_ok=True)
-asset_cache = {}
-media_assets_found = 0
-media_assets_downloaded = 0
-media_assets_reused = 0
-media_assets_failed = 0
-
-def localize_asset(raw_url):
-    global media_assets_downloaded, media_assets_reused, media_assets_failed
-
-    canonical_source = canonical_asset_source(raw_url)
-    if not canonical_source:
-        return str(raw_url or '').strip(), False
-
-    if canonical_source in asset_cache:
-        cached_rel = asset_cache[canonical_source]
-        if cached_rel:
-            return f'../../assets/{cached_rel}', True
-        return str(raw_url or '').strip(), False
-
-    remote_url = absolutize_asset_url(raw_url)
-    metadata = head_asset(remote_url)
-    extension = guess_extension(canonical_source, (metadata or {}).get('content_type', ''))
-    rel_path = f"module-cache/{hashlib.sha1(canonical_source.encode('utf-8')).hexdigest()[:24]}{extension}"
-    local_path = assets_dir / rel_path
-    local_path.parent.mkdir(parents=True, exist_ok=True)
-
-    if local_path.exists() and local_path.is_file() and metadata:
-        local_size = local_path.stat().st_size
-        remote_size = int(metadata.get('size') or 0)
-        remote_sha = str(metadata.get('sha256') or '').lower()
-        size_matches = remote_size > 0 and local_size == remote_size
-        if size_matches:
-            if remote_sha:
-                try:
-                    if compute_sha256(local_path) == remote_sha:
-                        asset_cache[canonical_source] = rel_path
-                        media_assets_reused += 1
-                        return f'../../assets/{rel_path}', True
-                except Exception:
-                    pass
-            else:
-                asset_cache[canonical_source] = rel_path
-                media_assets_reused += 1
-                return f'../../assets/{rel_path}', True
-
-    request = build_request(remote_url, method='GET')
-    try:
-        with urllib.request.urlopen(request, timeout=60) as response:
-            content_type = extract_header(response.headers, 'Content-Type').split(';', 1)[0].strip().lower()
-            if extension == '.bin':
-                extension = guess_extension(canonical_source, content_type)
-                rel_path = f"module-cache/{hashlib.sha1(canonical_source.encode('utf-8')).hexdigest()[:24]}{extension}"
-                local_path = assets_dir / rel_path
-                local_path.parent.mkdir(parents=True, exist_ok=True)
-
-            temp_path = local_path.with_suffix(local_path.suffix + '.tmp')
-            with temp_path.open('wb') as handle:
-                while True:
-                    chunk = response.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    handle.write(chunk)
-            os.replace(temp_path, local_path)
-            asset_cache[canonical_source] = rel_path
-            media_assets_downloaded += 1
-            return f'../../assets/{rel_path}', True
-    except Exception:
-        media_assets_failed += 1
-        if local_path.exists() and local_path.is_file():
-            asset_cache[canonical_source] = rel_path
-            media_assets_reused += 1
-            return f'../../assets/{rel_path}', True
-        asset_cache[canonical_source] = ''
-        return str(raw_url or '').strip(), False
-
-def localize_media_settings(settings, module_key):
-    global media_assets_found
-
-    normalized_key = str(module_key or '').strip().lower()
-    if normalized_key == 'pdf':
-        raw = str(settings.get('pdfAssetUrl') or '').strip()
-        if raw:
-            media_assets_found += 1
-            localized, success = localize_asset(raw)
-            if success:
-                settings['pdfAssetUrl'] = localized
-        return
-
-    if normalized_key == 'video':
-        raw = str(settings.get('videoAssetUrl') or '').strip()
-        if raw:
-            media_assets_found += 1
-            localized, success = localize_asset(raw)
-            if success:
-                settings['videoAssetUrl'] = localized
-        return
-
-    if normalized_key in {'gallery', 'image-gallery', 'image_gallery'}:
-        localized_images = []
-        for raw in parse_json_list(settings.get('imageUrlsJson')):
-            value = str(raw or '').strip()
-            if not value:
-                continue
-            media_assets_found += 1
-            localized, success = localize_asset(value)
-            localized_images.append(localized if success else value)
-        settings['imageUrlsJson'] = json.dumps(localized_images, ensure_ascii=False)
-        return
-
-for item in iter_loop_items(data):
-    settings = item.get('settings')
-    if not isinstance(settings, dict):
-        continue
-    localize_media_settings(settings, item.get('module_key'))
-
-def fetch_meal_payload(config, target_date, exact_date=False):
-    query = {
-        'action': 'menu',
-        'site_key': config['site_key'],
-        'institution_id': str(config['institution_id']),
-        'date': target_date,
-        'exact_date': '1' if exact_date else '0',
-        'show_breakfast': '1' if config['show_breakfast'] else '0',
-        'show_snack_am': '1' if config['show_snack_am'] else '0',
-        'show_lunch': '1' if config['show_lunch'] else '0',
-        'show_snack_pm': '1' if config['show_snack_pm'] else '0',
-        'show_dinner': '1' if config['show_dinner'] else '0',
-        'source_type': config['source_type'],
-    }
-    if config['company_id'] > 0:
-        query['company_id'] = str(config['company_id'])
-
-    url = f"{api_base}/api/meal_plan.php?{urllib.parse.urlencode(query)}"
-    request = urllib.request.Request(url, headers={
-        'Authorization': f'Bearer {token}',
-        'User-Agent': 'EduDisplejSync/1.0 (+meal-prefetch)',
-        'Accept': 'application/json, text/plain, */*'
-    })
-    try:
-        with urllib.request.urlopen(request, timeout=12) as response:
-            payload = json.loads(response.read().decode('utf-8', errors='ignore'))
-    except (urllib.error.URLError, TimeoutError, json.JSONDecodeError, urllib.error.HTTPError):
-        return None
-
-    if not isinstance(payload, dict) or payload.get('success') is not True:
-        return None
-    data = payload.get('data')
-    return data if isinstance(data, dict) else None
-
-meal_groups = {}
-meal_items_found = 0
-
-for item in iter_loop_items(data):
-    module_key = str(item.get('module_key') or '').strip().lower()
-    if module_key not in {'meal-menu', 'meal_menu'}:
-        continue
-
-    settings = item.get('settings')
-    if not isinstance(settings, dict):
-        continue
-
-    meal_items_found += 1
-    config = {
-        'company_id': as_int(settings.get('companyId'), 0),
-        'site_key': str(settings.get('siteKey') or 'jedalen.sk').strip() or 'jedalen.sk',
-        'institution_id': as_int(settings.get('institutionId'), 0),
-        'source_type': 'manual' if str(settings.get('sourceType') or 'server').strip().lower() == 'manual' else 'server',
-        'show_breakfast': as_bool(settings.get('showBreakfast'), True),
-        'show_snack_am': as_bool(settings.get('showSnackAm'), True),
-        'show_lunch': as_bool(settings.get('showLunch'), True),
-        'show_snack_pm': as_bool(settings.get('showSnackPm'), False),
-        'show_dinner': as_bool(settings.get('showDinner'), False),
-        'layout_mode': str(settings.get('layoutMode') or 'classic').strip().lower() or 'classic',
-        'show_tomorrow_square': as_bool(settings.get('showTomorrowInSquare'), True),
-    }
-
-    if config['institution_id'] <= 0:
-        continue
+    if ! prefetch_output=$(python3 "$ASSET_PREFETCH_SCRIPT" "$LOOP_FILE" "$ASSETS_DIR" "$API_BASE_URL" "$token" \
+        --workers "$ASSET_PREFETCH_WORKERS" --max-rate-kib "$ASSET_PREFETCH_MAX_RATE_KIB" \
+        --window "$ASSET_PREFETCH_WINDOW"); then
+        log_error "Asset prefetch failed"
+        return 1
+    fi
 
-    fingerprint = json.dumps(config, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
-    key = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:14]
-    if key not in meal_groups:
-        meal_groups[key] = {'config': config, 'settings_refs': []}
-    meal_groups[key]['settings_refs'].append(settings)
-
-today_date = datetime.date.today().isoformat()
-tomorrow_date = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
-meal_assets_root = assets_dir / 'meal-menu'
-meal_assets_root.mkdir(parents=True, exist_ok=True)
-
-prefetched_groups = 0
-prefetched_files = 0
-patched_settings = 0
-
-for key, group in meal_groups.items():
-    config = group['config']
-    target_dir = meal_assets_root / key
-    target_dir.mkdir(parents=True, exist_ok=True)
-
-    today_payload = fetch_meal_payload(config, today_date, exact_date=False)
-    tomorrow_payload = None
-    if config['layout_mode'] == 'square_dual_day' and config['show_tomorrow_square']:
-        tomorrow_payload = fetch_meal_payload(config, tomorrow_date, exact_date=True)
-
-    today_rel = ''
-    tomorrow_rel = ''
-
-    if isinstance(today_payload, dict):
-        (target_dir / 'today.json').write_text(json.dumps(today_payload, ensure_ascii=False, indent=2), encoding='utf-8')
-        today_rel = f"../../assets/meal-menu/{key}/today.json"
-        prefetched_files += 1
-
-    if isinstance(tomorrow_payload, dict):
-        (target_dir / 'tomorrow.json').write_text(json.dumps(tomorrow_payload, ensure_ascii=False, indent=2), encoding='utf-8')
-        tomorrow_rel = f"../../assets/meal-menu/{key}/tomorrow.json"
-        prefetched_files += 1
-
-    if not today_rel and not tomorrow_rel:
-        continue
+    log "Asset prefetch summary: $prefetch_output"
+    log_success "Loop asset prefetch + meal JSON cache completed"
+    return 0
+}
 
-    prefetched_groups += 1
-    saved_at = datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
+# Apply the loop payload as a delta against the stored loop.json
+# (only changed entries, modules and assets are processed; see edudisplej_delta_sync.py)
+delta_sync_loop() {
+    local device_id="$1"
+    local loop_response="$2"
 
-    inline_prefetched = None
-    if config['layout_mode'] == 'square_dual_day':
-        inline_prefetched = {
-            'today': today_payload if isinstance(today_payload, dict) else None,
-            'tomorrow': tomorrow_payload if isinstance(tomorrow_payload, dict) else None,
-        }
-    elif isinstance(today_payload, dict):
-        inline_prefetched = today_payload
+    if [ "${EDUDISPLEJ_FULL_SYNC:-0}" = "1" ]; then
+        log "Full sync requested (EDUDISPLEJ_FULL_SYNC=1) - delta sync skipped"
+        return 1
+    fi
 
-    for settings in group['settings_refs']:
-        settings['offlinePrefetchedTodayFile'] = today_rel
-        settings['offlinePrefetchedTomorrowFile'] = tomorrow_rel
-        settings['offlinePrefetchedMenuSavedAt'] = saved_at
-        if inline_prefetched is not None:
-            settings['offlinePrefetchedMenuData'] = inline_prefetched
-        patched_settings += 1
+    if ! command -v python3 >/dev/null 2>&1 || [ ! -f "$DELTA_SYNC_SCRIPT" ]; then
+        log "Delta sync not available - using full download"
+        return 1
+    fi
 
-loop_file.write_text(json.dumps(data, ensure_ascii=False, indent=4), encoding='utf-8')
-print(
-    f"media_refs={media_assets_found} media_downloaded={media_assets_downloaded} media_reused={media_assets_reused} media_failed={media_assets_failed} "
-    f"meal_items={meal_items_found} groups={len(meal_groups)} prefetched_groups={prefetched_groups} files={prefetched_files} patched={patched_settings}"
-)
-PY
-    ); then
-        log_error "Asset prefetch failed"
+    local token
+    token=$(get_api_token) || return 1
+
+    local payload_file
+    payload_file=$(mktemp) || return 1
+    printf '%s' "$loop_response" > "$payload_file"
+
+    local delta_output
+    if ! delta_output=$(python3 "$DELTA_SYNC_SCRIPT" "$payload_file" "$MODULES_DIR" "$ASSETS_DIR" "$API_BASE_URL" \
+        "$token" "$device_id" --workers "$ASSET_PREFETCH_WORKERS" --max-rate-kib "$ASSET_PREFETCH_MAX_RATE_KIB" \
+        --window "$ASSET_PREFETCH_WINDOW"); then
+        rm -f "$payload_file"
+        log_error "Delta sync failed: ${delta_output:-no output} - falling back to full download"
         return 1
     fi
+    rm -f "$payload_file"
 
-    log "Asset prefetch summary: $prefetch_output"
-    log_success "Loop asset prefetch + meal JSON cache completed"
+    case "$delta_output" in
+        *content_changed=0*) DELTA_CONTENT_CHANGED=0 ;;
+        *) DELTA_CONTENT_CHANGED=1 ;;
+    esac
+
+    log "Delta sync summary: $delta_output"
     return 0
 }
 
@@ -1837,6 +1507,17 @@ main() {
         exit 1
     fi
     
+    if delta_sync_loop "$device_id" "$loop_response"; then
+        if [ "$DELTA_CONTENT_CHANGED" = "1" ] || [ ! -f "$LOOP_PLAYER" ]; then
+            create_unconfigured_page
+            create_loop_player
+        else
+            log "Loop content unchanged - loop player kept"
+        fi
+        log_success "Delta sync completed"
+        return 0
+    fi
+
     # Save loop configuration
     save_loop_config "$loop_response"
     
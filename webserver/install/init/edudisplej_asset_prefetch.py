@@ -0,0 +1,1004 @@
+#!/usr/bin/env python3
+"""
+EduDisplej loop asset prefetch (called by edudisplej-download-modules.sh)
+
+Downloads the media referenced by loop.json (PDF, video, gallery images) to
+assets/module-cache/<sha1(canonical url)[:24]><ext> and points the module
+settings at the local copies (../../assets/...), then caches the meal-menu
+JSON for today/tomorrow under assets/meal-menu/<group>/. The loop file is
+rewritten in place.
+
+Assets are fetched by a bounded pool of worker threads. Every worker keeps one
+keep-alive connection per host, so a gallery of a few hundred images costs a
+handful of TCP/TLS handshakes instead of two per image, and the total time is
+bound by bandwidth rather than by round trips.
+
+module-cache/manifest.json records sha256, size, mtime, ETag and the last
+verification time of every cached file. An entry is trusted for as long as
+the file's size and mtime are unchanged, so a sync without changes hashes
+nothing; once the media pass is done, a low-priority thread re-hashes the
+entries verified longest ago, within a per-run byte budget and read rate.
+A file whose content no longer matches its entry is downloaded again on the
+next sync.
+
+An interrupted download keeps its .tmp file and continues from there on the
+next attempt with an HTTP Range request; If-Range with the validator of the
+partial (strong ETag or Last-Modified) makes the server send the whole file
+instead when it has changed, and the sha256 announced by the server is
+checked once the file is complete. --max-rate-kib caps the total download
+rate of all workers, and --window restricts downloads to given times of day
+(e.g. "15:30-07:00,12:00-12:45"): outside of it the existing local copies are
+kept, and a transfer running when the window closes stops and is resumed by
+a later sync.
+
+Usage:
+    edudisplej_asset_prefetch.py LOOP_FILE ASSETS_DIR API_BASE_URL TOKEN [--workers N]
+        [--verify-budget-mb 64] [--verify-rate-mb 4] [--verify-age-hours 168]
+        [--max-rate-kib 0] [--window HH:MM-HH:MM[,HH:MM-HH:MM...]]
+
+Prints a single summary line:
+    media_refs=.. media_downloaded=.. media_reused=.. media_failed=.. meal_items=.. groups=..
+    prefetched_groups=.. files=.. patched=.. bytes=.. seconds=.. kib_per_s=.. workers=..
+    connections=.. requests=.. hashed_bytes=.. verified=.. corrupt=.. resumed=.. deferred=..
+"""
+
+import argparse
+import datetime
+import hashlib
+import http.client
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+USER_AGENT = 'EduDisplejSync/1.0 (+asset-prefetch)'
+MEAL_USER_AGENT = 'EduDisplejSync/1.0 (+meal-prefetch)'
+DEFAULT_WORKERS = 4
+MAX_WORKERS = 16
+HEAD_TIMEOUT = 15
+GET_TIMEOUT = 60
+MEAL_TIMEOUT = 12
+CHUNK_SIZE = 1024 * 1024
+MAX_REDIRECTS = 5
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+VERIFY_BUDGET_MB = 64
+VERIFY_RATE_MB = 4
+VERIFY_AGE_HOURS = 7 * 24
+RATE_CHUNK_MIN = 16 * 1024
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+# Errors after which a reused keep-alive connection is retried once on a fresh one
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                           ConnectionResetError, BrokenPipeError)
+
+
+def as_bool(value, default=False):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in {'1', 'true', 'yes', 'on'}:
+        return True
+    if text in {'0', 'false', 'no', 'off'}:
+        return False
+    return default
+
+
+def as_int(value, default=0):
+    try:
+        return int(value)
+    except Exception:
+        return default
+
+
+def iter_loop_items(root_data):
+    direct = root_data.get('loop')
+    if isinstance(direct, list):
+        for item in direct:
+            if isinstance(item, dict):
+                yield item
+
+    offline_plan = root_data.get('offline_plan')
+    if not isinstance(offline_plan, dict):
+        return
+
+    base_loop = offline_plan.get('base_loop')
+    if isinstance(base_loop, list):
+        for item in base_loop:
+            if isinstance(item, dict):
+                yield item
+
+    time_blocks = offline_plan.get('time_blocks')
+    if isinstance(time_blocks, list):
+        for block in time_blocks:
+            if not isinstance(block, dict):
+                continue
+            loops = block.get('loops')
+            if not isinstance(loops, list):
+                continue
+            for item in loops:
+                if isinstance(item, dict):
+                    yield item
+
+
+def parse_json_list(raw_value):
+    try:
+        parsed = json.loads(str(raw_value or '[]'))
+    except Exception:
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+
+def absolutize_asset_url(raw_url, api_base):
+    raw = str(raw_url or '').strip()
+    if not raw:
+        return ''
+    if raw.startswith('http://') or raw.startswith('https://'):
+        return raw
+    return urllib.parse.urljoin(api_base + '/', raw)
+
+
+def canonical_asset_source(raw_url, api_base):
+    """Absolute URL without the token parameter and with a sorted query (the cache key)"""
+    absolute = absolutize_asset_url(raw_url, api_base)
+    if not absolute:
+        return ''
+
+    parsed = urllib.parse.urlparse(absolute)
+    query_pairs = []
+    for key, value in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True):
+        if key.lower() == 'token':
+            continue
+        query_pairs.append((key, value))
+    query = urllib.parse.urlencode(sorted(query_pairs))
+    return urllib.parse.urlunparse((parsed.scheme, parsed.netloc, parsed.path, '', query, ''))
+
+
+def cache_rel_path(canonical_source, extension):
+    return f"module-cache/{hashlib.sha1(canonical_source.encode('utf-8')).hexdigest()[:24]}{extension}"
+
+
+def extract_header(headers, name, default=''):
+    value = headers.get(name, default)
+    return str(value or '').strip()
+
+
+def content_type_of(headers):
+    return extract_header(headers, 'Content-Type').split(';', 1)[0].strip().lower()
+
+
+def compute_sha256(file_path, rate=0):
+    """sha256 of a file; rate (bytes/s) > 0 paces the reads"""
+    digest = hashlib.sha256()
+    started = time.monotonic()
+    done = 0
+    with file_path.open('rb') as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            done += len(chunk)
+            if rate > 0:
+                ahead = done / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    return digest.hexdigest().lower()
+
+
+def guess_extension(source_url, content_type=''):
+    parsed = urllib.parse.urlparse(source_url)
+    suffix = Path(parsed.path).suffix.strip()
+    if suffix:
+        return suffix.lower()
+
+    mapped = mimetypes.guess_extension(content_type or '', strict=False)
+    if mapped:
+        return mapped.lower()
+
+    return '.bin'
+
+
+def parse_minutes(text):
+    hours, _, minutes = text.strip().partition(':')
+    value = int(hours) * 60 + int(minutes or 0)
+    if not 0 <= value <= 24 * 60:
+        raise ValueError(f'invalid time of day: {text}')
+    return value
+
+
+def parse_windows(text):
+    """'HH:MM-HH:MM[,...]' -> [(start_minute, end_minute), ...]; a window may wrap midnight"""
+    windows = []
+    for part in filter(None, (part.strip() for part in str(text or '').split(','))):
+        start, separator, end = part.partition('-')
+        if not separator:
+            raise ValueError(f'invalid time window: {part}')
+        windows.append((parse_minutes(start), parse_minutes(end)))
+    return windows
+
+
+def in_windows(windows, now=None):
+    """True if now (local time) falls into one of the windows, or there are none"""
+    if not windows:
+        return True
+    now = now or datetime.datetime.now()
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        if start <= end:
+            if start <= minute < end:
+                return True
+        elif minute >= start or minute < end:
+            return True
+    return False
+
+
+def range_start(headers):
+    """First byte position of a 206 response's Content-Range, or None"""
+    value = extract_header(headers, 'Content-Range')
+    unit, _, spec = value.partition(' ')
+    first = spec.partition('-')[0]
+    if unit.lower() != 'bytes' or not first.isdigit():
+        return None
+    return int(first)
+
+
+class RateLimiter:
+    """Caps the combined read rate of all download threads (bytes/s, 0 = unlimited)"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    @property
+    def chunk_size(self):
+        if self.rate <= 0:
+            return CHUNK_SIZE
+        return int(min(CHUNK_SIZE, max(RATE_CHUNK_MIN, self.rate / 4)))
+
+    def consume(self, amount):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.next_time = max(self.next_time, now) + amount / self.rate
+            delay = self.next_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DownloadDeferred(Exception):
+    """The download window closed; the partial file is kept for a later sync"""
+
+
+class HttpStatusError(Exception):
+    def __init__(self, status, url):
+        super().__init__(f'HTTP {status} for {url}')
+        self.status = status
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, one per host and worker thread
+
+    request() follows redirects and returns the response; the caller must read
+    it to the end (or call reset()) before the next request on the same host.
+    """
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.opened = 0
+        self.requests = 0
+
+    def _connection(self, scheme, netloc, timeout, fresh=False):
+        pool = getattr(self.local, 'connections', None)
+        if pool is None:
+            pool = self.local.connections = {}
+        key = (scheme, netloc)
+        conn = pool.get(key)
+        if conn is None:
+            factory = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = pool[key] = factory(netloc, timeout=timeout)
+            with self.lock:
+                self.connections.append(conn)
+        elif fresh:
+            conn.close()
+        conn.timeout = timeout
+        reused = conn.sock is not None
+        if reused:
+            conn.sock.settimeout(timeout)
+        else:
+            with self.lock:
+                self.opened += 1
+        return conn, reused
+
+    def _send(self, method, parsed, timeout, headers, body):
+        target = urllib.parse.urlunsplit(('', '', parsed.path or '/', parsed.query, ''))
+        conn, reused = self._connection(parsed.scheme, parsed.netloc, timeout)
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            response = conn.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            if not reused:
+                conn.close()
+                raise
+            # The server dropped the idle connection; one retry on a new one
+            conn, _ = self._connection(parsed.scheme, parsed.netloc, timeout, fresh=True)
+            conn.request(method, target, body=body, headers=headers)
+            response = conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+        with self.lock:
+            self.requests += 1
+        return response
+
+    def request(self, method, url, timeout, headers=None, body=None):
+        headers = {**self.headers, **(headers or {})}
+        for _ in range(MAX_REDIRECTS + 1):
+            parsed = urllib.parse.urlsplit(url)
+            if parsed.scheme not in ('http', 'https'):
+                raise ValueError(f'Unsupported URL: {url}')
+            response = self._send(method, parsed, timeout, headers, body)
+            location = response.getheader('Location')
+            if response.status in REDIRECT_STATUSES and location:
+                response.read()
+                url = urllib.parse.urljoin(url, location)
+                if response.status == 303:
+                    method, body = 'GET', None
+                continue
+            if response.status >= 400:
+                response.read()
+                raise HttpStatusError(response.status, url)
+            return response
+        raise HttpStatusError(response.status, url)
+
+    def reset(self, url, error=None):
+        """Drop this thread's connection to the host of url after a failed transfer
+
+        An HTTP error status leaves the connection usable (its body was read).
+        """
+        if isinstance(error, HttpStatusError):
+            return
+        parsed = urllib.parse.urlsplit(url)
+        conn = getattr(self.local, 'connections', {}).get((parsed.scheme, parsed.netloc))
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+
+
+class AssetManifest:
+    """Content records of module-cache, keyed by file name
+
+    An entry is only returned by lookup() while the file still has the size
+    and mtime it had when the entry was recorded.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.path = cache_dir / MANIFEST_NAME
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.entries = {}
+        self.partials = {}
+        self.dirty = False
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+            if isinstance(data, dict) and data.get('version') == MANIFEST_VERSION and isinstance(data.get('entries'), dict):
+                self.entries = data['entries']
+                self.partials = data.get('partials') if isinstance(data.get('partials'), dict) else {}
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, local_path, stat=None):
+        with self.lock:
+            entry = self.entries.get(local_path.name)
+        if entry is None:
+            return None
+        stat = stat or local_path.stat()
+        if entry.get('size') != stat.st_size or entry.get('mtime_ns') != stat.st_mtime_ns:
+            return None
+        return entry
+
+    def record(self, local_path, sha256='', etag='', source='', verified=True):
+        stat = local_path.stat()
+        entry = {
+            'sha256': sha256,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'etag': etag,
+            'source': source,
+            'verified_at': int(time.time()) if verified and sha256 else 0,
+        }
+        with self.lock:
+            self.entries[local_path.name] = entry
+            self.dirty = True
+        return entry
+
+    def update(self, name, **fields):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and any(entry.get(key) != value for key, value in fields.items()):
+                entry.update(fields)
+                self.dirty = True
+
+    def forget(self, name):
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                self.dirty = True
+
+    def partial(self, temp_name):
+        """Validator and expected size/sha256 of an interrupted download"""
+        with self.lock:
+            return self.partials.get(temp_name)
+
+    def set_partial(self, temp_name, validator, size=0, sha256=''):
+        with self.lock:
+            self.partials[temp_name] = {'validator': validator, 'size': size, 'sha256': sha256}
+            self.dirty = True
+
+    def forget_partial(self, temp_name):
+        with self.lock:
+            if self.partials.pop(temp_name, None) is not None:
+                self.dirty = True
+
+    def due_for_verification(self, max_age):
+        """Entries not verified for max_age seconds, longest ago first"""
+        cutoff = time.time() - max_age
+        with self.lock:
+            due = [(entry.get('verified_at', 0), name) for name, entry in self.entries.items()
+                   if not entry.get('corrupt') and entry.get('verified_at', 0) <= cutoff]
+        return [name for _, name in sorted(due)]
+
+    def save(self):
+        """Drop entries of deleted files and write the manifest if anything changed"""
+        with self.lock:
+            for name in [name for name in self.entries if not (self.cache_dir / name).is_file()]:
+                del self.entries[name]
+                self.dirty = True
+            for name in [name for name in self.partials if not (self.cache_dir / name).is_file()]:
+                del self.partials[name]
+                self.dirty = True
+            if not self.dirty:
+                return
+            self.dirty = False
+        # Workers save concurrently when a transfer starts; the newest state is written last
+        with self.write_lock:
+            with self.lock:
+                payload = json.dumps({'version': MANIFEST_VERSION, 'entries': self.entries, 'partials': self.partials},
+                                     ensure_ascii=False, separators=(',', ':'))
+            temp_path = self.path.with_suffix('.json.tmp')
+            with temp_path.open('w', encoding='utf-8') as handle:
+                handle.write(payload)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temp_path, self.path)
+
+
+class PrefetchStats:
+    """Thread-safe counters of the media pass"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.downloaded = 0
+        self.reused = 0
+        self.failed = 0
+        self.bytes = 0
+        self.hashed_bytes = 0
+        self.verified = 0
+        self.corrupt = 0
+        self.resumed = 0
+        self.deferred = 0
+
+    def add(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+class AssetPrefetcher:
+    def __init__(self, assets_dir, api_base, token, workers=DEFAULT_WORKERS, max_rate=0, windows=None):
+        self.assets_dir = assets_dir
+        self.api_base = api_base
+        self.workers = max(1, min(int(workers), MAX_WORKERS))
+        self.limiter = RateLimiter(max_rate)
+        self.windows = windows or []
+        self.stats = PrefetchStats()
+        self.assets = ConnectionPool({
+            'Authorization': f'Bearer {token}',
+            'User-Agent': USER_AGENT,
+            'Accept': '*/*',
+        })
+        self.meals = ConnectionPool({
+            'Authorization': f'Bearer {token}',
+            'User-Agent': MEAL_USER_AGENT,
+            'Accept': 'application/json, text/plain, */*',
+        })
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prefetch')
+        (assets_dir / 'module-cache').mkdir(parents=True, exist_ok=True)
+        self.manifest = AssetManifest(assets_dir / 'module-cache')
+        self.verifier = None
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.verifier is not None:
+            self.verifier.join()
+        self.assets.close()
+        self.meals.close()
+        self.manifest.save()
+
+    def head_asset(self, remote_url):
+        try:
+            response = self.assets.request('HEAD', remote_url, HEAD_TIMEOUT)
+            response.read()
+        except Exception as exc:
+            self.assets.reset(remote_url, exc)
+            return None
+        headers = response.headers
+        size_text = extract_header(headers, 'Content-Length') or extract_header(headers, 'X-Asset-Size')
+        return {
+            'size': int(size_text) if size_text.isdigit() else 0,
+            'sha256': extract_header(headers, 'X-Asset-Sha256').lower(),
+            'etag': extract_header(headers, 'ETag'),
+            'last_modified': extract_header(headers, 'Last-Modified'),
+            'content_type': content_type_of(headers),
+        }
+
+    def matches_remote(self, local_path, metadata, canonical_source):
+        """True if the cached file has the remote size and, when known, sha256/ETag
+
+        The file is only hashed when the manifest has no trusted sha256 for it.
+        """
+        stat = local_path.stat()
+        remote_size = int(metadata.get('size') or 0)
+        if remote_size <= 0 or stat.st_size != remote_size:
+            return False
+        remote_sha = str(metadata.get('sha256') or '').lower()
+        remote_etag = metadata.get('etag') or ''
+        entry = self.manifest.lookup(local_path, stat)
+        if entry is not None and entry.get('corrupt'):
+            return False
+
+        if remote_sha:
+            if entry is not None and entry.get('sha256'):
+                local_sha = entry['sha256']
+            else:
+                try:
+                    local_sha = compute_sha256(local_path)
+                except Exception:
+                    return False
+                self.stats.add('hashed_bytes', stat.st_size)
+                entry = self.manifest.record(local_path, local_sha, remote_etag, canonical_source)
+            if local_sha != remote_sha:
+                return False
+        elif entry is None:
+            # Size match only; the hash is filled in by background verification
+            entry = self.manifest.record(local_path, '', remote_etag, canonical_source)
+        elif remote_etag and entry.get('etag') and entry['etag'] != remote_etag:
+            return False
+
+        if remote_etag:
+            self.manifest.update(local_path.name, etag=remote_etag)
+        return True
+
+    def resume_offset(self, temp_path, metadata):
+        """(offset, validator) to continue a partial download from, or (0, '') to start over"""
+        partial = self.manifest.partial(temp_path.name)
+        try:
+            offset = temp_path.stat().st_size
+        except OSError:
+            offset = 0
+        validator = (partial or {}).get('validator') or ''
+        current = metadata.get('etag') or metadata.get('last_modified') or ''
+        remote_size = int(metadata.get('size') or 0)
+        if (not offset or not validator or (current and current != validator)
+                or (remote_size and offset >= remote_size)):
+            temp_path.unlink(missing_ok=True)
+            self.manifest.forget_partial(temp_path.name)
+            return 0, ''
+        return offset, validator
+
+    def track_partial(self, temp_path, response, metadata):
+        """Record a new .tmp for resuming, on disk before any byte arrives, so a killed sync can continue it"""
+        validator = extract_header(response.headers, 'ETag') or extract_header(response.headers, 'Last-Modified')
+        if validator.startswith('W/'):
+            validator = ''  # weak ETags are not allowed in If-Range
+        if validator:
+            self.manifest.set_partial(temp_path.name, validator, int(metadata.get('size') or 0),
+                                      metadata.get('sha256') or '')
+        else:
+            self.manifest.forget_partial(temp_path.name)
+        self.manifest.save()
+
+    def download(self, canonical_source, remote_url, metadata, extension, local_path):
+        """Fetch an asset, continuing a partial .tmp when possible; returns the final local path
+
+        The .tmp file survives network errors and DownloadDeferred when the
+        response carried a validator for If-Range; anything else restarts
+        from zero next time.
+        """
+        temp_path = local_path.with_suffix(local_path.suffix + '.tmp')
+        offset, validator = self.resume_offset(temp_path, metadata)
+        headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if offset else None
+        try:
+            response = self.assets.request('GET', remote_url, GET_TIMEOUT, headers)
+        except HttpStatusError as exc:
+            if not offset or exc.status != 416:
+                raise
+            # The partial no longer fits the remote file
+            temp_path.unlink(missing_ok=True)
+            self.manifest.forget_partial(temp_path.name)
+            offset = 0
+            response = self.assets.request('GET', remote_url, GET_TIMEOUT)
+        if offset and (response.status != 206 or range_start(response.headers) != offset):
+            offset = 0  # the server sent the whole (possibly changed) file
+
+        if extension == '.bin':
+            extension = guess_extension(canonical_source, content_type_of(response.headers))
+            local_path = self.assets_dir / cache_rel_path(canonical_source, extension)
+
+        expected_sha = metadata.get('sha256') or ''
+        digest = hashlib.sha256()
+        if offset:
+            self.stats.add('resumed')
+            with temp_path.open('rb') as handle:
+                for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            self.stats.add('hashed_bytes', offset)
+
+        length = extract_header(response.headers, 'Content-Length')
+        remaining = int(length) if length.isdigit() else None
+        try:
+            with temp_path.open('ab' if offset else 'wb') as handle:
+                if not offset:
+                    self.track_partial(temp_path, response, metadata)
+                while True:
+                    if not in_windows(self.windows):
+                        raise DownloadDeferred(remote_url)
+                    chunk = response.read(self.limiter.chunk_size)
+                    if not chunk:
+                        break
+                    handle.write(chunk)
+                    digest.update(chunk)
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    self.stats.add('bytes', len(chunk))
+                    self.limiter.consume(len(chunk))
+            if remaining:
+                # http.client ends a body cut short by the server without an error
+                raise http.client.IncompleteRead(b'', remaining)
+        except Exception:
+            if self.manifest.partial(temp_path.name) is None:
+                temp_path.unlink(missing_ok=True)
+            raise
+
+        sha256 = digest.hexdigest()
+        self.manifest.forget_partial(temp_path.name)
+        if expected_sha and sha256 != expected_sha:
+            temp_path.unlink(missing_ok=True)
+            raise ValueError(f'sha256 mismatch for {remote_url}')
+        os.replace(temp_path, local_path)
+        etag = extract_header(response.headers, 'ETag') or metadata.get('etag', '')
+        self.manifest.record(local_path, sha256, etag, canonical_source)
+        return local_path
+
+    def localize_asset(self, canonical_source, remote_url):
+        """Cache-relative path of the local copy, or '' if there is none"""
+        metadata = self.head_asset(remote_url)
+        extension = guess_extension(canonical_source, (metadata or {}).get('content_type', ''))
+        rel_path = cache_rel_path(canonical_source, extension)
+        local_path = self.assets_dir / rel_path
+
+        if metadata and local_path.is_file() and self.matches_remote(local_path, metadata, canonical_source):
+            self.stats.add('reused')
+            return rel_path
+
+        try:
+            if not in_windows(self.windows):
+                raise DownloadDeferred(remote_url)
+            downloaded = self.download(canonical_source, remote_url, metadata or {}, extension, local_path)
+            self.stats.add('downloaded')
+            return downloaded.relative_to(self.assets_dir).as_posix()
+        except DownloadDeferred:
+            self.assets.reset(remote_url)
+            self.stats.add('deferred')
+        except Exception as exc:
+            self.assets.reset(remote_url, exc)
+            self.stats.add('failed')
+        if local_path.is_file():
+            self.stats.add('reused')
+            return rel_path
+        return ''
+
+    def media_refs(self, data):
+        """(settings, field, raw urls) for every media setting of the loop"""
+        refs = []
+        for item in iter_loop_items(data):
+            settings = item.get('settings')
+            if not isinstance(settings, dict):
+                continue
+            module_key = str(item.get('module_key') or '').strip().lower()
+            if module_key == 'pdf':
+                refs.append((settings, 'pdfAssetUrl', False))
+            elif module_key == 'video':
+                refs.append((settings, 'videoAssetUrl', False))
+            elif module_key in {'gallery', 'image-gallery', 'image_gallery'}:
+                refs.append((settings, 'imageUrlsJson', True))
+        return refs
+
+    def prefetch_media(self, data):
+        """Download every distinct asset concurrently and patch the settings; returns the ref count"""
+        refs = self.media_refs(data)
+        sources = {}
+        found = 0
+        for settings, field, is_list in refs:
+            if is_list:
+                values = [str(raw or '').strip() for raw in parse_json_list(settings.get(field))]
+            else:
+                values = [str(settings.get(field) or '').strip()]
+            for value in filter(None, values):
+                found += 1
+                canonical = canonical_asset_source(value, self.api_base)
+                if canonical and canonical not in sources:
+                    sources[canonical] = absolutize_asset_url(value, self.api_base)
+
+        canonicals = list(sources)
+        results = dict(zip(canonicals, self.executor.map(
+            lambda canonical: self.localize_asset(canonical, sources[canonical]), canonicals)))
+
+        def localized(raw):
+            rel_path = results.get(canonical_asset_source(raw, self.api_base))
+            return (f'../../assets/{rel_path}', True) if rel_path else (raw, False)
+
+        for settings, field, is_list in refs:
+            if is_list:
+                values = [str(raw or '').strip() for raw in parse_json_list(settings.get(field))]
+                settings[field] = json.dumps([localized(value)[0] for value in values if value], ensure_ascii=False)
+                continue
+            raw = str(settings.get(field) or '').strip()
+            if raw:
+                value, success = localized(raw)
+                if success:
+                    settings[field] = value
+        return found
+
+    def verify_cache(self, budget_bytes, rate, max_age):
+        """Re-hash the entries verified longest ago, up to budget_bytes at rate bytes/s"""
+        try:
+            # Lowest CPU priority for this thread only (Linux: per-thread nice value)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        cache_dir = self.manifest.cache_dir
+        for name in self.manifest.due_for_verification(max_age):
+            local_path = cache_dir / name
+            try:
+                entry = self.manifest.lookup(local_path)
+            except OSError:
+                continue
+            if entry is None:
+                # Changed or replaced since it was recorded: rehashed when next needed
+                self.manifest.forget(name)
+                continue
+            if entry['size'] > budget_bytes:
+                break
+            try:
+                digest = compute_sha256(local_path, rate)
+            except OSError:
+                continue
+            budget_bytes -= entry['size']
+            if self.manifest.lookup(local_path) is not entry:
+                continue
+            self.stats.add('hashed_bytes', entry['size'])
+            if entry.get('sha256') and digest != entry['sha256']:
+                self.manifest.update(name, corrupt=True)
+                self.stats.add('corrupt')
+            else:
+                self.manifest.update(name, sha256=digest, verified_at=int(time.time()))
+                self.stats.add('verified')
+
+    def start_verification(self, budget_mb=VERIFY_BUDGET_MB, rate_mb=VERIFY_RATE_MB, age_hours=VERIFY_AGE_HOURS):
+        if budget_mb <= 0:
+            return
+        self.verifier = threading.Thread(
+            target=self.verify_cache, name='cache-verify', daemon=True,
+            args=(int(budget_mb * 1024 * 1024), rate_mb * 1024 * 1024, age_hours * 3600),
+        )
+        self.verifier.start()
+
+    def fetch_meal_payload(self, config, target_date, exact_date=False):
+        query = {
+            'action': 'menu',
+            'site_key': config['site_key'],
+            'institution_id': str(config['institution_id']),
+            'date': target_date,
+            'exact_date': '1' if exact_date else '0',
+            'show_breakfast': '1' if config['show_breakfast'] else '0',
+            'show_snack_am': '1' if config['show_snack_am'] else '0',
+            'show_lunch': '1' if config['show_lunch'] else '0',
+            'show_snack_pm': '1' if config['show_snack_pm'] else '0',
+            'show_dinner': '1' if config['show_dinner'] else '0',
+            'source_type': config['source_type'],
+        }
+        if config['company_id'] > 0:
+            query['company_id'] = str(config['company_id'])
+
+        url = f"{self.api_base}/api/meal_plan.php?{urllib.parse.urlencode(query)}"
+        try:
+            response = self.meals.request('GET', url, MEAL_TIMEOUT)
+            payload = json.loads(response.read().decode('utf-8', errors='ignore'))
+        except Exception as exc:
+            self.meals.reset(url, exc)
+            return None
+
+        if not isinstance(payload, dict) or payload.get('success') is not True:
+            return None
+        data = payload.get('data')
+        return data if isinstance(data, dict) else None
+
+    def meal_groups(self, data):
+        groups = {}
+        items = 0
+        for item in iter_loop_items(data):
+            module_key = str(item.get('module_key') or '').strip().lower()
+            if module_key not in {'meal-menu', 'meal_menu'}:
+                continue
+
+            settings = item.get('settings')
+            if not isinstance(settings, dict):
+                continue
+
+            items += 1
+            config = {
+                'company_id': as_int(settings.get('companyId'), 0),
+                'site_key': str(settings.get('siteKey') or 'jedalen.sk').strip() or 'jedalen.sk',
+                'institution_id': as_int(settings.get('institutionId'), 0),
+                'source_type': 'manual' if str(settings.get('sourceType') or 'server').strip().lower() == 'manual' else 'server',
+                'show_breakfast': as_bool(settings.get('showBreakfast'), True),
+                'show_snack_am': as_bool(settings.get('showSnackAm'), True),
+                'show_lunch': as_bool(settings.get('showLunch'), True),
+                'show_snack_pm': as_bool(settings.get('showSnackPm'), False),
+                'show_dinner': as_bool(settings.get('showDinner'), False),
+                'layout_mode': str(settings.get('layoutMode') or 'classic').strip().lower() or 'classic',
+                'show_tomorrow_square': as_bool(settings.get('showTomorrowInSquare'), True),
+            }
+
+            if config['institution_id'] <= 0:
+                continue
+
+            fingerprint = json.dumps(config, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+            key = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:14]
+            if key not in groups:
+                groups[key] = {'config': config, 'settings_refs': []}
+            groups[key]['settings_refs'].append(settings)
+        return groups, items
+
+    def prefetch_meals(self, groups):
+        """Fetch and store the menus of every group; returns (groups, files, patched settings)"""
+        today_date = datetime.date.today().isoformat()
+        tomorrow_date = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+        meal_assets_root = self.assets_dir / 'meal-menu'
+        meal_assets_root.mkdir(parents=True, exist_ok=True)
+
+        pending = {}
+        for key, group in groups.items():
+            config = group['config']
+            today = self.executor.submit(self.fetch_meal_payload, config, today_date, False)
+            tomorrow = None
+            if config['layout_mode'] == 'square_dual_day' and config['show_tomorrow_square']:
+                tomorrow = self.executor.submit(self.fetch_meal_payload, config, tomorrow_date, True)
+            pending[key] = (today, tomorrow)
+
+        prefetched_groups = 0
+        prefetched_files = 0
+        patched_settings = 0
+        for key, group in groups.items():
+            config = group['config']
+            target_dir = meal_assets_root / key
+            target_dir.mkdir(parents=True, exist_ok=True)
+            today_payload = pending[key][0].result()
+            tomorrow_payload = pending[key][1].result() if pending[key][1] is not None else None
+
+            today_rel = ''
+            tomorrow_rel = ''
+
+            if isinstance(today_payload, dict):
+                (target_dir / 'today.json').write_text(json.dumps(today_payload, ensure_ascii=False, indent=2), encoding='utf-8')
+                today_rel = f"../../assets/meal-menu/{key}/today.json"
+                prefetched_files += 1
+
+            if isinstance(tomorrow_payload, dict):
+                (target_dir / 'tomorrow.json').write_text(json.dumps(tomorrow_payload, ensure_ascii=False, indent=2), encoding='utf-8')
+                tomorrow_rel = f"../../assets/meal-menu/{key}/tomorrow.json"
+                prefetched_files += 1
+
+            if not today_rel and not tomorrow_rel:
+                continue
+
+            prefetched_groups += 1
+            saved_at = datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
+
+            inline_prefetched = None
+            if config['layout_mode'] == 'square_dual_day':
+                inline_prefetched = {
+                    'today': today_payload if isinstance(today_payload, dict) else None,
+                    'tomorrow': tomorrow_payload if isinstance(tomorrow_payload, dict) else None,
+                }
+            elif isinstance(today_payload, dict):
+                inline_prefetched = today_payload
+
+            for settings in group['settings_refs']:
+                settings['offlinePrefetchedTodayFile'] = today_rel
+                settings['offlinePrefetchedTomorrowFile'] = tomorrow_rel
+                settings['offlinePrefetchedMenuSavedAt'] = saved_at
+                if inline_prefetched is not None:
+                    settings['offlinePrefetchedMenuData'] = inline_prefetched
+                patched_settings += 1
+        return prefetched_groups, prefetched_files, patched_settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prefetch loop media and meal-menu JSON for offline playback')
+    parser.add_argument('loop_file', type=Path)
+    parser.add_argument('assets_dir', type=Path)
+    parser.add_argument('api_base')
+    parser.add_argument('token')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Parallel downloads (1-{MAX_WORKERS}, default {DEFAULT_WORKERS})')
+    parser.add_argument('--verify-budget-mb', type=float, default=VERIFY_BUDGET_MB,
+                        help='Cached data re-hashed per run by the background verification (0 disables it)')
+    parser.add_argument('--verify-rate-mb', type=float, default=VERIFY_RATE_MB,
+                        help='Read rate of the background verification in MB/s')
+    parser.add_argument('--verify-age-hours', type=float, default=VERIFY_AGE_HOURS,
+                        help='Re-hash cached files verified longer ago than this')
+    parser.add_argument('--max-rate-kib', type=float, default=0,
+                        help='Combined download rate cap in KiB/s (0 = unlimited)')
+    parser.add_argument('--window', type=parse_windows, default=[],
+                        help='Local times of day when downloads may run, e.g. "15:30-07:00,12:00-12:45" (default: always)')
+    args = parser.parse_args(argv)
+
+    loop_file = args.loop_file
+    try:
+        data = json.loads(loop_file.read_text(encoding='utf-8', errors='ignore'))
+    except Exception as exc:
+        print(f'failed_to_parse_loop:{exc}')
+        return 1
+
+    prefetcher = AssetPrefetcher(args.assets_dir, args.api_base.rstrip('/'), args.token, args.workers,
+                                 args.max_rate_kib * 1024, args.window)
+    try:
+        started = time.monotonic()
+        media_found = prefetcher.prefetch_media(data)
+        media_seconds = time.monotonic() - started
+        prefetcher.start_verification(args.verify_budget_mb, args.verify_rate_mb, args.verify_age_hours)
+        meal_groups, meal_items = prefetcher.meal_groups(data)
+        prefetched_groups, prefetched_files, patched_settings = prefetcher.prefetch_meals(meal_groups)
+    finally:
+        prefetcher.close()
+
+    loop_file.write_text(json.dumps(data, ensure_ascii=False, indent=4), encoding='utf-8')
+    stats = prefetcher.stats
+    kib_per_s = stats.bytes / 1024.0 / media_seconds if media_seconds > 0 else 0.0
+    print(
+        f"media_refs={media_found} media_downloaded={stats.downloaded} media_reused={stats.reused} media_failed={stats.failed} "
+        f"meal_items={meal_items} groups={len(meal_groups)} prefetched_groups={prefetched_groups} files={prefetched_files} patched={patched_settings} "
+        f"bytes={stats.bytes} seconds={media_seconds:.1f} kib_per_s={kib_per_s:.0f} workers={prefetcher.workers} "
+        f"connections={prefetcher.assets.opened + prefetcher.meals.opened} requests={prefetcher.assets.requests + prefetcher.meals.requests} "
+        f"hashed_bytes={stats.hashed_bytes} verified={stats.verified} corrupt={stats.corrupt} "
+        f"resumed={stats.resumed} deferred={stats.deferred}"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
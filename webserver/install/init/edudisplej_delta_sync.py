@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+"""
+EduDisplej delta loop sync (called by edudisplej-download-modules.sh)
+
+Applies a kiosk_loop.php payload to the local content tree by touching only
+what differs from the stored modules/loop.json:
+
+  - every loop entry (loop, offline_plan.base_loop, offline_plan.time_blocks[].loops)
+    carries sync_fingerprint, the sha1 of the entry as the server sent it; an
+    entry whose fingerprint is already in the stored loop.json keeps the
+    module folder and main file resolved there, only new or changed entries go
+    through the main file detection
+  - every entry goes through the asset / meal prefetch (edudisplej_asset_prefetch):
+    the manifest keeps an unchanged asset at one HEAD request, and the meal
+    menu is fetched for the current day on every sync
+  - a module is downloaded when its folder is missing, when one of its entries
+    changed, or when it was last checked more than --module-max-age-hours ago;
+    a download identical to the installed files only refreshes .metadata.json
+  - module folders and cached assets the new loop no longer uses are removed
+    after the switch
+
+Nothing live is modified while downloading: changed module folders are built
+as modules/.staging-<folder> and the new loop as loop.json.tmp. The switch
+itself only renames - the staged folders into place, then loop.json - so the
+player never sees a half-written module or loop.
+
+Usage:
+    edudisplej_delta_sync.py PAYLOAD_FILE MODULES_DIR ASSETS_DIR API_BASE_URL TOKEN DEVICE_ID
+        [--workers 4] [--max-rate-kib 0] [--window HH:MM-HH:MM[,...]] [--module-max-age-hours 24]
+
+Prints a single summary line:
+    entries=.. changed=.. reused=.. removed=.. modules=.. modules_downloaded=.. modules_unchanged=..
+    modules_failed=.. modules_removed=.. assets_removed=.. media_downloaded=.. media_failed=..
+    content_changed=0|1
+and exits non-zero when the payload cannot be applied, so the caller can fall
+back to the full download.
+"""
+
+import argparse
+import base64
+import copy
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from edudisplej_asset_prefetch import (
+    DEFAULT_WORKERS,
+    AssetPrefetcher,
+    ConnectionPool,
+    parse_json_list,
+    parse_windows,
+)
+
+USER_AGENT = 'EduDisplejSync/1.0 (+delta-sync)'
+FINGERPRINT_KEY = 'sync_fingerprint'
+METADATA_NAME = '.metadata.json'
+DOWNLOAD_INFO_NAME = '.download_info.json'
+STAGING_PREFIX = '.staging-'
+TRASH_NAME = '.trash'
+VIRTUAL_MODULES = {'turned-off'}
+MODULE_KEY_ALIASES = {
+    'meal_menu': 'meal-menu',
+    'room_occupancy': 'room-occupancy',
+    'default_logo': 'default-logo',
+    'image_gallery': 'image-gallery',
+}
+MODULE_TIMEOUT = 60
+MODULE_ATTEMPTS = 3
+MODULE_RETRY_DELAY = 2
+MODULE_MAX_AGE_HOURS = 24
+ASSET_PREFIX = '../../assets/'
+MANAGED_ASSET_ROOTS = ('module-cache/', 'meal-menu/')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+VOLATILE_SETTINGS = ('offlinePrefetchedMenuSavedAt',)
+
+
+def canonical_module_key(raw):
+    key = str(raw or '').strip().lower()
+    return MODULE_KEY_ALIASES.get(key, key)
+
+
+def fingerprint(entry):
+    encoded = json.dumps(entry, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+def build_document(payload):
+    """loop.json content for a kiosk_loop.php payload (same shape as save_loop_config)"""
+    loop = payload.get('loop_config') or []
+    offline_plan = payload.get('offline_plan')
+    if not isinstance(offline_plan, dict):
+        offline_plan = {'base_loop': copy.deepcopy(loop), 'time_blocks': []}
+    active_time_block_id = payload.get('active_time_block_id')
+    return {
+        'last_update': payload.get('loop_last_update') or datetime.now().strftime(TIME_FORMAT),
+        'loop_plan_version': payload.get('loop_plan_version') or 0,
+        'active_scope': payload.get('active_scope') or 'base',
+        'active_time_block_id': active_time_block_id if active_time_block_id not in ('', None) else None,
+        'loop': loop,
+        'offline_plan': offline_plan,
+    }
+
+
+def entry_lists(document):
+    """Every list of loop entries in a loop document"""
+    lists = []
+    if isinstance(document.get('loop'), list):
+        lists.append(document['loop'])
+    offline_plan = document.get('offline_plan')
+    if isinstance(offline_plan, dict):
+        if isinstance(offline_plan.get('base_loop'), list):
+            lists.append(offline_plan['base_loop'])
+        for block in offline_plan.get('time_blocks') or []:
+            if isinstance(block, dict) and isinstance(block.get('loops'), list):
+                lists.append(block['loops'])
+    return lists
+
+
+def without_volatile(document):
+    """Copy of a loop document without the settings stamped anew on every sync"""
+    document = copy.deepcopy(document)
+    for entries in entry_lists(document):
+        for entry in entries:
+            settings = entry.get('settings') if isinstance(entry, dict) else None
+            if isinstance(settings, dict):
+                for field in VOLATILE_SETTINGS:
+                    settings.pop(field, None)
+    return document
+
+
+def required_modules(payload):
+    """{module_key: module_folder} of every downloadable module the payload uses"""
+    items = list(payload.get('loop_config') or []) + list(payload.get('preload_modules') or [])
+    offline_plan = payload.get('offline_plan')
+    if isinstance(offline_plan, dict):
+        items += list(offline_plan.get('base_loop') or [])
+        for block in offline_plan.get('time_blocks') or []:
+            if isinstance(block, dict):
+                items += list(block.get('loops') or [])
+
+    modules = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        key = canonical_module_key(item.get('module_key'))
+        if not key or key in VIRTUAL_MODULES or key in modules:
+            continue
+        modules[key] = canonical_module_key(item.get('module_folder') or key) or key
+    return modules
+
+
+def local_asset_refs(entry):
+    """assets/-relative paths of the managed local files an entry points at"""
+    settings = entry.get('settings') if isinstance(entry, dict) else None
+    if not isinstance(settings, dict):
+        return set()
+    values = [settings.get(field) for field in
+              ('pdfAssetUrl', 'videoAssetUrl', 'offlinePrefetchedTodayFile', 'offlinePrefetchedTomorrowFile')]
+    values += parse_json_list(settings.get('imageUrlsJson'))
+    refs = set()
+    for value in values:
+        value = str(value or '').strip()
+        if value.startswith(ASSET_PREFIX):
+            rel = value[len(ASSET_PREFIX):].split('?', 1)[0]
+            if rel.startswith(MANAGED_ASSET_ROOTS):
+                refs.add(rel)
+    return refs
+
+
+def write_atomic(path, text):
+    temp_path = path.with_name(path.name + '.tmp')
+    with temp_path.open('w', encoding='utf-8') as handle:
+        handle.write(text)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp_path, path)
+
+
+class DeltaSync:
+    def __init__(self, modules_dir, assets_dir, api_base, token, device_id, workers=DEFAULT_WORKERS,
+                 max_rate=0, windows=None, module_max_age=MODULE_MAX_AGE_HOURS * 3600):
+        self.modules_dir = modules_dir
+        self.assets_dir = assets_dir
+        self.api_base = api_base
+        self.token = token
+        self.device_id = device_id
+        self.workers = workers
+        self.max_rate = max_rate
+        self.windows = windows or []
+        self.module_max_age = module_max_age
+        self.loop_file = modules_dir / 'loop.json'
+        self.pool = ConnectionPool({
+            'Authorization': f'Bearer {token}',
+            'User-Agent': USER_AGENT,
+            'Accept': 'application/json, text/plain, */*',
+        })
+        self.staged = {}
+        self.stats = dict.fromkeys((
+            'entries', 'changed', 'reused', 'removed', 'modules', 'modules_downloaded', 'modules_unchanged',
+            'modules_failed', 'modules_removed', 'assets_removed', 'media_downloaded', 'media_failed',
+        ), 0)
+
+    # -- stored state --------------------------------------------------------
+
+    def load_stored(self):
+        """(stored loop document, its text, {fingerprint: entry})"""
+        try:
+            text = self.loop_file.read_text(encoding='utf-8')
+            document = json.loads(text)
+        except (OSError, ValueError):
+            return {}, '', {}
+        if not isinstance(document, dict):
+            return {}, '', {}
+        index = {}
+        for entries in entry_lists(document):
+            for entry in entries:
+                if isinstance(entry, dict) and entry.get(FINGERPRINT_KEY):
+                    index.setdefault(entry[FINGERPRINT_KEY], entry)
+        return document, text, index
+
+    def module_root(self, folder):
+        return self.staged.get(folder) or self.modules_dir / folder
+
+    def reusable(self, entry):
+        """A stored entry's module main file is still installed"""
+        if canonical_module_key(entry.get('module_key')) in VIRTUAL_MODULES:
+            return True
+        folder = str(entry.get('module_folder') or '').strip()
+        main_file = str(entry.get('module_main_file') or '').strip()
+        return bool(folder and main_file and (self.modules_dir / folder / main_file).is_file())
+
+    # -- modules -------------------------------------------------------------
+
+    def module_is_due(self, folder):
+        try:
+            metadata = json.loads((self.modules_dir / folder / METADATA_NAME).read_text(encoding='utf-8'))
+            checked = datetime.strptime(str(metadata.get('downloaded_at') or ''), TIME_FORMAT)
+        except (OSError, ValueError, AttributeError):
+            return True
+        return (datetime.now() - checked).total_seconds() > self.module_max_age
+
+    def fetch_module(self, module_key):
+        url = f"{self.api_base}/api/download_module.php"
+        body = urllib.parse.urlencode({'device_id': self.device_id, 'module_name': module_key})
+        last_error = None
+        for attempt in range(MODULE_ATTEMPTS):
+            if attempt:
+                time.sleep(MODULE_RETRY_DELAY)
+            try:
+                response = self.pool.request('POST', url, MODULE_TIMEOUT,
+                                             {'Content-Type': 'application/x-www-form-urlencoded'}, body)
+                payload = json.loads(response.read().decode('utf-8', errors='ignore'))
+            except Exception as exc:
+                self.pool.reset(url, exc)
+                last_error = exc
+                continue
+            if isinstance(payload, dict) and payload.get('success') is True:
+                return payload
+            last_error = ValueError(str((payload or {}).get('message') or 'download failed'))
+        raise last_error
+
+    @staticmethod
+    def decode_files(payload):
+        files = {}
+        for item in payload.get('files') or []:
+            rel = Path(str(item.get('path') or ''))
+            if not rel.parts or rel.is_absolute() or '..' in rel.parts:
+                raise ValueError(f"unsafe module file path: {item.get('path')}")
+            files[rel.as_posix()] = base64.b64decode(item.get('content') or '')
+        return files
+
+    @staticmethod
+    def same_files(folder, files):
+        if not folder.is_dir():
+            return False
+        existing = {path.relative_to(folder).as_posix(): path for path in folder.rglob('*') if path.is_file()}
+        existing.pop(METADATA_NAME, None)
+        if set(existing) != set(files):
+            return False
+        return all(existing[rel].stat().st_size == len(content) and existing[rel].read_bytes() == content
+                   for rel, content in files.items())
+
+    def stage_module(self, module_key, folder):
+        """Download a module; returns its staging folder, or None if the installed files are identical"""
+        payload = self.fetch_module(module_key)
+        files = self.decode_files(payload)
+        metadata = json.dumps({
+            'module_name': module_key,
+            'last_update': payload.get('last_update') or '',
+            'downloaded_at': datetime.now().strftime(TIME_FORMAT),
+            'files_count': len(files),
+        }, indent=4)
+
+        live = self.modules_dir / folder
+        if self.same_files(live, files):
+            write_atomic(live / METADATA_NAME, metadata)
+            return None
+
+        staging = self.modules_dir / f'{STAGING_PREFIX}{folder}'
+        shutil.rmtree(staging, ignore_errors=True)
+        for rel, content in files.items():
+            target = staging / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+        staging.mkdir(parents=True, exist_ok=True)
+        (staging / METADATA_NAME).write_text(metadata, encoding='utf-8')
+        return staging
+
+    def refresh_modules(self, modules, changed_keys):
+        due = [(key, folder) for key, folder in modules.items()
+               if key in changed_keys or self.module_is_due(folder)]
+
+        def stage(item):
+            key, folder = item
+            try:
+                return folder, self.stage_module(key, folder), None
+            except Exception as exc:
+                return folder, None, exc
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix='module') as executor:
+            for folder, staging, error in executor.map(stage, due):
+                if error is not None:
+                    self.stats['modules_failed'] += 1
+                    print(f'module {folder}: {error}', file=sys.stderr)
+                elif staging is None:
+                    self.stats['modules_unchanged'] += 1
+                else:
+                    self.staged[folder] = staging
+                    self.stats['modules_downloaded'] += 1
+
+    # -- entries -------------------------------------------------------------
+
+    def detect_main_file(self, module_key):
+        module_path = self.module_root(module_key)
+        if not module_key or not module_path.is_dir():
+            return ''
+        for candidate in ('live.html', 'index.html'):
+            if (module_path / candidate).is_file():
+                return candidate
+        for pattern in ('m_*.html', '*.html'):
+            names = sorted(path.name for path in module_path.glob(pattern) if path.is_file())
+            if names:
+                return names[0]
+        return ''
+
+    def normalize_entry(self, entry):
+        """Fill module_folder / module_main_file from the local files (see enrich_loop_runtime_metadata)"""
+        module_key = str(entry.get('module_key') or '').strip()
+        if not module_key:
+            return None
+        if module_key.lower() == 'turned-off':
+            entry['module_folder'] = str(entry.get('module_folder') or '').strip()
+            entry['module_main_file'] = str(entry.get('module_main_file') or '').strip()
+            return entry
+
+        module_folder = str(entry.get('module_folder') or '').strip() or module_key
+        entry['module_folder'] = module_folder
+        module_main_file = str(entry.get('module_main_file') or '').strip() or self.detect_main_file(module_key)
+        if not module_main_file:
+            return None
+        entry['module_main_file'] = module_main_file
+
+        if not (self.module_root(module_folder) / module_main_file).is_file():
+            detected = self.detect_main_file(module_key)
+            if not detected:
+                return None
+            entry['module_folder'] = module_key
+            entry['module_main_file'] = detected
+        return entry
+
+    def prefetch(self, document):
+        prefetcher = AssetPrefetcher(self.assets_dir, self.api_base, self.token, self.workers,
+                                     self.max_rate, self.windows)
+        try:
+            prefetcher.prefetch_media(document)
+            groups, _ = prefetcher.meal_groups(document)
+            prefetcher.prefetch_meals(groups)
+        finally:
+            prefetcher.close()
+        self.stats['media_downloaded'] = prefetcher.stats.downloaded
+        self.stats['media_failed'] = prefetcher.stats.failed
+
+    # -- switch and cleanup --------------------------------------------------
+
+    def clear_leftovers(self):
+        """Staging / trash folders of an interrupted earlier run"""
+        for path in self.modules_dir.glob('.*'):
+            if path.is_dir() and (path.name.startswith(STAGING_PREFIX) or path.name == TRASH_NAME):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def switch(self, loop_text):
+        """Move staged modules into place, then the new loop.json (renames only)"""
+        temp_path = self.loop_file.with_name(self.loop_file.name + '.tmp')
+        with temp_path.open('w', encoding='utf-8') as handle:
+            handle.write(loop_text)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        trash = self.modules_dir / TRASH_NAME
+        trash.mkdir(exist_ok=True)
+        for folder, staging in self.staged.items():
+            live = self.modules_dir / folder
+            if live.exists():
+                os.rename(live, trash / folder)
+            os.rename(staging, live)
+        os.replace(temp_path, self.loop_file)
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def remove_obsolete(self, modules, previous_refs, current_refs):
+        wanted = set(modules.values())
+        for path in self.modules_dir.iterdir():
+            if path.is_dir() and not path.name.startswith('.') and path.name not in wanted:
+                shutil.rmtree(path, ignore_errors=True)
+                self.stats['modules_removed'] += 1
+
+        for rel in previous_refs - current_refs:
+            path = self.assets_dir / rel
+            try:
+                path.unlink()
+                self.stats['assets_removed'] += 1
+            except OSError:
+                continue
+            if rel.startswith('meal-menu/'):
+                try:
+                    path.parent.rmdir()
+                except OSError:
+                    pass
+
+    # -- main ----------------------------------------------------------------
+
+    def run(self, payload):
+        self.modules_dir.mkdir(parents=True, exist_ok=True)
+        self.clear_leftovers()
+        document = build_document(payload)
+        stored, stored_text, index = self.load_stored()
+
+        changed = []
+        for entries in entry_lists(document):
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                self.stats['entries'] += 1
+                entry_fingerprint = fingerprint(entry)
+                previous = index.get(entry_fingerprint)
+                if previous is not None and self.reusable(previous):
+                    entry['module_folder'] = previous.get('module_folder')
+                    entry['module_main_file'] = previous.get('module_main_file')
+                    self.stats['reused'] += 1
+                else:
+                    changed.append(entry)
+                entry[FINGERPRINT_KEY] = entry_fingerprint
+        self.stats['changed'] = len(changed)
+
+        modules = required_modules(payload)
+        self.stats['modules'] = len(modules)
+        self.refresh_modules(modules, {canonical_module_key(entry.get('module_key')) for entry in changed})
+        self.prefetch(document)
+
+        # Changed entries, and entries of modules whose files were replaced, get their main file re-detected
+        changed_ids = {id(entry) for entry in changed}
+        for entries in entry_lists(document):
+            kept = []
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                if id(entry) in changed_ids or str(entry.get('module_folder') or '').strip() in self.staged:
+                    entry = self.normalize_entry(entry)
+                if entry is None:
+                    self.stats['removed'] += 1
+                    continue
+                kept.append(entry)
+            entries[:] = kept
+
+        offline_plan = document['offline_plan']
+        if not document.get('loop') and offline_plan.get('base_loop'):
+            document['loop'] = offline_plan['base_loop']
+
+        loop_text = json.dumps(document, ensure_ascii=False, indent=4)
+        content_changed = (bool(self.staged) or self.stats['media_downloaded'] > 0
+                           or without_volatile(document) != without_volatile(stored))
+        if self.staged or loop_text != stored_text:
+            self.switch(loop_text)
+        write_atomic(self.modules_dir / DOWNLOAD_INFO_NAME, json.dumps({
+            'last_download': datetime.now().strftime(TIME_FORMAT),
+            'loop_last_update': document['last_update'],
+            'sync_mode': 'delta',
+            'content_changed': content_changed,
+        }, indent=4))
+
+        previous_refs = set().union(*(local_asset_refs(entry) for entries in entry_lists(stored) for entry in entries))
+        current_refs = set().union(*(local_asset_refs(entry) for entries in entry_lists(document) for entry in entries))
+        self.remove_obsolete(modules, previous_refs, current_refs)
+        self.pool.close()
+        return content_changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply a kiosk loop payload as a delta to the local content')
+    parser.add_argument('payload_file', type=Path)
+    parser.add_argument('modules_dir', type=Path)
+    parser.add_argument('assets_dir', type=Path)
+    parser.add_argument('api_base')
+    parser.add_argument('token')
+    parser.add_argument('device_id')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Parallel module / asset downloads')
+    parser.add_argument('--max-rate-kib', type=float, default=0, help='Asset download rate cap in KiB/s (0 = unlimited)')
+    parser.add_argument('--window', type=parse_windows, default=[], help='Times of day when assets may be downloaded')
+    parser.add_argument('--module-max-age-hours', type=float, default=MODULE_MAX_AGE_HOURS,
+                        help='Re-check the files of unchanged modules after this many hours')
+    args = parser.parse_args(argv)
+
+    try:
+        payload = json.loads(args.payload_file.read_text(encoding='utf-8', errors='ignore'))
+    except (OSError, ValueError) as exc:
+        print(f'failed_to_parse_payload:{exc}')
+        return 1
+    if not isinstance(payload, dict) or payload.get('success') is not True:
+        print('payload_not_successful')
+        return 1
+
+    sync = DeltaSync(args.modules_dir, args.assets_dir, args.api_base.rstrip('/'), args.token, args.device_id,
+                     args.workers, args.max_rate_kib * 1024, args.window, args.module_max_age_hours * 3600)
+    content_changed = sync.run(payload)
+    print(' '.join(f'{key}={value}' for key, value in sync.stats.items()) + f' content_changed={int(content_changed)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
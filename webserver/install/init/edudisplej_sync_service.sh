@@ -466,6 +466,14 @@ force_full_loop_refresh() {
     log_success "✅ Forced full refresh download completed"
     update_config_field "last_update" "$(date '+%Y-%m-%d %H:%M:%S')"
 
+    # A delta sync that changed nothing on disk needs no kiosk restart
+    local download_info="${LOCAL_WEB_DIR}/modules/.download_info.json"
+    if command -v jq >/dev/null 2>&1 && [ -f "$download_info" ] \
+        && [ "$(jq -r 'if .content_changed == false then "false" else "true" end' "$download_info" 2>/dev/null)" = "false" ]; then
+        log "✓ Loop content unchanged after delta sync - kiosk restart skipped"
+        return 0
+    fi
+
     log "🔄 Restarting kiosk display service..."
     if systemctl restart edudisplej-kiosk.service 2>/dev/null; then
         log_success "✅ Kiosk display service restarted"